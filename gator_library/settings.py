@@ -21,6 +21,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.middleware.RequestProfilingMiddleware',
+    'library.middleware.ReplicaPinningMiddleware',
+    'library.middleware.ChangeFeedMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,8 +39,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parse each template once per process instead of on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -59,9 +68,20 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '3306',
-    }
+        # Keep connections open across requests, checked before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read replicas are added as further aliases, e.g.
+    # 'replica1': {..., 'HOST': 'replica1', 'TEST': {'MIRROR': 'default'}},
 }
 
+# Reads go to every alias other than 'default' until the request writes,
+# then to the primary for the rest of it and GATOR_DB_PIN_SECONDS after
+DATABASE_ROUTERS = ['library.routers.PrimaryReplicaRouter']
+GATOR_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+GATOR_DB_PIN_SECONDS = 5
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,4 +117,103 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 # Login URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'book_list'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Hold expiry and loan due dates
+GATOR_HOLD_SECONDS = 2 * 24 * 60 * 60
+GATOR_LOAN_SECONDS = 14 * 24 * 60 * 60
+GATOR_SCHEDULER_TICK_SECONDS = 60
+# Run the scheduler in a background thread of each web worker instead of
+# via `manage.py run_scheduler`, which needs GATOR_CHANGE_FEED
+GATOR_SCHEDULER_THREAD = False
+
+
+# Number of recently mutated tree paths re-validated after each write
+# (0 disables the sampled invariant checker)
+GATOR_INVARIANT_SAMPLE_PATHS = 8
+
+# Requests kept per view for the rolling latency percentiles
+GATOR_PROFILE_WINDOW = 1000
+
+# Split the catalog index into this many shards by book_id % GATOR_SHARDS,
+# each with its own lock, and load them with up to GATOR_SHARD_WORKERS
+# processes at startup
+GATOR_SHARDS = 1
+GATOR_SHARD_WORKERS = 4
+
+# Reservation queue per book: 'heap' (MinHeap) or 'bucket' (one FIFO per
+# priority level, O(1) insert and pop for the fixed 1-3 priorities)
+GATOR_RESERVATION_QUEUE = 'heap'
+
+# Nodes of recently looked-up books kept per tree (or shard) so find_node
+# skips the descent for popular titles, 0 disables the cache
+GATOR_NODE_CACHE_SIZE = 1024
+
+# Every branch has its own RB tree, built the first time one of its books
+# is used. Once the loaded trees take more than this many bytes, trees idle
+# for GATOR_BRANCH_IDLE_SECONDS are evicted; None keeps every tree loaded
+GATOR_BRANCH_MEMORY_BUDGET = None
+GATOR_BRANCH_IDLE_SECONDS = 60
+
+
+# Record book and reservation mutations in the change log so every worker
+# can apply the others' changes; workers poll at most every
+# GATOR_CHANGE_FEED_INTERVAL seconds
+GATOR_CHANGE_FEED = True
+GATOR_CHANGE_FEED_INTERVAL = 1.0
+GATOR_CHANGE_FEED_BATCH = 1000
+# How long a skipped change log id is re-checked in case its transaction
+# commits late
+GATOR_CHANGE_FEED_GAP_SECONDS = 30
+
+
+# Rendered list rows and detail blocks, keyed on Book.updated_at and the
+# tree's mutation version so edits never need explicit invalidation. The
+# {% cache %} tag uses the "template_fragments" alias when it exists
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gator-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+GATOR_FRAGMENT_CACHE_SECONDS = 600
+
+
+# Server-sent events at /book/<id>/events/ need an ASGI server; each
+# listener buffers at most GATOR_EVENT_QUEUE_SIZE events
+GATOR_EVENT_QUEUE_SIZE = 32
+GATOR_EVENT_HEARTBEAT_SECONDS = 15
+
+
+# Write-behind mode: borrow, reserve and return update the tree at once and
+# queue the Book row writes, coalesced per book and flushed with bulk_update
+# by background threads. The tree is then the authority for loans, so run a
+# single worker process in this mode
+GATOR_WRITE_BEHIND = False
+GATOR_WRITE_BEHIND_WORKERS = 2
+GATOR_WRITE_BEHIND_BATCH = 500
+GATOR_WRITE_BEHIND_INTERVAL = 0.05
+# When this many books are queued, 'block' waits up to
+# GATOR_WRITE_BEHIND_BLOCK_SECONDS for the flushers and 'caller_runs'
+# makes the request flush a batch itself
+GATOR_WRITE_BEHIND_MAX_PENDING = 10000
+GATOR_WRITE_BEHIND_POLICY = 'block'
+GATOR_WRITE_BEHIND_BLOCK_SECONDS = 5
+# Rows of a failing batch are retried on their own, and a row dropped (and
+# listed in /stats/sync/) once it has failed this many times
+GATOR_WRITE_BEHIND_MAX_ATTEMPTS = 5
+
+
+# Every successful borrow is kept in LoanHistory, grouped in
+# GATOR_LOAN_BUCKET_SECONDS buckets. The in-memory leaderboard covers the
+# last GATOR_POPULARITY_WINDOW_BUCKETS buckets, counting loans per book in a
+# count-min sketch of width x depth counters per bucket
+GATOR_LOAN_BUCKET_SECONDS = 24 * 60 * 60
+GATOR_POPULARITY_WINDOW_BUCKETS = 7
+GATOR_POPULARITY_TOP_K = 20
+GATOR_POPULARITY_SKETCH_WIDTH = 2048
+GATOR_POPULARITY_SKETCH_DEPTH = 4
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+Settings for running the load test harness offline on SQLite.
+
+    python manage.py loadtest --settings=gator_library.settings_loadtest --migrate
+"""
+
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = 'loadtest-only-not-secret'
+
+# django.test.Client sends requests as "testserver"
+ALLOWED_HOSTS = ['testserver', 'localhost']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'GATOR_LOADTEST_DB',
+            os.path.join(tempfile.gettempdir(), 'gator_library_loadtest.sqlite3')
+        ),
+        'OPTIONS': {
+            # Concurrent clients wait for the write lock instead of failing
+            'timeout': 30,
+        },
+        # A file rather than the shared-cache in-memory default, whose table
+        # locks fail at once instead of honouring the timeout, so the tests
+        # with concurrent threads run here
+        'TEST': {
+            'NAME': os.path.join(tempfile.gettempdir(), 'gator_library_loadtest_test.sqlite3'),
+        },
+    }
+}
+
+# The load test deletes every book before seeding; it only does that
+# unasked on databases that exist for it
+GATOR_LOADTEST_SCRATCH_DB = True
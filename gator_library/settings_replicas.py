@@ -0,0 +1,43 @@
+"""
+Settings emulating a primary and two read replicas with local SQLite files.
+
+The replicas are plain copies of the primary, refreshed every
+--replica-interval seconds by the load test or by sync_replicas:
+
+    python manage.py migrate --settings=gator_library.settings_replicas
+    python manage.py sync_replicas --settings=gator_library.settings_replicas --interval 1
+    python manage.py loadtest --settings=gator_library.settings_replicas --clients 4
+
+The test suite runs against the primary only.
+"""
+
+import os
+import sys
+import tempfile
+
+from .settings_loadtest import *  # noqa: F401,F403
+
+
+def _sqlite(name, **extra):
+    return dict({
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(
+            os.environ.get('GATOR_REPLICA_DIR', tempfile.gettempdir()),
+            f'gator_library_{name}.sqlite3'
+        ),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {'timeout': 30},
+    }, **extra)
+
+
+DATABASES = {
+    'default': _sqlite('primary'),
+    'replica1': _sqlite('replica1', TEST={'MIRROR': 'default'}),
+    'replica2': _sqlite('replica2', TEST={'MIRROR': 'default'}),
+}
+GATOR_DB_REPLICAS = ['replica1', 'replica2']
+
+if sys.argv[1:2] == ['test']:
+    # Test mirrors are separate connections that cannot see a TestCase's
+    # uncommitted rows; the router tests configure replicas themselves
+    GATOR_DB_REPLICAS = []
@@ -0,0 +1,30 @@
+"""gunicorn settings that build the library's trees once and share them with every worker.
+
+    gunicorn -c gunicorn.conf.py gator_library.wsgi
+
+The app, and with it the manager's trees, is loaded in the master. Forked
+workers share those pages copy-on-write; see GatorLibraryManager.prepare_fork
+and after_fork.
+"""
+import gc
+import os
+
+# Nothing allocated while the app loads is collected before the freeze,
+# collections would only dirty pages that are about to be shared
+gc.disable()
+
+bind = os.environ.get('GATOR_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GATOR_WORKERS', 4))
+preload_app = True
+
+
+def when_ready(server):
+    from library.managers import gator_library
+    gator_library.prepare_fork()
+    # The master's heap is frozen now, collections no longer touch it
+    gc.enable()
+
+
+def post_fork(server, worker):
+    from library.managers import gator_library
+    gator_library.after_fork()
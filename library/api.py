@@ -0,0 +1,149 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .managers import gator_library
+
+# Upper bound on books returned by one list request
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+
+
+def _book_data(node):
+    return {
+        'book_id': node.book_id,
+        'title': node.title,
+        'author': node.author,
+        'availability_status': node.availability_status,
+        'borrowed_by': node.borrowed_by,
+        'on_hold': node.on_hold,
+        'reservations': node.reservation_heap.get_size(),
+        'version': node.version,
+    }
+
+
+def _get_node(book_id):
+    node = gator_library.rb_tree.find_node(book_id)
+    if node is None:
+        raise Http404("Book not found")
+    return node
+
+
+# The read-only endpoints check the ETag before login_required, so a 304 is
+# answered from the tree without loading the session or the user. A matching
+# ETag only comes from an earlier authenticated response and carries no data.
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag for whole-catalog resources, from the global tree version"""
+    tree = gator_library.rb_tree
+    return f"{tree.epoch}-{tree.version}"
+
+
+def book_etag(request, book_id, *args, **kwargs):
+    """Strong ETag for a single book, from the node's version"""
+    tree = gator_library.rb_tree
+    node = tree.find_node(book_id)
+    if node is None:
+        return None
+    return f"{tree.epoch}-{book_id}-{node.version}"
+
+
+def availability_etag(request, book_id):
+    etag = book_etag(request, book_id)
+    return f"{etag}-availability" if etag else None
+
+
+def reservations_etag(request, book_id):
+    etag = book_etag(request, book_id)
+    return f"{etag}-reservations" if etag else None
+
+
+def _page_params(request):
+    try:
+        min_id = int(request.GET['min_id']) if request.GET.get('min_id') else None
+        max_id = int(request.GET['max_id']) if request.GET.get('max_id') else None
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None
+    return min_id, max_id, max(1, min(limit, MAX_PAGE_SIZE))
+
+
+@require_GET
+@condition(etag_func=catalog_etag)
+@login_required
+def book_list(request):
+    """List books in ID order, paginated by min_id/max_id/limit"""
+    params = _page_params(request)
+    if params is None:
+        return JsonResponse({'error': 'min_id, max_id and limit must be integers'}, status=400)
+    min_id, max_id, limit = params
+
+    # One more than the page tells whether there is a next one
+    books = next(gator_library.iter_book_chunks(min_id, max_id, limit + 1, _book_data), [])
+    next_min_id = books.pop()['book_id'] if len(books) > limit else None
+
+    return JsonResponse({
+        'version': gator_library.rb_tree.version,
+        'books': books,
+        'next_min_id': next_min_id,
+    })
+
+
+@require_GET
+@condition(etag_func=book_etag)
+@login_required
+def book_detail(request, book_id):
+    return JsonResponse(_book_data(_get_node(book_id)))
+
+
+@require_GET
+@condition(etag_func=availability_etag)
+@login_required
+def book_availability(request, book_id):
+    node = _get_node(book_id)
+    return JsonResponse({
+        'book_id': node.book_id,
+        'availability_status': node.availability_status,
+        'on_hold': node.on_hold,
+        'version': node.version,
+    })
+
+
+@require_GET
+@condition(etag_func=reservations_etag)
+@login_required
+def book_reservations(request, book_id):
+    """Reservation queue in allocation order"""
+    node = _get_node(book_id)
+    return JsonResponse({
+        'book_id': node.book_id,
+        'version': node.version,
+        'reservations': [
+            {
+                'position': position,
+                'patron_id': entry.patron_id,
+                'priority': entry.priority_number,
+                'reserved_at': entry.time_of_reservation,
+            }
+            for position, entry in enumerate(node.reservation_heap.iter_ordered(), 1)
+        ],
+    })
+
+
+@login_required
+@require_GET
+def popular_books(request):
+    """Most borrowed books of the popularity window, loan counts are estimates that never undercount"""
+    limit = gator_library.popularity.k
+    try:
+        k = max(1, min(int(request.GET.get('k', limit)), limit))
+    except ValueError:
+        return JsonResponse({'error': 'k must be an integer'}, status=400)
+    tracker = gator_library.popularity
+    return JsonResponse({
+        'window_seconds': tracker.window_buckets * tracker.bucket_seconds,
+        'books': [
+            dict(_book_data(node), loans=loans)
+            for node, loans in gator_library.popular_books(k)
+        ],
+    })
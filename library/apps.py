@@ -8,4 +8,9 @@ class LibraryConfig(AppConfig):
         try:
             import library.signals
         except ImportError:
-            pass
\ No newline at end of file
+            pass
+
+        from django.conf import settings
+        if getattr(settings, 'GATOR_SCHEDULER_THREAD', False):
+            from .managers import gator_library
+            gator_library.scheduler.start()
\ No newline at end of file
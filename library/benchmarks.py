@@ -0,0 +1,292 @@
+import contextlib
+import os
+import random
+import time
+
+from .data_structures.bucket_queue import BucketQueue
+from .data_structures.min_heap import HEAP_SIZE, MinHeap
+from .data_structures.rb_tree import GatorLibrary
+
+# name -> function(rounds, seed) returning a list of result rows
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def best_of(func, repeat=3):
+    """Fastest of `repeat` runs of func() in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@benchmark('queues')
+def reservation_queues(rounds=2000, seed=0):
+    """Fill a reservation queue to capacity, read the top entries, then drain it"""
+    rng = random.Random(seed)
+    workload = [
+        [(patron_id, rng.choice((1, 2, 3)), float(offset)) for offset, patron_id in enumerate(rng.sample(range(1000), HEAP_SIZE))]
+        for _ in range(rounds)
+    ]
+
+    rows = []
+    for queue_class in (MinHeap, BucketQueue):
+        def insert_all():
+            queues = []
+            for reservations in workload:
+                queue = queue_class()
+                for patron_id, priority, reserved_at in reservations:
+                    queue.insert(patron_id, priority, reserved_at)
+                queues.append(queue)
+            return queues
+
+        queues = insert_all()
+        insert = best_of(insert_all)
+        peek = best_of(lambda: [queue.peek(5) for queue in queues])
+        position = best_of(lambda: [queue.position_of(reservations[-1][0]) for queue, reservations in zip(queues, workload)])
+
+        def drain():
+            for queue in insert_all():
+                while queue.delete():
+                    pass
+        # Draining needs fresh queues, subtract the cost of filling them
+        pop = max(0.0, best_of(drain) - insert)
+
+        ops = rounds * HEAP_SIZE
+        rows.append({
+            'name': queue_class.__name__,
+            'insert_ns': insert / ops * 1e9,
+            'pop_ns': pop / ops * 1e9,
+            'peek5_ns': peek / rounds * 1e9,
+            'position_ns': position / rounds * 1e9,
+        })
+    return rows
+
+
+@benchmark('templates')
+def list_rendering(rounds=10000, seed=0):
+    """Render a book list of `rounds` rows without fragment caching, cold, warm and after one edit"""
+    from functools import partial
+
+    from django.contrib.auth.models import User
+    from django.core.cache import caches
+    from django.template.loader import render_to_string
+    from django.utils import timezone
+
+    from .data_structures.rb_tree import GatorLibrary
+    from .models import Book
+    from .views import catalog_rows
+
+    rng = random.Random(seed)
+    patrons = [User(id=patron_id, username=f"patron{patron_id}") for patron_id in range(1, 51)]
+    staff = User(id=0, username="staff", is_staff=True)
+    now = timezone.now()
+    books = []
+    for book_id in range(1, rounds + 1):
+        book = Book(book_id=book_id, title=f"Book {book_id}", author=f"Author {book_id % 97}", updated_at=now)
+        if rng.random() < 0.3:
+            book.availability_status = "No"
+            book.borrowed_by = rng.choice(patrons)
+        books.append(book)
+    tree = GatorLibrary()
+    tree.bulk_load([
+        (book.book_id, book.title, book.author, book.availability_status, book.borrowed_by_id, False)
+        for book in books
+    ])
+    fragments = caches['template_fragments']
+
+    def render(timeout):
+        return render_to_string('library/book_list.html', {
+            'rows': partial(catalog_rows, books, tree),
+            'catalog_version': f"{tree.epoch}-{tree.version}",
+            'fragment_timeout': timeout,
+            'my_loans': [],
+            'user': staff,
+        })
+
+    def edit_and_render():
+        # One book changes, so the page is re-assembled from cached rows
+        tree.mark_modified(tree.find_node(rng.randint(1, rounds)))
+        start = time.perf_counter()
+        render(600)
+        return time.perf_counter() - start
+
+    fragments.clear()
+    off = best_of(lambda: render(0))
+    fragments.clear()
+    start = time.perf_counter()
+    render(600)
+    cold = time.perf_counter() - start
+    warm = best_of(lambda: render(600))
+    one_edit = min(edit_and_render() for _ in range(3))
+    fragments.clear()
+
+    return [
+        {'name': name, 'rows': rounds, 'render_ms': seconds * 1e3}
+        for name, seconds in (('no_cache', off), ('cold', cold), ('warm', warm), ('one_edit', one_edit))
+    ]
+
+
+class DescendingLibrary(GatorLibrary):
+    """GatorLibrary with every insert descending from the root, for comparison"""
+    append_fast_path = False
+
+
+@benchmark('inserts')
+def tree_inserts(rounds=100000, seed=0):
+    """Insert `rounds` books in increasing (AutoField) and in random id order"""
+    rng = random.Random(seed)
+    orders = {'sequential': list(range(1, rounds + 1))}
+    orders['random'] = rng.sample(orders['sequential'], rounds)
+
+    rows = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for order, ids in orders.items():
+            for tree_class in (GatorLibrary, DescendingLibrary):
+                trees = []
+
+                def insert_all():
+                    tree = tree_class()
+                    for book_id in ids:
+                        tree.insert_book(book_id, "Title", "Author")
+                    trees.append(tree)
+
+                seconds = best_of(insert_all)
+                tree = trees[-1]
+                rows.append({
+                    'name': f"{order}/{'append' if tree_class.append_fast_path else 'descend'}",
+                    'insert_ns': seconds / rounds * 1e9,
+                    'appends': tree.appends,
+                    'color_flips': tree.color_flip_count,
+                    'min_max_ns': best_of(lambda: [(tree.min(), tree.max()) for _ in range(rounds)]) / rounds * 1e9,
+                })
+    return rows
+
+
+@benchmark('node_cache')
+def node_cache(rounds=200000, seed=0):
+    """find_node over Zipfian book popularity with node caches of several sizes"""
+    from .workload import ZipfSampler
+
+    books = 100000
+    rng = random.Random(seed)
+    # Popularity ranks are scattered over the catalog rather than clustered
+    ids = rng.sample(range(1, books + 1), books)
+    rows = []
+    for s in (0.8, 1.1):
+        sampler = ZipfSampler(books, s, rng)
+        lookups = [ids[sampler.sample(books)] for _ in range(rounds)]
+        for cache_size in (0, 256, 1024, 4096):
+            tree = GatorLibrary(cache_size=cache_size)
+            tree.bulk_load([(book_id, "Title", "Author", "Yes", None, False) for book_id in range(1, books + 1)])
+            find = tree.find_node
+            seconds = best_of(lambda: [find(book_id) for book_id in lookups])
+            stats = tree.node_cache_stats()
+            rows.append({
+                'name': f"zipf{s}/cache{cache_size}",
+                'find_ns': seconds / rounds * 1e9,
+                'hit_rate': stats['hit_rate'] * 100,
+            })
+    return rows
+
+@benchmark('branches')
+def branch_restore(rounds=25000, seed=0):
+    """Evict and restore branches of `rounds` books, rebuilt by bulk load or by inserts"""
+    from .data_structures.branched import BranchedLibrary
+
+    rng = random.Random(seed)
+    branches = [f"branch{i}" for i in range(8)]
+    # Branches interleave in id space, as AutoField ids do
+    catalog = {branch: [] for branch in branches}
+    for book_id in range(1, rounds * len(branches) + 1):
+        catalog[rng.choice(branches)].append((book_id, "Title", "Author", "Yes", None, False))
+    directory = {row[0]: branch for branch, rows in catalog.items() for row in rows}
+
+    def bulk(branch):
+        tree = GatorLibrary()
+        tree.bulk_load(catalog[branch])
+        return tree
+
+    def inserted(branch):
+        tree = GatorLibrary()
+        for book_id, title, author, *_ in catalog[branch]:
+            tree.insert_book(book_id, title, author)
+        return tree
+
+    rows = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        size = bulk(branches[0]).memory_usage()['total']
+        for name, load in (('bulk_load', bulk), ('inserts', inserted)):
+            # Room for two branches, every access round-robin misses
+            library = BranchedLibrary(load, directory, memory_budget=size * 2, min_idle_seconds=0)
+            targets = [rng.choice(catalog[branch])[0] for branch in branches * 4]
+            seconds = best_of(lambda: [library.find_node(book_id) for book_id in targets], repeat=1)
+            rows.append({
+                'name': name,
+                'restore_ms': library.load_seconds / library.loads * 1000,
+                'loads': library.loads,
+                'evictions': library.evictions,
+                'loaded': len(library.trees),
+                'access_ms': seconds / len(targets) * 1000,
+            })
+    return rows
+
+
+@benchmark('fork')
+def fork_sharing(rounds=200000, seed=0):
+    """Unique memory a forked child adds after reads and writes on a tree of `rounds` books"""
+    import gc
+    import json
+    from .data_structures.overlay import OverlayLibrary
+    from .preload import memory_footprint
+
+    if not hasattr(os, 'fork') or memory_footprint() is None:
+        return []
+    rng = random.Random(seed)
+    reads = [rng.randint(1, rounds) for _ in range(rounds // 4)]
+    writes = [rng.randint(1, rounds) for _ in range(rounds // 100)]
+
+    rows = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, freeze, overlay in (('plain', False, False), ('freeze', True, False), ('freeze+overlay', True, True)):
+            tree = GatorLibrary()
+            tree.bulk_load([(book_id, f"Title {book_id}", "Author", "Yes", None, False) for book_id in range(1, rounds + 1)])
+            gc.collect()
+            if freeze:
+                gc.freeze()
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                before = memory_footprint()
+                library = OverlayLibrary(tree) if overlay else tree
+                for book_id in reads:
+                    library.find_node(book_id)
+                for patron_id, book_id in enumerate(writes, 1):
+                    library.borrow_book(patron_id, book_id)
+                gc.collect()
+                after = memory_footprint()
+                os.write(write_end, json.dumps([before, after]).encode())
+                os._exit(0)
+            os.close(write_end)
+            with os.fdopen(read_end, 'rb') as pipe:
+                before, after = json.loads(pipe.read())
+            os.waitpid(pid, 0)
+            gc.unfreeze()
+            rows.append({
+                'name': name,
+                'unique_mb': (after['unique'] - before['unique']) / 2 ** 20,
+                'shared_mb': after['shared'] / 2 ** 20,
+                'rss_mb': after['rss'] / 2 ** 20,
+            })
+            del tree
+            gc.collect()
+    return rows
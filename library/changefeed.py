@@ -0,0 +1,296 @@
+import contextlib
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .profiling import profiled
+from .routers import use_primary
+
+
+def _pointer(node):
+    # NIL sentinels have no book_id, whichever shard they belong to
+    return node.book_id
+
+
+def apply_book_changes(tree, book_ids, using='default', persist_pointers=True, lock=None):
+    """Bring the tree in line with the committed Book rows, returns the rows by book_id.
+
+    The rows are read first, the tree is only changed while holding lock
+    (the manager's tree_lock, see GatorLibraryManager.apply_changes).
+    """
+    from .models import Book
+    rows = {
+        row['book_id']: row
+        for row in Book.objects.using(using).filter(pk__in=book_ids).values(
+            'book_id', 'title', 'author', 'branch', 'availability_status', 'borrowed_by_id', 'hold_expires_at', 'due_at'
+        )
+    }
+    print(f"DEBUG: Applying {len(book_ids)} coalesced book changes to RB tree")
+
+    changed = []
+    nodes = {}
+    with lock or contextlib.nullcontext():
+        for book_id in sorted(book_ids):
+            row = rows.get(book_id)
+            node = tree.writable_node(book_id)
+            if row is None:
+                if node:
+                    print(f"DEBUG: Deleting book {book_id}")
+                    tree.delete_book(book_id)
+                continue
+
+            if node is None:
+                node = tree.insert_book(
+                    book_id,
+                    row['title'],
+                    row['author'],
+                    row['availability_status'],
+                    branch=row['branch']
+                )
+            else:
+                if tree.branch_of(book_id) != row['branch']:
+                    print(f"DEBUG: Moving book {book_id} to branch {row['branch']!r}")
+                    node = tree.move_book(book_id, row['branch'])
+                node.title = row['title']
+                node.author = row['author']
+            # Goes through the tree so its availability counts stay current
+            tree.sync_status(
+                node,
+                row['availability_status'],
+                row['borrowed_by_id'],
+                row['hold_expires_at'] is not None
+            )
+            changed.append(node)
+
+        if not persist_pointers:
+            return rows
+        # Pointers are read while the tree cannot rotate under us
+        for node in changed:
+            nodes[node.book_id] = node
+            if node.parent.book_id is not None:
+                nodes[node.parent.book_id] = node.parent
+        pointers = {
+            book_id: (_pointer(node.parent), _pointer(node.left), _pointer(node.right))
+            for book_id, node in nodes.items()
+        }
+
+    # Persist pointers of the changed nodes and their parents in one query
+    if nodes:
+        Book.objects.using(using).bulk_update(
+            [
+                Book(book_id=book_id, parent_id=parent_id, left_id=left_id, right_id=right_id)
+                for book_id, (parent_id, left_id, right_id) in pointers.items()
+            ],
+            ['parent_id', 'left_id', 'right_id']
+        )
+    return rows
+
+
+def apply_reservations(tree, reservation_ids, using='default', lock=None):
+    """Push committed reservations into their books' heaps, holding lock while doing so"""
+    from .models import Reservation
+    rows = list(Reservation.objects.using(using).filter(pk__in=reservation_ids, is_active=True).values(
+        'id', 'book_id', 'patron_id', 'priority', 'reservation_time'
+    ).order_by('reservation_time'))
+
+    rejected = []
+    with lock or contextlib.nullcontext():
+        for row in rows:
+            node = tree.writable_node(row['book_id'])
+            if not node:
+                continue
+            success = node.reservation_heap.insert(
+                row['patron_id'],
+                row['priority'],
+                row['reservation_time'].timestamp()
+            )
+            if success:
+                tree.mark_modified(node)
+            else:
+                rejected.append(row['id'])
+
+    # Reservation lists that are full reject the newcomers
+    if rejected:
+        Reservation.objects.using(using).filter(pk__in=rejected).update(is_active=False)
+
+
+def feed_enabled():
+    return getattr(settings, 'GATOR_CHANGE_FEED', False)
+
+
+def log_change(kind, object_id, origin, using='default', **fields):
+    """Record a mutation in the change log, inside the caller's transaction"""
+    from .models import ChangeLogEntry
+    if feed_enabled():
+        ChangeLogEntry.objects.using(using).create(kind=kind, object_id=object_id, origin=origin, **fields)
+
+
+class ChangeFeed:
+    """Tails the change log and applies other workers' mutations to a manager's tree.
+
+    Entry ids are allocated when a transaction inserts them, so a slow
+    transaction can commit an id below one already seen. Skipped ids are
+    remembered as gaps and re-queried for GATOR_CHANGE_FEED_GAP_SECONDS.
+    """
+    def __init__(self, manager, clock=time.time):
+        self.manager = manager
+        self.clock = clock
+        self.interval = getattr(settings, 'GATOR_CHANGE_FEED_INTERVAL', 1.0)
+        self.batch_size = getattr(settings, 'GATOR_CHANGE_FEED_BATCH', 1000)
+        self.gap_seconds = getattr(settings, 'GATOR_CHANGE_FEED_GAP_SECONDS', 30)
+        self._lock = threading.Lock()
+        self.version = 0
+        self.gaps = {}  # missing entry id -> time first noticed
+        self.last_poll = None
+        self.applied = 0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.caught_up = True
+
+    def prime(self):
+        """Start from the newest entry, called before the tree is loaded from the table"""
+        from django.db import DatabaseError
+        from django.db.models import Max
+        from .models import ChangeLogEntry
+        with self._lock:
+            try:
+                self.version = ChangeLogEntry.objects.aggregate(version=Max('id'))['version'] or 0
+            except DatabaseError:
+                self.version = 0
+            self.gaps = {}
+            self.last_poll = self.clock()
+
+    def maybe_poll(self):
+        """Poll if GATOR_CHANGE_FEED_INTERVAL has passed since the last poll"""
+        if not feed_enabled():
+            return 0
+        if self.last_poll is not None and self.clock() - self.last_poll < self.interval:
+            return 0
+        return self.poll()
+
+    @profiled('signals')
+    @use_primary()
+    def poll(self):
+        """Apply entries newer than the last seen version, returns how many were applied"""
+        from django.db.models import Q
+        from .models import ChangeLogEntry
+        if not self._lock.acquire(blocking=False):
+            # Another thread of this worker is already polling
+            return 0
+        try:
+            now = self.clock()
+            self.last_poll = now
+            self.gaps = {pk: seen for pk, seen in self.gaps.items() if now - seen < self.gap_seconds}
+            query = Q(pk__gt=self.version)
+            if self.gaps:
+                query |= Q(pk__in=list(self.gaps))
+            entries = list(ChangeLogEntry.objects.filter(query).order_by('pk')[:self.batch_size])
+            self.caught_up = len(entries) < self.batch_size
+
+            for entry in entries:
+                self.gaps.pop(entry.pk, None)
+                if entry.pk > self.version:
+                    # Large jumps come from discarded id ranges, not open transactions
+                    if entry.pk - self.version <= self.batch_size:
+                        self.gaps.update((pk, now) for pk in range(self.version + 1, entry.pk))
+                    self.version = entry.pk
+
+            foreign = [entry for entry in entries if entry.origin != self.manager.origin]
+            if foreign:
+                self._apply(foreign)
+                self.applied += len(foreign)
+            if entries:
+                self.lag_seconds = max(0.0, (timezone.now() - entries[-1].created_at).total_seconds())
+                self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+            else:
+                self.lag_seconds = 0.0
+            return len(foreign)
+        finally:
+            self._lock.release()
+
+    def _apply(self, entries):
+        from .models import ChangeLogEntry
+        tree = self.manager.rb_tree
+        # Rows are re-read in their committed state first, so the queue
+        # operations below find every book that still exists
+        rereads = (ChangeLogEntry.BOOK, ChangeLogEntry.LOAN, ChangeLogEntry.RELEASE)
+        book_ids = {entry.object_id for entry in entries if entry.kind in rereads}
+        rows = {}
+        if book_ids:
+            # The worker that made the change already stored its tree pointers
+            rows = apply_book_changes(tree, book_ids, persist_pointers=False, lock=self.manager.tree_lock)
+            for book_id in book_ids:
+                row = rows.get(book_id)
+                self.manager.scheduler.clear(book_id)
+                if row is not None:
+                    self.manager._register_deadlines(
+                        book_id,
+                        row['hold_expires_at'].timestamp() if row['hold_expires_at'] else None,
+                        row['due_at'].timestamp() if row['due_at'] else None
+                    )
+
+        reservation_ids = []
+        for entry in entries:
+            if entry.kind == ChangeLogEntry.RESERVATION:
+                reservation_ids.append(entry.object_id)
+                continue
+            if entry.kind == ChangeLogEntry.LOAN:
+                # Other workers' loans count towards this worker's leaderboard too
+                self.manager.popularity.record(entry.object_id, entry.created_at.timestamp())
+            if entry.kind not in (ChangeLogEntry.RESERVE, ChangeLogEntry.RELEASE):
+                continue
+            with self.manager.tree_lock:
+                self._replay_queue_operation(tree, entry)
+        if reservation_ids:
+            apply_reservations(tree, reservation_ids, lock=self.manager.tree_lock)
+        self._publish(entries, rows)
+
+    @staticmethod
+    def _replay_queue_operation(tree, entry):
+        from .models import ChangeLogEntry
+        node = tree.writable_node(entry.object_id)
+        if node is None:
+            return
+        if entry.kind == ChangeLogEntry.RESERVE:
+            if node.reservation_heap.insert(entry.patron_id, entry.priority, entry.reserved_at):
+                tree.mark_modified(node)
+        elif entry.kind == ChangeLogEntry.RELEASE:
+            head = node.reservation_heap.peek(1)
+            if head and head[0].patron_id == entry.patron_id:
+                node.reservation_heap.delete()
+                tree.mark_modified(node)
+            else:
+                print(f"DEBUG: Reservation queue of book {node.book_id} diverged, expected patron {entry.patron_id} first")
+
+    def _publish(self, entries, rows):
+        """Tell this worker's event subscribers about the other workers' changes"""
+        from .models import ChangeLogEntry
+        for entry in entries:
+            if entry.kind == ChangeLogEntry.RESERVATION:
+                continue
+            node = self.manager.rb_tree.find_node(entry.object_id)
+            if node is None:
+                self.manager.events.publish(entry.object_id, 'deleted')
+            elif entry.kind == ChangeLogEntry.RESERVE:
+                self.manager.publish(node, 'queue')
+            elif entry.kind == ChangeLogEntry.RELEASE and rows[entry.object_id]['hold_expires_at']:
+                self.manager.publish(
+                    node, 'allocated',
+                    patron_id=entry.patron_id,
+                    hold_expires_at=rows[entry.object_id]['hold_expires_at'].timestamp()
+                )
+            else:
+                self.manager.publish(node, 'availability')
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'applied': self.applied,
+            'lag_seconds': self.lag_seconds,
+            'max_lag_seconds': self.max_lag_seconds,
+            'caught_up': self.caught_up,
+            'gaps': len(self.gaps),
+            'seconds_since_poll': self.clock() - self.last_poll if self.last_poll is not None else None,
+        }
@@ -1,2 +1,8 @@
 from .rb_tree import GatorLibrary
-from .min_heap import MinHeap, HeapNode
\ No newline at end of file
+from .min_heap import MinHeap, HeapNode
+from .bucket_queue import BucketQueue
+from .sharded import ShardedLibrary
+from .branched import BranchedLibrary
+from .timing_wheel import TimingWheel
+from .popularity import CountMinSketch, PopularityTracker, TopK
+from .overlay import OverlayLibrary
\ No newline at end of file
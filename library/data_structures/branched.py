@@ -0,0 +1,528 @@
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+
+def _closest(candidates, target_id):
+    candidates = [node for node in candidates if node is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda node: (abs(node.book_id - target_id), node.book_id))
+
+
+class BranchedLibrary:
+    """One GatorLibrary (or ShardedLibrary) per library branch.
+
+    A directory maps every book_id to its branch, so operations on a book
+    go straight to its branch's tree. Trees are built by load(branch) the
+    first time one of their books is touched. When the loaded trees exceed
+    memory_budget bytes, trees not used for min_idle_seconds are evicted,
+    least recently used first; the next access rebuilds them with the
+    same O(n) bulk load.
+
+    Reservation queues only live in memory, so eviction parks every
+    non-empty queue and hands it back to the rebuilt node. Each evicted
+    branch also keeps its availability counts and smallest and largest
+    book_id, which stay exact because any change to one of its books loads
+    the branch again first. Searches across branches use them, and the
+    directory, to restore only the branches that can hold the answer.
+
+    busy(branch), when given, keeps a branch loaded while it returns True,
+    for state that a reload from the database would not see yet.
+    """
+    def __init__(self, load, directory=None, summaries=None, default_branch='main',
+                 memory_budget=None, min_idle_seconds=60, clock=time.monotonic, busy=None):
+        self.load = load
+        self.busy = busy
+        self.directory = dict(directory or {})  # book_id -> branch
+        # Availability counts and min_id/max_id of branches that are not loaded
+        self.summaries = dict(summaries or {})
+        self.default_branch = default_branch
+        self.memory_budget = memory_budget
+        self.min_idle_seconds = min_idle_seconds
+        self.clock = clock
+        self.trees = {}
+        self.last_used = {}
+        # Measured on the first non-empty tree, memory_usage() is O(n)
+        self.bytes_per_book = None
+        self.parked = {}  # branch -> {book_id: reservation queue}
+        # Branches shared with the master after fork, never evicted
+        self.pinned = set()
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        # Versions and flips of evicted trees, so both only move forward
+        self.retired_version = 0
+        self.retired_flips = 0
+        self._epoch = uuid.uuid4().hex[:8]
+
+    @property
+    def epoch(self):
+        # Rebuilt trees restart their node versions
+        return f"{self._epoch}.{self.loads}"
+
+    @property
+    def version(self):
+        return self.retired_version + self.loads + sum(tree.version for tree in list(self.trees.values()))
+
+    def branches(self):
+        """Every known branch, loaded or not"""
+        return sorted(set(self.directory.values()) | set(self.trees) | set(self.summaries))
+
+    def branch_of(self, book_id):
+        return self.directory.get(book_id)
+
+    def is_loaded(self, branch):
+        return branch in self.trees
+
+    def tree(self, branch):
+        """The tree of a branch, loaded first if it is not in memory"""
+        tree = self.trees.get(branch)
+        if tree is None:
+            tree = self._restore(branch)
+        self.last_used[branch] = self.clock()
+        return tree
+
+    def _restore(self, branch):
+        with self._lock:
+            tree = self.trees.get(branch)
+            if tree is not None:
+                return tree
+            started = time.perf_counter()
+            tree = self.load(branch)
+            for book_id, queue in self.parked.pop(branch, {}).items():
+                node = tree.find_node(book_id)
+                if node is not None:
+                    node.reservation_heap = queue
+                    tree.mark_modified(node)
+            self.load_seconds += time.perf_counter() - started
+            self.summaries.pop(branch, None)
+            self.trees[branch] = tree
+            self.last_used[branch] = self.clock()
+            self.loads += 1
+            print(f"DEBUG: Loaded branch {branch!r} in {(time.perf_counter() - started) * 1000:.1f}ms")
+            if self.memory_budget is not None:
+                books = tree.availability_stats()['books']
+                if self.bytes_per_book is None and books:
+                    self.bytes_per_book = tree.memory_usage()['total'] / books
+                self.evict_idle(keep=branch)
+            return tree
+
+    def estimated_bytes(self, branch):
+        """Approximate memory of a loaded tree from its book count"""
+        return int((self.bytes_per_book or 0) * self.trees[branch].availability_stats()['books'])
+
+    def evict_idle(self, keep=None):
+        """Evict idle trees, least recently used first, until the loaded trees fit the budget"""
+        if self.memory_budget is None:
+            return []
+        with self._lock:
+            total = sum(self.estimated_bytes(branch) for branch in self.trees)
+            evicted = []
+            now = self.clock()
+            for branch in sorted(self.trees, key=lambda branch: self.last_used.get(branch, 0)):
+                if total <= self.memory_budget:
+                    break
+                if branch == keep or branch in self.pinned or now - self.last_used.get(branch, 0) < self.min_idle_seconds:
+                    continue
+                size = self.estimated_bytes(branch)
+                if not self.evict(branch):
+                    continue
+                total -= size
+                evicted.append(branch)
+            return evicted
+
+    def evict(self, branch):
+        """Drop a branch's tree, keeping its reservation queues and availability counts.
+
+        Returns False if the branch is not loaded or busy.
+        """
+        with self._lock:
+            if branch not in self.trees or (self.busy is not None and self.busy(branch)):
+                return False
+            tree = self.trees.pop(branch)
+            parked = {
+                node.book_id: node.reservation_heap
+                for node in tree.iter_inorder() if node.reservation_heap.get_size()
+            }
+            if parked:
+                self.parked[branch] = parked
+            self.summaries[branch] = self._summary(tree)
+            self.retired_version += tree.version
+            self.retired_flips += tree.get_color_flip_count()
+            self.evictions += 1
+            print(f"DEBUG: Evicted branch {branch!r}, parked {len(parked)} reservation queues")
+            return True
+
+    @staticmethod
+    def _summary(tree):
+        summary = tree.availability_stats()
+        low, high = tree.min(), tree.max()
+        summary['min_id'] = low.book_id if low is not None else None
+        summary['max_id'] = high.book_id if high is not None else None
+        return summary
+
+    def share(self, delta):
+        """Put an OverlayLibrary with a delta() tree over every loaded tree, after fork.
+
+        The loaded trees become the shared base and are pinned, since
+        dropping them would write the reference count of every node.
+        Branches loaded later are the worker's own and stay plain.
+        """
+        from .overlay import OverlayLibrary
+        with self._lock:
+            for branch, tree in list(self.trees.items()):
+                self.trees[branch] = OverlayLibrary(tree, delta())
+                self.pinned.add(branch)
+
+    def _tree_of(self, book_id):
+        branch = self.directory.get(book_id)
+        if branch is None:
+            return None
+        return self.tree(branch)
+
+    def _selected(self, branches):
+        return self.branches() if branches is None else branches
+
+    def mark_modified(self, node=None):
+        if node is None:
+            self.retired_version += 1
+            return self.version
+        self._tree_of(node.book_id).mark_modified(node)
+        return self.version
+
+    def insert_book(self, book_id, title, author, availability_status="Yes", branch=None):
+        """Insert a book into its branch's tree, loading the branch if needed"""
+        branch = branch or self.directory.get(book_id) or self.default_branch
+        self.directory[book_id] = branch
+        tree = self.tree(branch)
+        # A branch loaded just now already read the committed row
+        node = tree.find_node(book_id)
+        if node is not None:
+            return node
+        return tree.insert_book(book_id, title, author, availability_status)
+
+    def move_book(self, book_id, branch):
+        """Move a book to another branch's tree with its loan state and queue"""
+        node = self.writable_node(book_id)
+        source = self.directory.get(book_id)
+        if node is None or source == branch:
+            return node
+        queue = node.reservation_heap
+        node.reservation_heap = type(queue)()
+        self.trees[source].delete_book(book_id)
+        self.directory[book_id] = branch
+        tree = self.tree(branch)
+        moved = tree.find_node(book_id)
+        if moved is None:
+            moved = tree.insert_book(book_id, node.title, node.author, node.availability_status)
+        tree.sync_status(moved, node.availability_status, node.borrowed_by, node.on_hold)
+        moved.reservation_heap = queue
+        tree.mark_modified(moved)
+        return moved
+
+    def find_node(self, book_id):
+        tree = self._tree_of(book_id)
+        return tree.find_node(book_id) if tree is not None else None
+
+    def writable_node(self, book_id):
+        tree = self._tree_of(book_id)
+        return tree.writable_node(book_id) if tree is not None else None
+
+    def borrow_book(self, patron_id, book_id, priority=1, node=None, time_of_reservation=None):
+        tree = self._tree_of(book_id)
+        if tree is None:
+            return False, "Book not found"
+        return tree.borrow_book(patron_id, book_id, priority, node=node, time_of_reservation=time_of_reservation)
+
+    def return_book(self, patron_id, book_id, node=None):
+        tree = self._tree_of(book_id)
+        if tree is None:
+            return False, "Book not found"
+        return tree.return_book(patron_id, book_id, node=node)
+
+    def expire_hold(self, book_id, node=None):
+        tree = self._tree_of(book_id)
+        if tree is None:
+            return False, "No hold to expire"
+        return tree.expire_hold(book_id, node=node)
+
+    def sync_status(self, node, availability_status, borrowed_by, on_hold=False):
+        self._tree_of(node.book_id).sync_status(node, availability_status, borrowed_by, on_hold)
+
+    def delete_book(self, book_id):
+        tree = self._tree_of(book_id)
+        if tree is None:
+            return []
+        cancelled = tree.delete_book(book_id)
+        del self.directory[book_id]
+        return cancelled
+
+    def delete_range(self, min_id, max_id):
+        removed = {}
+        if min_id > max_id:
+            return removed
+        branches = {branch for book_id, branch in self.directory.items() if min_id <= book_id <= max_id}
+        for branch in sorted(branches):
+            removed.update(self.tree(branch).delete_range(min_id, max_id))
+        for book_id in removed:
+            self.directory.pop(book_id, None)
+        return removed
+
+    def _overlaps(self, branch, min_id, max_id):
+        """False when an unloaded branch has no book in [min_id, max_id]"""
+        summary = self.summaries.get(branch)
+        if branch in self.trees or summary is None or 'min_id' not in summary:
+            return True
+        if summary['books'] == 0:
+            return False
+        return (min_id is None or summary['max_id'] >= min_id) and (max_id is None or summary['min_id'] <= max_id)
+
+    def _transient(self, branch):
+        """An unloaded branch's tree for one read, left out of the registry and the budget"""
+        tree = self.load(branch)
+        # Shared, not moved, the parked queues stay with the evicted branch
+        for book_id, queue in self.parked.get(branch, {}).items():
+            node = tree.find_node(book_id)
+            if node is not None:
+                node.reservation_heap = queue
+        return tree
+
+    def iter_inorder(self, min_id=None, max_id=None, branches=None):
+        """Yield nodes in book_id order, merged across the selected branches.
+
+        Evicted branches are read from a one-off tree instead of being
+        restored, so a scan of the whole catalog does not undo eviction.
+        """
+        return heapq.merge(
+            *(
+                (self.trees.get(branch) or self._transient(branch)).iter_inorder(min_id, max_id)
+                for branch in self._selected(branches)
+                if self._overlaps(branch, min_id, max_id)
+            ),
+            key=lambda node: node.book_id
+        )
+
+    def iter_chunks(self, min_id=None, max_id=None, chunk_size=500, lock=None, row=None):
+        """Yield lists of row(node) for up to chunk_size books at a time, in book_id order.
+
+        Each chunk is read while holding lock and the next one seeks again
+        from the last book_id, so a slow reader never walks a tree that
+        rotated since. One-off trees of evicted branches are loaded once
+        per scan; nothing else changes them.
+        """
+        transient = {}
+        low = min_id
+        while True:
+            unloaded = [
+                branch for branch in self.branches()
+                if branch not in self.trees and branch not in transient and self._overlaps(branch, low, max_id)
+            ]
+            for branch in unloaded:
+                transient[branch] = self._transient(branch)
+            with lock or contextlib.nullcontext():
+                trees = [
+                    self.trees.get(branch) or transient.get(branch)
+                    for branch in self.branches() if self._overlaps(branch, low, max_id)
+                ]
+                nodes = list(itertools.islice(
+                    heapq.merge(
+                        *(tree.iter_inorder(low, max_id) for tree in trees if tree is not None),
+                        key=lambda node: node.book_id
+                    ),
+                    chunk_size
+                ))
+                chunk = [row(node) for node in nodes] if row else nodes
+            if chunk:
+                yield chunk
+            if len(nodes) < chunk_size:
+                return
+            low = nodes[-1].book_id + 1
+
+    def _extreme(self, pick, key):
+        """min or max over the loaded trees, restoring only a branch whose saved bound wins"""
+        best = pick(
+            (node for node in (getattr(tree, key)() for tree in list(self.trees.values())) if node is not None),
+            key=lambda node: node.book_id, default=None
+        )
+        bounds = []
+        for branch in self.branches():
+            summary = self.summaries.get(branch)
+            if branch in self.trees or (summary is not None and summary.get('books') == 0):
+                continue
+            bound = summary.get(f"{key}_id") if summary is not None else None
+            if bound is None or best is None or pick(bound, best.book_id) != best.book_id:
+                bounds.append(branch)
+        for branch in bounds:
+            node = getattr(self.tree(branch), key)()
+            if node is not None and (best is None or pick(node.book_id, best.book_id) == node.book_id):
+                best = node
+        return best
+
+    def min(self):
+        return self._extreme(min, 'min')
+
+    def max(self):
+        return self._extreme(max, 'max')
+
+    # Directory lookups spent checking whether an unloaded branch holds a
+    # closer book before falling back to its saved min_id/max_id
+    PROBE_LIMIT = 4096
+
+    def _may_be_closer(self, branch, target_id, best, available):
+        """Whether an unloaded branch can hold a book at least as close as best"""
+        summary = self.summaries.get(branch)
+        if summary is None or 'min_id' not in summary:
+            return True
+        if summary['books'] == 0 or (available and summary['available'] == 0):
+            return False
+        if best is None:
+            return True
+        distance = abs(best.book_id - target_id)
+        if max(summary['min_id'] - target_id, target_id - summary['max_id'], 0) > distance:
+            return False
+        if 2 * distance + 1 > self.PROBE_LIMIT:
+            return True
+        return any(
+            self.directory.get(book_id) == branch
+            for book_id in range(target_id - distance, target_id + distance + 1)
+        )
+
+    def _closest_in(self, target_id, branches, available):
+        selected = self._selected(branches)
+        method = 'find_closest_available' if available else 'find_closest_book'
+        best = _closest(
+            [getattr(self.trees[branch], method)(target_id) for branch in selected if branch in self.trees],
+            target_id
+        )
+        for branch in selected:
+            if branch in self.trees or not self._may_be_closer(branch, target_id, best, available):
+                continue
+            best = _closest([best, getattr(self.tree(branch), method)(target_id)], target_id)
+        return best
+
+    def find_closest_book(self, target_id, branches=None):
+        """Closest book over the selected branches (all by default), ties go to the smaller ID.
+
+        Loaded branches answer first. An evicted branch is restored only if
+        its saved bounds and the directory say it may hold a closer book.
+        """
+        return self._closest_in(target_id, branches, available=False)
+
+    def find_closest_available(self, target_id, branches=None):
+        """Closest available book over the selected branches, ties go to the smaller ID"""
+        return self._closest_in(target_id, branches, available=True)
+
+    def count_available(self, min_id=None, max_id=None, branches=None):
+        if min_id is not None and max_id is not None and min_id > max_id:
+            return 0
+        total = 0
+        for branch in self._selected(branches):
+            if min_id is None and max_id is None and branch in self.summaries:
+                total += self.summaries[branch]['available']
+            elif not self._overlaps(branch, min_id, max_id):
+                continue
+            else:
+                total += self.tree(branch).count_available(min_id, max_id)
+        return total
+
+    def availability_stats(self):
+        """Counts over every branch, evicted branches answer from their saved counts"""
+        total = {'books': 0, 'available': 0, 'unavailable': 0}
+        for branch in self.branches():
+            tree = self.trees.get(branch)
+            stats = tree.availability_stats() if tree is not None else self.summaries.get(branch)
+            if stats is None:
+                stats = self.tree(branch).availability_stats()
+            for key in total:
+                total[key] += stats[key]
+        return total
+
+    def branch_stats(self):
+        """Per-branch book counts and load state"""
+        now = self.clock()
+        rows = []
+        for branch in self.branches():
+            tree = self.trees.get(branch)
+            stats = tree.availability_stats() if tree is not None else self.summaries.get(branch)
+            rows.append({
+                'branch': branch,
+                'loaded': tree is not None,
+                'books': stats['books'] if stats else None,
+                'available': stats['available'] if stats else None,
+                'estimated_bytes': self.estimated_bytes(branch) if tree is not None else None,
+                'idle_seconds': now - self.last_used[branch] if branch in self.last_used else None,
+                'parked_queues': len(self.parked.get(branch, ())),
+            })
+        return rows
+
+    def check_invariants(self, sample=None):
+        """Check every loaded tree and that its books are filed under its branch"""
+        for branch, tree in list(self.trees.items()):
+            ok, message = tree.check_invariants(sample)
+            if ok and sample is None:
+                stray = next((node for node in tree.iter_inorder() if self.directory.get(node.book_id) != branch), None)
+                if stray is not None:
+                    ok, message = False, f"Book {stray.book_id} is not filed under this branch"
+            if not ok:
+                return False, f"Branch {branch!r}: {message}"
+        return True, f"All invariants hold across {len(self.trees)} loaded branches"
+
+    @property
+    def last_invariant_check(self):
+        checks = [tree.last_invariant_check for tree in list(self.trees.values())]
+        if not checks or any(check is None for check in checks):
+            return None
+        failed = [check for check in checks if not check['ok']]
+        return {
+            'mode': checks[0]['mode'],
+            'ok': not failed,
+            'message': failed[0]['message'] if failed else f"All invariants hold across {len(checks)} loaded branches",
+            'nodes_checked': sum(check['nodes_checked'] for check in checks),
+        }
+
+    @property
+    def invariant_violations(self):
+        return sum(tree.invariant_violations for tree in list(self.trees.values()))
+
+    def memory_usage(self):
+        """Sum of the loaded trees' memory_usage reports, with the registry's own counters"""
+        total = None
+        for tree in list(self.trees.values()):
+            usage = tree.memory_usage()
+            if total is None:
+                total = usage
+                continue
+            for key, value in usage.items():
+                if key == 'heap_occupancy':
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    # Overlays report their shared base books as well
+                    total[key] = total.get(key, 0) + value
+        if total is None:
+            from .rb_tree import GatorLibrary
+            total = GatorLibrary().memory_usage()
+        total['branches'] = len(self.branches())
+        total['branches_loaded'] = len(self.trees)
+        total['branch_loads'] = self.loads
+        total['branch_evictions'] = self.evictions
+        total['branch_load_ms'] = self.load_seconds * 1000
+        total['parked_queues'] = sum(len(queues) for queues in self.parked.values())
+        total['memory_budget'] = self.memory_budget
+        return total
+
+    def node_cache_stats(self):
+        """The loaded trees' node cache counters added up"""
+        from .node_cache import NodeCache
+        stats = [tree.node_cache_stats() for tree in list(self.trees.values())] or [NodeCache(0).stats()]
+        total = {key: sum(entry[key] for entry in stats) for key in stats[0] if key != 'hit_rate'}
+        lookups = total['hits'] + total['misses']
+        total['hit_rate'] = total['hits'] / lookups if lookups else 0.0
+        return total
+
+    def get_color_flip_count(self):
+        return self.retired_flips + sum(tree.get_color_flip_count() for tree in list(self.trees.values()))
@@ -0,0 +1,99 @@
+import sys
+from collections import deque
+from itertools import chain
+
+from .min_heap import HEAP_SIZE, HeapNode, instance_size
+
+PRIORITY_LEVELS = (3, 2, 1)
+
+
+class BucketQueue:
+    """Reservation queue with one FIFO deque per priority level.
+
+    A drop-in alternative to MinHeap for the fixed 1-3 priority scheme:
+    higher priority first, then earliest reservation. Reservations almost
+    always arrive in time order, so insert is an O(1) append; an older
+    reservation arriving late is placed by a linear scan of its level.
+    """
+    def __init__(self):
+        self.length = 0
+        self.buckets = {priority: deque() for priority in PRIORITY_LEVELS}
+
+    def insert(self, patron_id, priority_number, time_of_reservation=None):
+        """Insert new reservation, False if the queue is full"""
+        if self.length >= HEAP_SIZE:
+            return False
+        if priority_number not in self.buckets:
+            raise ValueError(f"Priority must be one of {PRIORITY_LEVELS}")
+
+        node = HeapNode(patron_id, priority_number, time_of_reservation)
+        bucket = self.buckets[priority_number]
+        if not bucket or bucket[-1].time_of_reservation <= node.time_of_reservation:
+            bucket.append(node)
+        else:
+            idx = len(bucket)
+            while idx > 0 and bucket[idx - 1].time_of_reservation > node.time_of_reservation:
+                idx -= 1
+            bucket.insert(idx, node)
+        self.length += 1
+        return True
+
+    def delete(self):
+        """Remove and return highest priority reservation"""
+        for priority in PRIORITY_LEVELS:
+            bucket = self.buckets[priority]
+            if bucket:
+                self.length -= 1
+                return bucket.popleft()
+        return None
+
+    def iter_ordered(self):
+        """Yield reservations in allocation order without modifying the queue"""
+        return chain.from_iterable(self.buckets[priority] for priority in PRIORITY_LEVELS)
+
+    def peek(self, k=1):
+        """Return the top k reservations in order without removing them"""
+        result = []
+        for node in self.iter_ordered():
+            if len(result) == k:
+                break
+            result.append(node)
+        return result
+
+    def position_of(self, patron_id):
+        """1-based queue position of a patron's earliest reservation, or None"""
+        for position, node in enumerate(self.iter_ordered(), 1):
+            if node.patron_id == patron_id:
+                return position
+        return None
+
+    def get_size(self):
+        """Return current number of reservations"""
+        return self.length
+
+    def check_invariants(self):
+        """Verify size bounds and FIFO order within each level, returns (ok, message)"""
+        if not 0 <= self.length <= HEAP_SIZE:
+            return False, f"Queue length {self.length} outside 0..{HEAP_SIZE}"
+        if self.length != sum(len(bucket) for bucket in self.buckets.values()):
+            return False, f"Queue length {self.length} does not match its buckets"
+        for priority, bucket in self.buckets.items():
+            for earlier, later in zip(bucket, list(bucket)[1:]):
+                if earlier.priority_number != priority or later.time_of_reservation < earlier.time_of_reservation:
+                    return False, f"Priority {priority} bucket is out of order"
+            if bucket and bucket[-1].priority_number != priority:
+                return False, f"Priority {priority} bucket holds priority {bucket[-1].priority_number}"
+        return True, "Queue invariants hold"
+
+    def memory_usage(self):
+        """Structural size in bytes of the buckets and their reservations"""
+        return {
+            'heap': instance_size(self) + sys.getsizeof(self.buckets) + sum(
+                sys.getsizeof(bucket) for bucket in self.buckets.values()
+            ),
+            'entries': sum(
+                instance_size(node) + sys.getsizeof(node.time_of_reservation) for node in self.iter_ordered()
+            ),
+            'stale_slots': 0,
+        }
+
@@ -1,8 +1,29 @@
+import heapq
+import sys
 import time
 
 HEAP_SIZE = 20
 START_IDX = 1
 
+_instance_sizes = {}
+
+
+def instance_size(obj):
+    """Bytes of an instance and its attribute dict, excluding attribute values.
+
+    Measured once per class on a probe instance, since reading __dict__ on
+    every node would materialize dicts that Python otherwise keeps inline.
+    All instances of these classes set the same attributes.
+    """
+    cls = type(obj)
+    if cls not in _instance_sizes:
+        probe = cls.__new__(cls)
+        for name in vars(obj):
+            setattr(probe, name, None)
+        _instance_sizes[cls] = sys.getsizeof(probe) + sys.getsizeof(probe.__dict__)
+    return _instance_sizes[cls]
+
+
 class HeapNode:
     def __init__(self, patron_id, priority_number, time_of_reservation=None):
         self.patron_id = patron_id
@@ -59,6 +80,8 @@ class MinHeap:
             
         highest_priority = self.heap[START_IDX]
         self.heap[START_IDX] = self.heap[self.length]
+        # Drop the vacated slot's reference so removed reservations can be freed
+        self.heap[self.length] = None
         self.length -= 1
         
         if self.length > 0:
@@ -84,6 +107,78 @@ class MinHeap:
             self.swap(idx, largest)
             self._heapify(largest)
 
+    def _order_key(self, idx):
+        """Sort key matching has_higher_priority, for use with heapq"""
+        node = self.heap[idx]
+        return (-node.priority_number, node.time_of_reservation, idx)
+
+    def iter_ordered(self):
+        """Yield reservations in allocation order without modifying the heap.
+
+        Keeps a frontier of candidate indices, so the first k entries cost
+        O(k log k) regardless of heap size.
+        """
+        if self.length == 0:
+            return
+        frontier = [self._order_key(START_IDX)]
+        while frontier:
+            *_, idx = heapq.heappop(frontier)
+            yield self.heap[idx]
+            for child in (2 * idx, 2 * idx + 1):
+                if child <= self.length:
+                    heapq.heappush(frontier, self._order_key(child))
+
+    def peek(self, k=1):
+        """Return the top k reservations in order without removing them"""
+        result = []
+        for node in self.iter_ordered():
+            if len(result) == k:
+                break
+            result.append(node)
+        return result
+
+    def position_of(self, patron_id):
+        """1-based queue position of a patron's earliest reservation, or None"""
+        positions = [
+            1 + sum(
+                1 for other in range(START_IDX, self.length + 1)
+                if self.has_higher_priority(self.heap[other], self.heap[idx])
+            )
+            for idx in range(START_IDX, self.length + 1)
+            if self.heap[idx].patron_id == patron_id
+        ]
+        return min(positions) if positions else None
+
+    def memory_usage(self):
+        """Structural size in bytes of the heap container and its reservations.
+
+        Also counts slots past the end of the heap that still reference a
+        HeapNode, which would keep removed reservations alive.
+        """
+        entries = 0
+        for idx in range(START_IDX, self.length + 1):
+            entries += instance_size(self.heap[idx]) + sys.getsizeof(self.heap[idx].time_of_reservation)
+        return {
+            'heap': instance_size(self) + sys.getsizeof(self.heap),
+            'entries': entries,
+            'stale_slots': sum(
+                1 for idx in range(len(self.heap))
+                if self.heap[idx] is not None and not START_IDX <= idx <= self.length
+            ),
+        }
+
     def get_size(self):
         """Return current number of reservations"""
-        return self.length
\ No newline at end of file
+        return self.length
+
+    def check_invariants(self):
+        """Verify size bounds and heap order, returns (ok, message)"""
+        if not 0 <= self.length <= HEAP_SIZE:
+            return False, f"Heap length {self.length} outside 0..{HEAP_SIZE}"
+
+        for idx in range(START_IDX, self.length + 1):
+            if self.heap[idx] is None:
+                return False, f"Empty heap slot at index {idx}"
+            if idx > START_IDX and self.has_higher_priority(self.heap[idx], self.heap[idx // 2]):
+                return False, f"Heap order violated between index {idx // 2} and {idx}"
+        return True, "Heap invariants hold"
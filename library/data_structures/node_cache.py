@@ -0,0 +1,95 @@
+class NodeCache:
+    """Bounded book_id -> Node map with CLOCK (second chance) eviction.
+
+    A hit sets the slot's reference bit and reorders nothing, so hot books
+    cost one dict lookup. On a miss the clock hand sweeps past recently
+    referenced slots, clearing their bits, and evicts the first one that
+    was not referenced since the last sweep.
+
+    Like the tree, the cache relies on the caller (a shard lock) to order
+    mutations. Hits still check the node's book_id, so a slot reused by a
+    concurrent miss reads as a miss rather than the wrong book, and put()
+    drops a node found before an invalidate() that raced with it. Nodes
+    keep their identity through rotations, so only removing a book from
+    the tree needs an invalidate().
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.index = {}  # book_id -> slot
+        self.keys = [None] * capacity
+        self.nodes = [None] * capacity
+        self.referenced = bytearray(capacity)
+        self.hand = 0
+        # Bumped by invalidate() and clear()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, book_id):
+        slot = self.index.get(book_id)
+        if slot is not None:
+            node = self.nodes[slot]
+            if node is not None and node.book_id == book_id:
+                self.referenced[slot] = 1
+                self.hits += 1
+                return node
+        self.misses += 1
+        return None
+
+    def put(self, node, generation):
+        """Cache a node found while self.generation was generation"""
+        capacity = self.capacity
+        if not capacity or generation != self.generation:
+            return
+        book_id = node.book_id
+        index = self.index
+        if book_id in index:
+            return
+        referenced = self.referenced
+        hand = self.hand
+        while referenced[hand]:
+            referenced[hand] = 0
+            hand = hand + 1 if hand + 1 < capacity else 0
+        keys = self.keys
+        old = keys[hand]
+        if old is not None:
+            index.pop(old, None)
+            self.evictions += 1
+        keys[hand] = book_id
+        self.nodes[hand] = node
+        index[book_id] = hand
+        self.hand = hand + 1 if hand + 1 < capacity else 0
+
+    def invalidate(self, book_id):
+        self.generation += 1
+        slot = self.index.pop(book_id, None)
+        if slot is not None:
+            self.keys[slot] = None
+            self.nodes[slot] = None
+            self.referenced[slot] = 0
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.index = {}
+        self.keys = [None] * self.capacity
+        self.nodes = [None] * self.capacity
+        self.referenced = bytearray(self.capacity)
+        self.hand = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'size': len(self.index),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
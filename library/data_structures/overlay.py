@@ -0,0 +1,258 @@
+import bisect
+import heapq
+
+from .node_cache import NodeCache
+from .rb_tree import GatorLibrary
+
+
+class OverlayLibrary:
+    """A worker's changes layered over a tree shared copy-on-write with other workers.
+
+    The base tree is built before fork and never written afterwards, so its
+    pages stay shared. A book is copied into the worker-local delta tree
+    the first time it is written (writable_node, or any mutating call) and
+    the base node is shadowed from then on. Books inserted after fork live
+    only in the delta, deleted base books are just shadowed. Counts over
+    the base subtract the shadowed books, so they stay O(log n).
+
+    Base lookups skip the base tree's node cache, whose counters and
+    reference bits would be written on every read, and go through a
+    worker-local cache instead. Reads still bump reference counts on the
+    base nodes they visit, which CPython cannot avoid, so pages a worker
+    reads often still get copied; the overlay keeps the tree's own writes
+    out of them.
+    """
+    def __init__(self, base, delta=None):
+        self.base = base
+        self.delta = delta or GatorLibrary()
+        self.base_cache = NodeCache(self.delta.node_cache.capacity)
+        # Delta versions continue from the base, so node versions never repeat
+        self.delta.version = max(self.delta.version, base.version)
+        self.epoch = self.delta.epoch
+        self.shadowed = set()
+        # Shadowed base books, and those that were available in the base, sorted
+        self.hidden_ids = []
+        self.hidden_available = []
+        self.copies = 0
+
+    @property
+    def version(self):
+        return self.delta.version
+
+    def _visible(self, node):
+        return node is not None and node.book_id not in self.shadowed
+
+    def _hide(self, node):
+        self.shadowed.add(node.book_id)
+        self.base_cache.invalidate(node.book_id)
+        bisect.insort(self.hidden_ids, node.book_id)
+        if node.availability_status == "Yes":
+            bisect.insort(self.hidden_available, node.book_id)
+        self.delta.mark_modified()
+
+    def _copy(self, node):
+        """Move a base book into the delta, with its loan state and queue"""
+        copy = self.delta.insert_book(node.book_id, node.title, node.author, node.availability_status)
+        self.delta.sync_status(copy, node.availability_status, node.borrowed_by, node.on_hold)
+        for entry in node.reservation_heap.iter_ordered():
+            copy.reservation_heap.insert(entry.patron_id, entry.priority_number, entry.time_of_reservation)
+        self._hide(node)
+        self.copies += 1
+        return copy
+
+    def _base_node(self, book_id):
+        """A base node looked up without writing to the base tree"""
+        cache = self.base_cache
+        node = cache.get(book_id)
+        if node is None:
+            generation = cache.generation
+            node = self.base._search(book_id)
+            if node is not None:
+                cache.put(node, generation)
+        return node
+
+    def find_node(self, book_id):
+        if book_id in self.shadowed:
+            return self.delta.find_node(book_id)
+        node = self._base_node(book_id)
+        if node is not None:
+            return node
+        return self.delta.find_node(book_id)
+
+    def writable_node(self, book_id):
+        """Worker-local node of a book, copied out of the base on first use"""
+        node = self.delta.find_node(book_id)
+        if node is not None or book_id in self.shadowed:
+            return node
+        node = self._base_node(book_id)
+        return self._copy(node) if node is not None else None
+
+    def mark_modified(self, node=None):
+        if node is None:
+            return self.delta.mark_modified()
+        return self.delta.mark_modified(self.writable_node(node.book_id))
+
+    def insert_book(self, book_id, title, author, availability_status="Yes"):
+        node = self.writable_node(book_id)
+        if node is not None:
+            return node
+        return self.delta.insert_book(book_id, title, author, availability_status)
+
+    def borrow_book(self, patron_id, book_id, priority=1, node=None, time_of_reservation=None):
+        node = self.writable_node(book_id)
+        if node is None:
+            return False, "Book not found"
+        return self.delta.borrow_book(patron_id, book_id, priority, node=node, time_of_reservation=time_of_reservation)
+
+    def return_book(self, patron_id, book_id, node=None):
+        node = self.writable_node(book_id)
+        if node is None:
+            return False, "Book not found"
+        return self.delta.return_book(patron_id, book_id, node=node)
+
+    def expire_hold(self, book_id, node=None):
+        node = self.writable_node(book_id)
+        if node is None:
+            return False, "No hold to expire"
+        return self.delta.expire_hold(book_id, node=node)
+
+    def sync_status(self, node, availability_status, borrowed_by, on_hold=False):
+        self.delta.sync_status(self.writable_node(node.book_id), availability_status, borrowed_by, on_hold)
+
+    def delete_book(self, book_id):
+        if self.delta.find_node(book_id) is not None:
+            return self.delta.delete_book(book_id)
+        node = self.find_node(book_id)
+        if node is None:
+            return []
+        self._hide(node)
+        # The base heap is left as it is, the book is gone from this worker
+        return [entry.patron_id for entry in node.reservation_heap.iter_ordered()]
+
+    def delete_range(self, min_id, max_id):
+        removed = self.delta.delete_range(min_id, max_id)
+        if min_id > max_id:
+            return removed
+        for node in list(self.base.iter_inorder(min_id, max_id)):
+            if self._visible(node):
+                self._hide(node)
+                removed[node.book_id] = [entry.patron_id for entry in node.reservation_heap.iter_ordered()]
+        return dict(sorted(removed.items()))
+
+    def iter_inorder(self, min_id=None, max_id=None):
+        visible = (node for node in self.base.iter_inorder(min_id, max_id) if node.book_id not in self.shadowed)
+        return heapq.merge(visible, self.delta.iter_inorder(min_id, max_id), key=lambda node: node.book_id)
+
+    def _base_nearest(self, target_id, below, available=False):
+        """Visible base book nearest to target_id on one side, widening the window each miss"""
+        bound = self.base.min() if below else self.base.max()
+        if bound is None:
+            return None
+        width = 16
+        while True:
+            low, high = (target_id - width, target_id) if below else (target_id, target_id + width)
+            nodes = [
+                node for node in self.base.iter_inorder(low, high)
+                if self._visible(node) and (not available or node.availability_status == "Yes")
+            ]
+            if nodes:
+                return nodes[-1] if below else nodes[0]
+            if (low <= bound.book_id) if below else (high >= bound.book_id):
+                return None
+            width *= 4
+
+    @staticmethod
+    def _closest(candidates, target_id):
+        candidates = [node for node in candidates if node is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda node: (abs(node.book_id - target_id), node.book_id))
+
+    def _base_closest(self, target_id, available):
+        if available:
+            # The base's own O(log n) answer holds unless this worker shadowed it
+            node = self.base.find_closest_available(target_id)
+            if node is None or self._visible(node):
+                return node
+        return self._closest(
+            [self._base_nearest(target_id, True, available), self._base_nearest(target_id, False, available)],
+            target_id
+        )
+
+    def find_closest_book(self, target_id):
+        return self._closest([self._base_closest(target_id, False), self.delta.find_closest_book(target_id)], target_id)
+
+    def find_closest_available(self, target_id):
+        return self._closest([self._base_closest(target_id, True), self.delta.find_closest_available(target_id)], target_id)
+
+    def min(self):
+        node = self.base.min()
+        if node is not None and not self._visible(node):
+            node = self._base_nearest(node.book_id, below=False)
+        candidates = [candidate for candidate in (node, self.delta.min()) if candidate is not None]
+        return min(candidates, key=lambda candidate: candidate.book_id, default=None)
+
+    def max(self):
+        node = self.base.max()
+        if node is not None and not self._visible(node):
+            node = self._base_nearest(node.book_id, below=True)
+        candidates = [candidate for candidate in (node, self.delta.max()) if candidate is not None]
+        return max(candidates, key=lambda candidate: candidate.book_id, default=None)
+
+    @staticmethod
+    def _count_range(ids, min_id, max_id):
+        low = 0 if min_id is None else bisect.bisect_left(ids, min_id)
+        high = len(ids) if max_id is None else bisect.bisect_right(ids, max_id)
+        return max(0, high - low)
+
+    def count_available(self, min_id=None, max_id=None):
+        if min_id is not None and max_id is not None and min_id > max_id:
+            return 0
+        return (
+            self.base.count_available(min_id, max_id)
+            - self._count_range(self.hidden_available, min_id, max_id)
+            + self.delta.count_available(min_id, max_id)
+        )
+
+    def availability_stats(self):
+        base = self.base.availability_stats()
+        delta = self.delta.availability_stats()
+        books = base['books'] - len(self.hidden_ids) + delta['books']
+        available = base['available'] - len(self.hidden_available) + delta['available']
+        return {'books': books, 'available': available, 'unavailable': books - available}
+
+    def check_invariants(self, sample=None):
+        """Check the delta tree; a full pass over the base would unshare all of its pages"""
+        ok, message = self.delta.check_invariants(sample)
+        if ok and sample is None:
+            stray = next((book_id for book_id in self.hidden_ids if book_id not in self.shadowed), None)
+            if stray is not None or len(self.hidden_ids) != len(self.shadowed):
+                ok, message = False, "Shadowed base books and their index disagree"
+                self.delta.invariant_violations += 1
+        return ok, message
+
+    @property
+    def last_invariant_check(self):
+        return self.delta.last_invariant_check
+
+    @property
+    def invariant_violations(self):
+        return self.delta.invariant_violations
+
+    def memory_usage(self):
+        """Accounting of the worker-local delta only, walking the base would unshare it"""
+        usage = self.delta.memory_usage()
+        usage['shared_books'] = self.base.availability_stats()['books'] - len(self.hidden_ids)
+        usage['copied_books'] = self.copies
+        usage['shadowed_books'] = len(self.shadowed)
+        return usage
+
+    def node_cache_stats(self):
+        stats = [self.base_cache.stats(), self.delta.node_cache_stats()]
+        total = {key: sum(entry[key] for entry in stats) for key in stats[0] if key != 'hit_rate'}
+        lookups = total['hits'] + total['misses']
+        total['hit_rate'] = total['hits'] / lookups if lookups else 0.0
+        return total
+
+    def get_color_flip_count(self):
+        return self.base.get_color_flip_count() + self.delta.get_color_flip_count()
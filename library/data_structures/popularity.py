@@ -0,0 +1,223 @@
+import threading
+from array import array
+from collections import deque
+
+# Mersenne prime for the row hash functions
+HASH_PRIME = (1 << 61) - 1
+
+
+class CountMinSketch:
+    """Approximate counts of integer keys in depth x width counters.
+
+    Estimates never undercount; with width w they overcount by at most
+    e/w of the total with probability 1 - e^-depth. Sketches of the same
+    shape and seed can be added and subtracted counter by counter.
+    """
+    def __init__(self, width=2048, depth=4, seed=0):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        # One universal hash (a * key + b) mod p mod width per row
+        self.hashes = [
+            ((seed + 1) * 0x9E3779B1 * (row + 1) % HASH_PRIME or 1, (seed + 7) * 0x85EBCA77 * (row + 3) % HASH_PRIME)
+            for row in range(depth)
+        ]
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    def _columns(self, key):
+        return [(a * key + b) % HASH_PRIME % self.width for a, b in self.hashes]
+
+    def add(self, key, count=1):
+        """Count key, returns its new estimate"""
+        self.total += count
+        estimate = None
+        for row, column in zip(self.rows, self._columns(key)):
+            row[column] += count
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        return estimate
+
+    def estimate(self, key):
+        return min(row[column] for row, column in zip(self.rows, self._columns(key)))
+
+    def _check_shape(self, other):
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Sketches must share width, depth and seed")
+
+    def merge(self, other):
+        self._check_shape(other)
+        for row, other_row in zip(self.rows, other.rows):
+            for column, count in enumerate(other_row):
+                if count:
+                    row[column] += count
+        self.total += other.total
+
+    def subtract(self, other):
+        self._check_shape(other)
+        for row, other_row in zip(self.rows, other.rows):
+            for column, count in enumerate(other_row):
+                if count:
+                    row[column] -= count
+        self.total -= other.total
+
+
+class TopK:
+    """The k keys with the highest counts, in a min-heap indexed by key.
+
+    Counts only ever rise, so an update moves a key towards the leaves:
+    O(log k) for a key already tracked, O(1) for a key that does not make
+    the cut. top() reads the heap in O(k log k).
+    """
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # [count, key], smallest count at the root
+        self.index = {}  # key -> position in heap
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.index[heap[i][1]] = i
+        self.index[heap[j][1]] = j
+
+    def _sift_down(self, i):
+        heap = self.heap
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap) and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def _sift_up(self, i):
+        heap = self.heap
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[i][0] >= heap[parent][0]:
+                return
+            self._swap(i, parent)
+            i = parent
+
+    def offer(self, key, count):
+        """Record that key now has count (never lower than before)"""
+        position = self.index.get(key)
+        if position is not None:
+            self.heap[position][0] = count
+            self._sift_down(position)
+        elif len(self.heap) < self.k:
+            self.heap.append([count, key])
+            self.index[key] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+        elif count > self.heap[0][0]:
+            del self.index[self.heap[0][1]]
+            self.heap[0] = [count, key]
+            self.index[key] = 0
+            self._sift_down(0)
+
+    def top(self, n=None):
+        """(key, count) pairs, highest count first, ties by smaller key"""
+        ranked = sorted(((key, count) for count, key in self.heap), key=lambda pair: (-pair[1], pair[0]))
+        return ranked if n is None else ranked[:n]
+
+    def keys(self):
+        return self.index.keys()
+
+
+class PopularityTracker:
+    """Borrow counts over a sliding window of time buckets.
+
+    Every bucket has its own sketch and top-k; the window keeps a sketch
+    that is the sum of its buckets' and a top-k over it. Recording a borrow
+    touches the current bucket and the window. When the window slides, the
+    expired buckets' sketches are subtracted and the window's top-k is
+    rebuilt from the surviving buckets' candidates.
+
+    Request threads record and read concurrently, and a record or a read
+    can slide the window, so the public methods run under one lock.
+    """
+    def __init__(self, bucket_seconds=86400, window_buckets=7, k=20, width=2048, depth=4):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.buckets = deque()  # (bucket, sketch, top-k), oldest first
+        self.window_sketch = self._sketch()
+        self.window_top = TopK(k)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def _sketch(self):
+        return CountMinSketch(self.width, self.depth)
+
+    def bucket_for(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def _advance(self, bucket):
+        """Make bucket the newest one, expiring buckets that leave the window"""
+        expired = False
+        while self.buckets and self.buckets[0][0] <= bucket - self.window_buckets:
+            _, sketch, _ = self.buckets.popleft()
+            self.window_sketch.subtract(sketch)
+            expired = True
+        if expired:
+            self.window_top = TopK(self.k)
+            for key in {key for _, _, top in self.buckets for key in top.keys()}:
+                self.window_top.offer(key, self.window_sketch.estimate(key))
+        self.buckets.append((bucket, self._sketch(), TopK(self.k)))
+
+    def record(self, book_id, timestamp, count=1):
+        """Count count borrows of book_id at timestamp; old timestamps outside the window are ignored"""
+        with self._lock:
+            return self._record(book_id, timestamp, count)
+
+    def _record(self, book_id, timestamp, count):
+        bucket = self.bucket_for(timestamp)
+        if not self.buckets or bucket > self.buckets[-1][0]:
+            self._advance(bucket)
+        entry = next((entry for entry in reversed(self.buckets) if entry[0] == bucket), None)
+        if entry is None:
+            if bucket <= self.buckets[-1][0] - self.window_buckets:
+                return False
+            # A late record for a bucket with no borrows yet
+            entry = (bucket, self._sketch(), TopK(self.k))
+            self.buckets.append(entry)
+            self.buckets = deque(sorted(self.buckets, key=lambda item: item[0]))
+        _, sketch, top = entry
+        top.offer(book_id, sketch.add(book_id, count))
+        self.window_top.offer(book_id, self.window_sketch.add(book_id, count))
+        self.recorded += count
+        return True
+
+    def top(self, n=None, now=None):
+        """Most borrowed books in the window ending at now, as (book_id, estimated borrows)"""
+        with self._lock:
+            if now is not None and self.buckets and self.bucket_for(now) > self.buckets[-1][0]:
+                self._advance(self.bucket_for(now))
+            return self.window_top.top(n)
+
+    def estimate(self, book_id):
+        """Approximate borrows of book_id in the window"""
+        with self._lock:
+            return self.window_sketch.estimate(book_id)
+
+    def forget(self, book_id):
+        """Drop a deleted book from the leaderboards, its sketch counts simply age out"""
+        with self._lock:
+            for top in [self.window_top] + [entry[2] for entry in self.buckets]:
+                position = top.index.pop(book_id, None)
+                if position is None:
+                    continue
+                last = top.heap.pop()
+                if position < len(top.heap):
+                    top.heap[position] = last
+                    top.index[last[1]] = position
+                    top._sift_down(position)
+                    top._sift_up(position)
+
+    def memory_usage(self):
+        sketches = 1 + len(self.buckets)
+        return sketches * self.depth * self.width * 8
@@ -1,7 +1,17 @@
-from .min_heap import MinHeap, HeapNode
+import sys
+import uuid
+from collections import deque
+
+from .min_heap import MinHeap, HeapNode, HEAP_SIZE, instance_size
+from .node_cache import NodeCache
+
+# Number of recently mutated nodes remembered for sampled invariant checks
+TOUCHED_PATHS = 64
+# Hot books whose nodes find_node returns without a descent
+NODE_CACHE_SIZE = 1024
 
 class Node:
-    def __init__(self, book_id, title, author, availability_status="Yes"):
+    def __init__(self, book_id, title, author, availability_status="Yes", queue_class=MinHeap):
         self.book_id = book_id
         self.title = title
         self.author = author
@@ -11,20 +21,77 @@ class Node:
         self.right = None
         self.parent = None
         self.borrowed_by = None
-        self.reservation_heap = MinHeap()  # Using MinHeap for reservations
+        self.on_hold = False  # Allocated from the reservation heap but not yet claimed
+        self.version = 0  # Tree version of the last change to this book
+        # Books and available books in this subtree, zero for the NIL sentinel
+        self.size = 0
+        self.available_count = 0
+        self.reservation_heap = queue_class()  # MinHeap or BucketQueue for reservations
 
 class GatorLibrary:
-    def __init__(self):
+    # Attach ids above the current maximum without descending from the root
+    append_fast_path = True
+
+    def __init__(self, queue_class=MinHeap, cache_size=NODE_CACHE_SIZE):
+        # Reservation queue implementation used for every book
+        self.queue_class = queue_class
+        self.node_cache = NodeCache(cache_size)
         # Create the sentinel NIL node
         self.nil = Node(None, None, None)
         self.nil.color = "black"
         # Initialize root as NIL
         self.root = self.nil
+        # Smallest and largest nodes, None while the tree is empty
+        self.min_node = None
+        self.max_node = None
+        # Inserts that took the append fast path
+        self.appends = 0
         # Counter for color flips
         self.color_flip_count = 0
+        # Monotonic mutation version, the epoch distinguishes tree instances
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # Recently mutated nodes and results of the invariant checker
+        self.touched = deque(maxlen=TOUCHED_PATHS)
+        self.last_invariant_check = None
+        self.invariant_violations = 0
+
+    def mark_modified(self, node=None):
+        """Advance the mutation version globally and for node"""
+        self.version += 1
+        if node is not None and node != self.nil:
+            node.version = self.version
+        return self.version
+
+    def _recount(self, node):
+        """Recompute a node's subtree counts from its children"""
+        node.size = node.left.size + node.right.size + 1
+        node.available_count = node.left.available_count + node.right.available_count + \
+            (1 if node.availability_status == "Yes" else 0)
+
+    def _recount_path(self, node):
+        """Recompute subtree counts from node up to the root, O(log n)"""
+        while node != self.nil:
+            self._recount(node)
+            node = node.parent
+
+    def _touch(self, node):
+        """Remember a mutated node so sampled checks can revisit its path"""
+        if node != self.nil:
+            self.touched.append(node)
 
     def _fix_insert(self, node):
         """Fix Red-Black Tree violations after insertion"""
+        self._fix_red_red(node)
+        
+        # Ensure root is black
+        self._change_color(self.root, "black")
+        
+        # Return the original node that was inserted
+        return node  # Important: return the original node, not current
+
+    def _fix_red_red(self, node):
+        """Recolor and rotate upwards from a red node whose parent may be red"""
         # Keep going up while there's a red-red violation
         current = node  # Keep track of the node we're working with
         
@@ -67,16 +134,12 @@ class GatorLibrary:
                     self._change_color(current.parent, "black")
                     self._change_color(current.parent.parent, "red")
                     self._left_rotate(current.parent.parent)
-        
-        # Ensure root is black
-        self._change_color(self.root, "black")
-        
-        # Return the original node that was inserted
-        return node  # Important: return the original node, not current
 
     def _left_rotate(self, x):
         """Perform left rotation"""
         y = x.right
+        self._touch(x)
+        self._touch(y)
         
         # Turn y's left subtree into x's right subtree
         x.right = y.left
@@ -95,10 +158,14 @@ class GatorLibrary:
         # Put x on y's left
         y.left = x
         x.parent = y
+        self._recount(x)
+        self._recount(y)
 
     def _right_rotate(self, x):
         """Perform right rotation"""
         y = x.left
+        self._touch(x)
+        self._touch(y)
         
         # Turn y's right subtree into x's left subtree
         x.left = y.right
@@ -117,6 +184,8 @@ class GatorLibrary:
         # Put x on y's right
         y.right = x
         x.parent = y
+        self._recount(x)
+        self._recount(y)
 
     def _change_color(self, node, new_color):
         """Helper method to change node color and track flips"""
@@ -124,49 +193,97 @@ class GatorLibrary:
             print(f"DEBUG: Changing color of node {node.book_id} from {node.color} to {new_color}")
             node.color = new_color
             self.color_flip_count += 1
+            self._touch(node)
             return True
         return False
 
     def insert_book(self, book_id, title, author, availability_status="Yes"):
         """Insert a new book into the Red-Black Tree"""
         print(f"DEBUG: Starting insertion of book {book_id}")
-        new_node = Node(book_id, title, author, availability_status)
+        new_node = Node(book_id, title, author, availability_status, self.queue_class)
         new_node.left = self.nil
         new_node.right = self.nil
         new_node.parent = self.nil
         new_node.color = "red"  # New nodes start red
         
-        # Standard BST insertion
-        parent = self.nil
-        current = self.root
-        
-        while current != self.nil:
-            parent = current
-            if book_id < current.book_id:
-                current = current.left
-            else:
-                current = current.right
-        
-        new_node.parent = parent
-        
-        if parent == self.nil:
-            self.root = new_node
-            print("DEBUG: Inserted as root node")
-        elif book_id < parent.book_id:
-            parent.left = new_node
-            print(f"DEBUG: Inserted as left child of {parent.book_id}")
-        else:
+        if self.append_fast_path and self.max_node is not None and book_id > self.max_node.book_id:
+            # AutoField ids arrive in increasing order: the new node is the
+            # right child of the current maximum, which has no right child
+            parent = self.max_node
+            new_node.parent = parent
             parent.right = new_node
-            print(f"DEBUG: Inserted as right child of {parent.book_id}")
+            self.appends += 1
+            print(f"DEBUG: Appended after maximum {parent.book_id}")
+        else:
+            # Standard BST insertion
+            parent = self.nil
+            current = self.root
+
+            while current != self.nil:
+                parent = current
+                if book_id < current.book_id:
+                    current = current.left
+                else:
+                    current = current.right
+
+            new_node.parent = parent
+
+            if parent == self.nil:
+                self.root = new_node
+                print("DEBUG: Inserted as root node")
+            elif book_id < parent.book_id:
+                parent.left = new_node
+                print(f"DEBUG: Inserted as left child of {parent.book_id}")
+            else:
+                parent.right = new_node
+                print(f"DEBUG: Inserted as right child of {parent.book_id}")
+        if self.min_node is None or book_id < self.min_node.book_id:
+            self.min_node = new_node
+        if self.max_node is None or book_id >= self.max_node.book_id:
+            self.max_node = new_node
         
+        self._touch(new_node)
+        self.mark_modified(new_node)
+        self._recount_path(new_node)
         # Fix the tree and get the final node
         fixed_node = self._fix_insert(new_node)
         print(f"DEBUG: Insertion complete. Node {book_id} final color: {fixed_node.color}")
         
         return fixed_node
 
+    def min(self):
+        """Node with the smallest book_id, or None if the tree is empty, O(1)"""
+        return self.min_node
+
+    def max(self):
+        """Node with the largest book_id, or None if the tree is empty, O(1)"""
+        return self.max_node
+
+    def _reset_bounds(self):
+        """Recompute min_node and max_node after a structural change, O(log n)"""
+        if self.root == self.nil:
+            self.min_node = self.max_node = None
+        else:
+            self.min_node = self._minimum(self.root)
+            self.max_node = self._maximum(self.root)
+
     def find_node(self, book_id):
-        """Find a node by book_id"""
+        """Find a node by book_id, recently used books come from the node cache"""
+        cache = self.node_cache
+        node = cache.get(book_id)
+        if node is None:
+            generation = cache.generation
+            node = self._search(book_id)
+            if node is not None:
+                cache.put(node, generation)
+        return node
+
+    def writable_node(self, book_id):
+        """Node to modify in place, see OverlayLibrary; the same as find_node here"""
+        return self.find_node(book_id)
+
+    def _search(self, book_id):
+        """Descend from the root to book_id, bypassing the node cache"""
         current = self.root
         while current != self.nil:
             if book_id == current.book_id:
@@ -177,26 +294,38 @@ class GatorLibrary:
                 current = current.right
         return None
 
-    def borrow_book(self, patron_id, book_id, priority=1):
+    def borrow_book(self, patron_id, book_id, priority=1, node=None, time_of_reservation=None):
         """Borrow a book or add to reservation heap"""
-        node = self.find_node(book_id)
+        if node is None:
+            node = self.find_node(book_id)
         if not node:
             return False, "Book not found"
         
+        if node.on_hold and node.borrowed_by == patron_id:
+            # Patron is picking up a book held for them
+            node.on_hold = False
+            self.mark_modified(node)
+            return True, "Hold claimed successfully"
+
         if node.availability_status == "No":
             # Add to reservation heap
-            success = node.reservation_heap.insert(patron_id, priority)
+            success = node.reservation_heap.insert(patron_id, priority, time_of_reservation)
+            self._touch(node)
             if not success:
                 return False, "Reservation list is full"
+            self.mark_modified(node)
             return False, "Book is currently borrowed. Added to reservation list."
         
         node.availability_status = "No"
         node.borrowed_by = patron_id
+        self.mark_modified(node)
+        self._recount_path(node)
         return True, "Book borrowed successfully"
 
-    def return_book(self, patron_id, book_id):
+    def return_book(self, patron_id, book_id, node=None):
         """Return a book and handle reservations"""
-        node = self.find_node(book_id)
+        if node is None:
+            node = self.find_node(book_id)
         if not node:
             return False, "Book not found"
         
@@ -205,16 +334,50 @@ class GatorLibrary:
         
         # Check reservation heap for next patron
         next_reservation = node.reservation_heap.delete()
+        self._touch(node)
+        self.mark_modified(node)
         if next_reservation:
             # Allocate to the highest priority reservation
             node.borrowed_by = next_reservation.patron_id
+            node.on_hold = True
             return True, f"Book returned and allocated to patron {next_reservation.patron_id}"
         
         # No reservations, mark as available
         node.availability_status = "Yes"
         node.borrowed_by = None
+        node.on_hold = False
+        self._recount_path(node)
         return True, "Book returned successfully"
 
+    def expire_hold(self, book_id, node=None):
+        """Expire an unclaimed hold and advance to the next reservation"""
+        if node is None:
+            node = self.find_node(book_id)
+        if not node or not node.on_hold:
+            return False, "No hold to expire"
+
+        expired_patron = node.borrowed_by
+        next_reservation = node.reservation_heap.delete()
+        self._touch(node)
+        self.mark_modified(node)
+        if next_reservation:
+            node.borrowed_by = next_reservation.patron_id
+            return True, f"Hold for patron {expired_patron} expired, allocated to patron {next_reservation.patron_id}"
+
+        node.availability_status = "Yes"
+        node.borrowed_by = None
+        node.on_hold = False
+        self._recount_path(node)
+        return True, f"Hold for patron {expired_patron} expired, book is available"
+
+    def sync_status(self, node, availability_status, borrowed_by, on_hold=False):
+        """Overwrite a node's loan state with the database's view of it"""
+        node.availability_status = availability_status
+        node.borrowed_by = borrowed_by
+        node.on_hold = on_hold
+        self.mark_modified(node)
+        self._recount_path(node)
+
     def _transplant(self, u, v):
         """Helper for deletion - transplant subtree v at node u"""
         if u.parent == self.nil:
@@ -232,11 +395,71 @@ class GatorLibrary:
             current = current.left
         return current
 
+    def _maximum(self, node):
+        """Find the maximum value in a subtree"""
+        current = node
+        while current.right != self.nil:
+            current = current.right
+        return current
+
+    def bulk_load(self, rows):
+        """Build the tree from rows sorted by book_id in O(n), without rotations.
+
+        Each row is (book_id, title, author, availability_status, borrowed_by,
+        on_hold). Nodes are placed by median split, which leaves every NIL at
+        the deepest or second deepest level, so colouring only the deepest
+        level red satisfies the red-black properties. Returns the nodes in
+        book_id order.
+        """
+        if self.root != self.nil:
+            raise ValueError("bulk_load requires an empty tree")
+        nodes = [None] * len(rows)
+        if not rows:
+            return nodes
+
+        max_depth = len(rows).bit_length() - 1
+        created = []
+        # (low, high, parent, is_left_child, depth)
+        stack = [(0, len(rows) - 1, self.nil, False, 0)]
+        while stack:
+            low, high, parent, is_left, depth = stack.pop()
+            mid = (low + high) // 2
+            book_id, title, author, availability_status, borrowed_by, on_hold = rows[mid]
+            node = Node(book_id, title, author, availability_status, self.queue_class)
+            node.borrowed_by = borrowed_by
+            node.on_hold = on_hold
+            node.color = "red" if depth == max_depth and depth > 0 else "black"
+            node.left = node.right = self.nil
+            node.parent = parent
+            self.mark_modified(node)
+            nodes[mid] = node
+            created.append(node)
+
+            if parent == self.nil:
+                self.root = node
+            elif is_left:
+                parent.left = node
+            else:
+                parent.right = node
+
+            if low < mid:
+                stack.append((low, mid - 1, node, True, depth + 1))
+            if mid < high:
+                stack.append((mid + 1, high, node, False, depth + 1))
+
+        # Parents were created before their children
+        for node in reversed(created):
+            self._recount(node)
+        self.min_node, self.max_node = nodes[0], nodes[-1]
+        return nodes
+
     def delete_book(self, book_id):
         """Delete a book and return list of cancelled reservations"""
         z = self.find_node(book_id)
         if not z:
             return []
+        self.node_cache.invalidate(book_id)
+        self.mark_modified()
         
         # Get all reservations from heap
         cancelled_reservations = []
@@ -246,7 +469,18 @@ class GatorLibrary:
                 break
             cancelled_reservations.append(reservation.patron_id)
         
-        # Perform the deletion
+        self._delete_node(z)
+        return cancelled_reservations
+
+    def _delete_node(self, z):
+        """Unlink node z from the tree and rebalance"""
+        # The neighbour of an extreme node is its only child or its parent
+        if z is self.max_node:
+            self.max_node = self._maximum(z.left) if z.left != self.nil else \
+                (z.parent if z.parent != self.nil else None)
+        if z is self.min_node:
+            self.min_node = self._minimum(z.right) if z.right != self.nil else \
+                (z.parent if z.parent != self.nil else None)
         y = z
         y_original_color = y.color
         
@@ -272,11 +506,15 @@ class GatorLibrary:
             y.left = z.left
             y.left.parent = y
             y.color = z.color
+            self._touch(y)
         
+        self._touch(x.parent)
+        # Every node whose subtree lost z lies on the path up from x
+        self._recount_path(x.parent)
         if y_original_color == "black":
             self._fix_delete(x)
-            
-        return cancelled_reservations
+        # The fixup may leave the sentinel pointing at a node, don't let it pin one
+        self.nil.parent = None
 
     def _fix_delete(self, x):
         """Fix Red-Black Tree violations after deletion"""
@@ -337,6 +575,205 @@ class GatorLibrary:
         
         self._change_color(x, "black")
 
+    def _black_height(self, node):
+        """Black nodes on the path from node down to a leaf, NIL excluded"""
+        height = 0
+        while node != self.nil:
+            if node.color == "black":
+                height += 1
+            node = node.left
+        return height
+
+    def _join(self, left, left_height, node, right, right_height):
+        """Join subtrees left < node < right into one, returns (root, black height).
+
+        The shorter subtree is hung off the spine of the taller one at the
+        first black node of equal black height, so the cost is O(difference
+        in black heights).
+        """
+        for root in (left, right):
+            if root != self.nil:
+                root.parent = self.nil
+        # Black roots keep the spine walk simple
+        if left != self.nil and self._change_color(left, "black"):
+            left_height += 1
+        if right != self.nil and self._change_color(right, "black"):
+            right_height += 1
+        self._touch(node)
+
+        if left_height == right_height:
+            node.left, node.right = left, right
+            node.parent = self.nil
+            node.color = "black"
+            for child in (left, right):
+                if child != self.nil:
+                    child.parent = node
+            self._recount(node)
+            return node, left_height + 1
+
+        taller_left = left_height > right_height
+        current, height = (left, left_height) if taller_left else (right, right_height)
+        target = right_height if taller_left else left_height
+        parent = self.nil
+        spine = []
+        while not (current.color == "black" and height == target):
+            if current.color == "black":
+                height -= 1
+            parent = current
+            spine.append(parent)
+            current = current.right if taller_left else current.left
+
+        node.color = "red"
+        node.parent = parent
+        if taller_left:
+            node.left, node.right = current, right
+            parent.right = node
+        else:
+            node.left, node.right = left, current
+            parent.left = node
+        for child in (node.left, node.right):
+            if child != self.nil:
+                child.parent = node
+        # Only the spine walked above gained books, so this stays O(height difference)
+        self._recount(node)
+        for ancestor in reversed(spine):
+            self._recount(ancestor)
+
+        self.root = left if taller_left else right
+        self._fix_red_red(node)
+        grew = self._change_color(self.root, "black")
+        return self.root, max(left_height, right_height) + grew
+
+    def _join_trees(self, left, left_height, right, right_height):
+        """Join subtrees with every id in left below every id in right"""
+        if right == self.nil:
+            return left, left_height
+        if left == self.nil:
+            return right, right_height
+        # Borrow the smallest node of right as the joining key
+        self.root = right
+        right.parent = self.nil
+        middle = self._minimum(right)
+        self._delete_node(middle)
+        right = self.root
+        return self._join(left, left_height, middle, right, self._black_height(right))
+
+    def _split(self, node, height, key, strict=False):
+        """Split the subtree at node by key, returns (left, left height, right, right height).
+
+        Books with id >= key (> key when strict) go right. Each level joins
+        one subtree back on, and those join costs telescope to O(log n).
+        """
+        if node == self.nil:
+            return self.nil, 0, self.nil, 0
+        left_child, right_child = node.left, node.right
+        child_height = height - 1 if node.color == "black" else height
+        if key < node.book_id or (key == node.book_id and not strict):
+            left, left_height, right, right_height = self._split(left_child, child_height, key, strict)
+            right, right_height = self._join(right, right_height, node, right_child, child_height)
+        else:
+            left, left_height, right, right_height = self._split(right_child, child_height, key, strict)
+            left, left_height = self._join(left_child, child_height, node, left, left_height)
+        return left, left_height, right, right_height
+
+    def _set_root(self, root):
+        self.root = root
+        if root != self.nil:
+            root.parent = self.nil
+        self.nil.parent = None
+        self._reset_bounds()
+        # Split, join and range deletes move or drop nodes in bulk
+        self.node_cache.clear()
+
+    def split(self, key):
+        """Move books with id >= key into a new tree and return it, O(log n).
+
+        The new tree shares this tree's NIL sentinel, so the two can be
+        joined back together but must be guarded by the same lock.
+        """
+        left, _, right, _ = self._split(self.root, self._black_height(self.root), key)
+        other = GatorLibrary(self.queue_class, self.node_cache.capacity)
+        other.nil = self.nil
+        self._set_root(left)
+        other._set_root(right)
+        self.mark_modified()
+        other.mark_modified()
+        return other
+
+    def join(self, other):
+        """Move every book of other into this tree, O(log n).
+
+        All of other's ids must be larger than this tree's and other must
+        have been split off this tree (the two share a sentinel).
+        """
+        if other.nil is not self.nil:
+            raise ValueError("Can only join trees split from this tree")
+        if self.max_node is not None and other.min_node is not None and \
+                self.max_node.book_id >= other.min_node.book_id:
+            raise ValueError("Joined tree must only hold larger book IDs")
+        root, _ = self._join_trees(
+            self.root, self._black_height(self.root),
+            other.root, other._black_height(other.root)
+        )
+        self._set_root(root)
+        other._set_root(other.nil)
+        self.mark_modified()
+        other.mark_modified()
+
+    def delete_range(self, min_id, max_id):
+        """Delete every book with min_id <= book_id <= max_id in O(log n + k).
+
+        The range is cut out with two splits and the remainder joined back,
+        so there is one rebalancing pass instead of one per book. Returns
+        {book_id: [cancelled patron ids]} for each removed book.
+        """
+        if min_id > max_id or self.root == self.nil:
+            return {}
+        left, left_height, rest, rest_height = self._split(self.root, self._black_height(self.root), min_id)
+        middle, _, right, right_height = self._split(rest, rest_height, max_id, strict=True)
+        root, _ = self._join_trees(left, left_height, right, right_height)
+        self._set_root(root)
+        self.mark_modified()
+
+        removed = {}
+        stack = [middle] if middle != self.nil else []
+        while stack:
+            node = stack.pop()
+            cancelled = []
+            while True:
+                reservation = node.reservation_heap.delete()
+                if not reservation:
+                    break
+                cancelled.append(reservation.patron_id)
+            removed[node.book_id] = cancelled
+            stack.extend(child for child in (node.left, node.right) if child != self.nil)
+        return dict(sorted(removed.items()))
+
+    def iter_inorder(self, min_id=None, max_id=None):
+        """Lazily yield nodes in book_id order, optionally bounded to [min_id, max_id].
+
+        Uses an explicit stack of at most O(log n) nodes and skips subtrees
+        outside the range. The tree must not be mutated while iterating.
+        """
+        stack = []
+        current = self.root
+        while stack or current != self.nil:
+            # Walk left, but only as far as the lower bound allows
+            while current != self.nil:
+                if min_id is not None and current.book_id < min_id:
+                    current = current.right
+                else:
+                    stack.append(current)
+                    current = current.left
+            if not stack:
+                return
+
+            node = stack.pop()
+            if max_id is not None and node.book_id > max_id:
+                return
+            yield node
+            current = node.right
+
     def find_closest_book(self, target_id):
         """Find the book with ID closest to target_id"""
         closest = None
@@ -359,6 +796,287 @@ class GatorLibrary:
         inorder_traverse(self.root)
         return closest
 
+    def count_available(self, min_id=None, max_id=None):
+        """Number of available books with min_id <= book_id <= max_id, O(log n)"""
+        if min_id is not None and max_id is not None and min_id > max_id:
+            return 0
+        total = self.root.available_count
+        if min_id is not None:
+            total -= self._count_available_beyond(min_id, below=True)
+        if max_id is not None:
+            total -= self._count_available_beyond(max_id, below=False)
+        return total
+
+    def _count_available_beyond(self, key, below):
+        """Available books with book_id < key (below) or > key"""
+        count = 0
+        node = self.root
+        while node != self.nil:
+            if (node.book_id < key) if below else (node.book_id > key):
+                outer = node.left if below else node.right
+                count += outer.available_count + (1 if node.availability_status == "Yes" else 0)
+                node = node.right if below else node.left
+            else:
+                node = node.left if below else node.right
+        return count
+
+    def _nearest_available(self, target_id, below):
+        """Available book with the largest id <= target_id (below) or smallest id >= target_id"""
+        node = self.root
+        # The answer so far: an available node, or a subtree holding it
+        best, in_subtree = None, False
+        while node != self.nil:
+            if (node.book_id <= target_id) if below else (node.book_id >= target_id):
+                inner = node.left if below else node.right
+                if node.availability_status == "Yes":
+                    best, in_subtree = node, False
+                elif inner.available_count:
+                    best, in_subtree = inner, True
+                node = node.right if below else node.left
+            else:
+                node = node.left if below else node.right
+
+        if not in_subtree:
+            return best
+        # Closest available book of that subtree is its extreme one
+        node = best
+        while True:
+            outer = node.right if below else node.left
+            if outer.available_count:
+                node = outer
+            elif node.availability_status == "Yes":
+                return node
+            else:
+                node = node.left if below else node.right
+
+    def find_closest_available(self, target_id):
+        """Available book with ID closest to target_id, ties go to the smaller ID, O(log n)"""
+        below = self._nearest_available(target_id, below=True)
+        above = self._nearest_available(target_id, below=False)
+        if below is None or above is None:
+            return below or above
+        return below if target_id - below.book_id <= above.book_id - target_id else above
+
+    def availability_stats(self):
+        """Catalog-wide book counts, O(1) from the root's subtree counts"""
+        return {
+            'books': self.root.size,
+            'available': self.root.available_count,
+            'unavailable': self.root.size - self.root.available_count,
+        }
+
+    def check_invariants(self, sample=None):
+        """Verify red-black, BST and reservation heap invariants.
+
+        With sample=None this is a single iterative O(n) pass over the whole
+        tree. Otherwise only the root-to-node paths of up to `sample` recently
+        mutated nodes are checked, at O(sample * log n) cost.
+        """
+        if sample is None:
+            mode = "full"
+            ok, message, checked = self._check_full()
+        else:
+            mode = "sampled"
+            ok, message, checked = self._check_sampled(sample)
+
+        if not ok:
+            self.invariant_violations += 1
+        self.last_invariant_check = {
+            'mode': mode,
+            'ok': ok,
+            'message': message,
+            'nodes_checked': checked,
+        }
+        return ok, message
+
+    def _check_root(self):
+        if self.nil.color != "black":
+            return False, "Sentinel NIL node is not black"
+        if self.nil.size or self.nil.available_count:
+            return False, "Sentinel NIL node has non-zero counts"
+        if self.root != self.nil:
+            if self.root.color != "black":
+                return False, f"Root {self.root.book_id} is not black"
+            if self.root.parent != self.nil:
+                return False, f"Root {self.root.book_id} has a parent"
+            if self.min_node is not self._minimum(self.root) or self.max_node is not self._maximum(self.root):
+                return False, "Minimum or maximum pointer is stale"
+        elif self.min_node is not None or self.max_node is not None:
+            return False, "Empty tree has a minimum or maximum pointer"
+        return True, ""
+
+    def _check_children(self, node):
+        """Check parent pointers, subtree counts and red-red violations below node"""
+        available = 1 if node.availability_status == "Yes" else 0
+        if node.size != node.left.size + node.right.size + 1 or \
+                node.available_count != node.left.available_count + node.right.available_count + available:
+            return False, f"Subtree counts of book {node.book_id} are stale"
+        for child in (node.left, node.right):
+            if child == self.nil:
+                continue
+            if child.parent != node:
+                return False, f"Incorrect parent pointer for child {child.book_id} of {node.book_id}"
+            if node.color == "red" and child.color == "red":
+                return False, f"Red node {node.book_id} has red child {child.book_id}"
+        return True, ""
+
+    def _check_full(self):
+        ok, message = self._check_root()
+        if not ok:
+            return False, message, 0
+        if self.root == self.nil:
+            return True, "Tree is empty", 0
+
+        black_height = None
+        checked = 0
+        # (node, exclusive lower bound, exclusive upper bound, black nodes above)
+        stack = [(self.root, None, None, 0)]
+        while stack:
+            node, low, high, blacks = stack.pop()
+            checked += 1
+
+            if (low is not None and node.book_id <= low) or (high is not None and node.book_id >= high):
+                return False, f"BST order violated at book {node.book_id}", checked
+            if node.color == "black":
+                blacks += 1
+            elif node.color != "red":
+                return False, f"Book {node.book_id} has invalid color {node.color}", checked
+
+            ok, message = self._check_children(node)
+            if not ok:
+                return False, message, checked
+            ok, message = node.reservation_heap.check_invariants()
+            if not ok:
+                return False, f"Book {node.book_id}: {message}", checked
+
+            for child, child_low, child_high in ((node.left, low, node.book_id), (node.right, node.book_id, high)):
+                if child != self.nil:
+                    stack.append((child, child_low, child_high, blacks))
+                elif black_height is None:
+                    black_height = blacks
+                elif blacks != black_height:
+                    return False, f"Black height {blacks} below book {node.book_id} differs from {black_height}", checked
+
+        return True, f"All invariants hold ({checked} nodes, black height {black_height})", checked
+
+    def _check_sampled(self, sample):
+        ok, message = self._check_root()
+        if not ok:
+            return False, message, 0
+
+        # Reference black height along the leftmost path
+        black_height = 0
+        node = self.root
+        while node != self.nil:
+            if node.color == "black":
+                black_height += 1
+            node = node.left
+
+        checked = 0
+        paths = 0
+        seen = set()
+        while self.touched and paths < sample:
+            node = self.touched.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            paths += 1
+            ok, message, path_checked = self._check_path(node, black_height)
+            checked += path_checked
+            if not ok:
+                return False, message, checked
+
+        return True, f"Sampled invariants hold ({paths} paths, {checked} nodes)", checked
+
+    def _check_path(self, target, black_height):
+        """Check every node on the root-to-target path and one leaf below it"""
+        current = self.root
+        low = high = None
+        blacks = 0
+        checked = 0
+        while current != self.nil:
+            checked += 1
+            if (low is not None and current.book_id <= low) or (high is not None and current.book_id >= high):
+                return False, f"BST order violated at book {current.book_id}", checked
+            if current.color == "black":
+                blacks += 1
+            ok, message = self._check_children(current)
+            if not ok:
+                return False, message, checked
+            if current is target:
+                break
+            if target.book_id < current.book_id:
+                high = current.book_id
+                current = current.left
+            else:
+                low = current.book_id
+                current = current.right
+        else:
+            # Node has since been deleted
+            return True, "", checked
+
+        ok, message = current.reservation_heap.check_invariants()
+        if not ok:
+            return False, f"Book {current.book_id}: {message}", checked
+
+        # Extend the path to a leaf so its black height can be compared
+        node = current.left
+        while node != self.nil:
+            checked += 1
+            if node.color == "black":
+                blacks += 1
+            node = node.left
+        if blacks != black_height:
+            return False, f"Black height {blacks} through book {target.book_id} differs from {black_height}", checked
+        return True, "", checked
+
+    def memory_usage(self):
+        """Structural size accounting of the tree in bytes, O(n).
+
+        Sizes come from sys.getsizeof, so they cover the objects the tree
+        owns but not allocator overhead. Strings shared between books (or
+        interned, like the status values) are only counted once. Nodes that
+        are still referenced from the sentinel or the touched-path buffer
+        but are no longer in the tree are reported as detached.
+        """
+        usage = {
+            'books': 0,
+            'nodes': 0,
+            'strings': 0,
+            'heaps': 0,
+            'reservations': 0,
+            'sentinel': instance_size(self.nil) + self.nil.reservation_heap.memory_usage()['heap'],
+            'reservation_count': 0,
+            'heap_occupancy': [0] * (HEAP_SIZE + 1),
+            'stale_heap_slots': 0,
+        }
+        strings = set()
+        for node in self.iter_inorder():
+            usage['books'] += 1
+            usage['nodes'] += instance_size(node) + sys.getsizeof(node.book_id)
+            for value in (node.title, node.author, node.availability_status):
+                if isinstance(value, str) and id(value) not in strings:
+                    strings.add(id(value))
+                    usage['strings'] += sys.getsizeof(value)
+            heap = node.reservation_heap.memory_usage()
+            usage['heaps'] += heap['heap']
+            usage['reservations'] += heap['entries']
+            usage['stale_heap_slots'] += heap['stale_slots']
+            usage['reservation_count'] += node.reservation_heap.get_size()
+            usage['heap_occupancy'][node.reservation_heap.get_size()] += 1
+
+        referenced = {id(node): node for node in list(self.touched) + [self.nil.parent] if node is not None}
+        usage['detached_nodes'] = sum(
+            1 for node in referenced.values()
+            if node != self.nil and self._search(node.book_id) is not node
+        )
+        usage['total'] = sum(usage[key] for key in ('nodes', 'strings', 'heaps', 'reservations', 'sentinel'))
+        return usage
+
+    def node_cache_stats(self):
+        """Hit, miss and eviction counts of the find_node cache"""
+        return self.node_cache.stats()
+
     def get_color_flip_count(self):
         """Return the total number of color flips performed"""
         return self.color_flip_count
\ No newline at end of file
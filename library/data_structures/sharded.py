@@ -0,0 +1,227 @@
+import heapq
+import threading
+import uuid
+from operator import attrgetter
+
+from .rb_tree import GatorLibrary
+
+
+class ShardedLibrary:
+    """A catalog split across independent GatorLibrary shards by book_id modulo.
+
+    Book book_id lives in shard book_id % len(shards). Routing by residue
+    rather than by id range keeps sequential AutoField ids spread evenly, so
+    new books do not all land in (and contend on) one shard. Every shard has
+    its own lock, so operations on books in different shards do not contend.
+    Ordered queries merge the shards' answers. The public interface mirrors
+    GatorLibrary, so the manager can use either.
+    """
+    def __init__(self, shards):
+        if isinstance(shards, int):
+            shards = [GatorLibrary() for _ in range(shards)]
+        self.shards = list(shards)
+        if not self.shards:
+            raise ValueError("Need at least one shard")
+        self.locks = [threading.RLock() for _ in self.shards]
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def shard_index(self, book_id):
+        return book_id % len(self.shards)
+
+    def _shard(self, book_id):
+        idx = self.shard_index(book_id)
+        return self.shards[idx], self.locks[idx]
+
+    @property
+    def version(self):
+        # Shard versions only move forward, so their sum does too
+        return sum(shard.version for shard in self.shards)
+
+    def mark_modified(self, node=None):
+        if node is None:
+            self.shards[-1].mark_modified()
+            return self.version
+        shard, lock = self._shard(node.book_id)
+        with lock:
+            shard.mark_modified(node)
+        return self.version
+
+    def insert_book(self, book_id, title, author, availability_status="Yes"):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.insert_book(book_id, title, author, availability_status)
+
+    def find_node(self, book_id):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.find_node(book_id)
+
+    def _search(self, book_id):
+        """find_node without the shard's node cache, see OverlayLibrary"""
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard._search(book_id)
+
+    def writable_node(self, book_id):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.writable_node(book_id)
+
+    def borrow_book(self, patron_id, book_id, priority=1, node=None, time_of_reservation=None):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.borrow_book(patron_id, book_id, priority, node=node, time_of_reservation=time_of_reservation)
+
+    def return_book(self, patron_id, book_id, node=None):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.return_book(patron_id, book_id, node=node)
+
+    def expire_hold(self, book_id, node=None):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.expire_hold(book_id, node=node)
+
+    def sync_status(self, node, availability_status, borrowed_by, on_hold=False):
+        shard, lock = self._shard(node.book_id)
+        with lock:
+            shard.sync_status(node, availability_status, borrowed_by, on_hold)
+
+    def delete_book(self, book_id):
+        shard, lock = self._shard(book_id)
+        with lock:
+            return shard.delete_book(book_id)
+
+    def delete_range(self, min_id, max_id):
+        removed = {}
+        if min_id > max_id:
+            return removed
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                removed.update(shard.delete_range(min_id, max_id))
+        # Keep book_id order, as a single tree returns it
+        return dict(sorted(removed.items()))
+
+    def iter_inorder(self, min_id=None, max_id=None):
+        """Yield nodes in book_id order, merging the shards' in-order walks"""
+        return heapq.merge(
+            *(shard.iter_inorder(min_id, max_id) for shard in self.shards),
+            key=attrgetter('book_id')
+        )
+
+    def _closest(self, candidates, target_id):
+        candidates = [node for node in candidates if node is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda node: (abs(node.book_id - target_id), node.book_id))
+
+    def min(self):
+        """Smallest of the shards' minimum books, O(shards)"""
+        nodes = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                nodes.append(shard.min_node)
+        nodes = [node for node in nodes if node is not None]
+        return min(nodes, key=attrgetter('book_id')) if nodes else None
+
+    def max(self):
+        """Largest of the shards' maximum books, O(shards)"""
+        nodes = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                nodes.append(shard.max_node)
+        nodes = [node for node in nodes if node is not None]
+        return max(nodes, key=attrgetter('book_id')) if nodes else None
+
+    def find_closest_book(self, target_id):
+        """Find the book with ID closest to target_id, ties go to the smaller ID.
+
+        Neighbouring ids live in different shards, so every shard answers
+        and the closest of their answers wins, O(shards * log n).
+        """
+        candidates = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                candidates.append(shard.find_closest_book(target_id))
+        return self._closest(candidates, target_id)
+
+    def find_closest_available(self, target_id):
+        """Closest available book across shards, ties go to the smaller ID"""
+        candidates = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                candidates.append(shard.find_closest_available(target_id))
+        return self._closest(candidates, target_id)
+
+    def count_available(self, min_id=None, max_id=None):
+        if min_id is not None and max_id is not None and min_id > max_id:
+            return 0
+        return sum(shard.count_available(min_id, max_id) for shard in self.shards)
+
+    def availability_stats(self):
+        stats = [shard.availability_stats() for shard in self.shards]
+        return {key: sum(entry[key] for entry in stats) for key in stats[0]}
+
+    def check_invariants(self, sample=None):
+        """Check every shard and that no node lies in the wrong shard.
+
+        A full check looks at every node's residue, a sampled one only at
+        each shard's smallest and largest book.
+        """
+        ok, message = True, ""
+        for idx, (shard, lock) in enumerate(zip(self.shards, self.locks)):
+            with lock:
+                ok, message = shard.check_invariants(sample)
+                if ok and shard.root != shard.nil:
+                    nodes = shard.iter_inorder() if sample is None else (shard.min_node, shard.max_node)
+                    if any(self.shard_index(node.book_id) != idx for node in nodes):
+                        ok, message = False, f"Shard {idx} holds books of another shard"
+                        shard.invariant_violations += 1
+            if not ok:
+                return False, f"Shard {idx}: {message}"
+        return True, f"All invariants hold across {len(self.shards)} shards"
+
+    @property
+    def last_invariant_check(self):
+        checks = [shard.last_invariant_check for shard in self.shards]
+        if any(check is None for check in checks):
+            return None
+        failed = [check for check in checks if not check['ok']]
+        return {
+            'mode': checks[0]['mode'],
+            'ok': not failed,
+            'message': failed[0]['message'] if failed else f"All invariants hold across {len(checks)} shards",
+            'nodes_checked': sum(check['nodes_checked'] for check in checks),
+        }
+
+    @property
+    def invariant_violations(self):
+        return sum(shard.invariant_violations for shard in self.shards)
+
+    def memory_usage(self):
+        """Sum of the shards' memory_usage reports"""
+        total = None
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                usage = shard.memory_usage()
+            if total is None:
+                total = usage
+                continue
+            for key, value in usage.items():
+                if key == 'heap_occupancy':
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+        total['shards'] = len(self.shards)
+        return total
+
+    def node_cache_stats(self):
+        """The shards' node cache counters added up"""
+        stats = [shard.node_cache_stats() for shard in self.shards]
+        total = {key: sum(entry[key] for entry in stats) for key in stats[0] if key != 'hit_rate'}
+        lookups = total['hits'] + total['misses']
+        total['hit_rate'] = total['hits'] / lookups if lookups else 0.0
+        return total
+
+    def get_color_flip_count(self):
+        return sum(shard.get_color_flip_count() for shard in self.shards)
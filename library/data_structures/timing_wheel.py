@@ -0,0 +1,103 @@
+import heapq
+import math
+
+TICK_SECONDS = 60
+SLOT_COUNT = 512
+
+class TimingWheel:
+    """Hashed timing wheel for deadline-based expiry.
+
+    Deadlines inside the wheel horizon live in the slot for their tick.
+    Deadlines further out wait in an overflow min-heap and cascade into
+    the wheel as it turns, so each advance only touches expired entries.
+    """
+    def __init__(self, tick_seconds=TICK_SECONDS, slot_count=SLOT_COUNT, start_time=0):
+        self.tick_seconds = tick_seconds
+        self.slot_count = slot_count
+        self.slots = [{} for _ in range(slot_count)]
+        self.current_tick = int(start_time // tick_seconds)
+        self.overflow = []  # (tick, seq, key) with lazy cancellation
+        self.entries = {}  # key -> (tick, seq)
+        self.wheel_count = 0
+        self._seq = 0
+
+    def _deadline_tick(self, deadline):
+        """Tick at which a deadline has definitely passed"""
+        tick = math.ceil(deadline / self.tick_seconds)
+        # Anything already due fires on the next advance
+        return max(tick, self.current_tick + 1)
+
+    def _place(self, key, tick, seq):
+        if tick - self.current_tick <= self.slot_count:
+            self.slots[tick % self.slot_count][key] = seq
+            self.wheel_count += 1
+        else:
+            heapq.heappush(self.overflow, (tick, seq, key))
+
+    def schedule(self, key, deadline):
+        """Schedule key to expire at deadline, replacing any earlier deadline"""
+        self.cancel(key)
+        self._seq += 1
+        tick = self._deadline_tick(deadline)
+        self.entries[key] = (tick, self._seq)
+        self._place(key, tick, self._seq)
+
+    def cancel(self, key):
+        """Cancel a pending deadline, returns True if one existed"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        tick, _ = entry
+        if self.slots[tick % self.slot_count].pop(key, None) is not None:
+            self.wheel_count -= 1
+        # Overflow entries are skipped lazily once their key is gone
+        return True
+
+    def _cascade(self):
+        """Move overflow entries that now fall inside the horizon"""
+        horizon = self.current_tick + self.slot_count
+        while self.overflow and self.overflow[0][0] <= horizon:
+            tick, seq, key = heapq.heappop(self.overflow)
+            if self.entries.get(key) == (tick, seq):
+                self._place(key, tick, seq)
+
+    def advance(self, now):
+        """Advance the wheel to now and return expired keys in tick order"""
+        target = int(now // self.tick_seconds)
+        expired = []
+        while self.current_tick < target:
+            if self.wheel_count == 0:
+                # Nothing in the wheel - jump straight to the next overflow tick
+                next_tick = self._next_overflow_tick()
+                if next_tick is None or next_tick > target:
+                    self.current_tick = target
+                    break
+                self.current_tick = max(self.current_tick, next_tick - self.slot_count)
+                self._cascade()
+                continue
+
+            self.current_tick += 1
+            slot = self.slots[self.current_tick % self.slot_count]
+            if slot:
+                for key in slot:
+                    del self.entries[key]
+                    expired.append(key)
+                self.wheel_count -= len(slot)
+                slot.clear()
+            self._cascade()
+        return expired
+
+    def _next_overflow_tick(self):
+        while self.overflow:
+            tick, seq, key = self.overflow[0]
+            if self.entries.get(key) == (tick, seq):
+                return tick
+            heapq.heappop(self.overflow)
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
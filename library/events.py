@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+
+class Subscription:
+    """One listener's bounded event queue, owned by the event loop that created it"""
+    __slots__ = ('broker', 'book_id', 'loop', 'queue')
+
+    def __init__(self, broker, book_id, loop, maxsize):
+        self.broker = broker
+        self.book_id = book_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event):
+        """Hand an event to the subscriber's loop, safe to call from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop has shut down without unsubscribing
+            self.broker.unsubscribe(self)
+
+    def _put(self, event):
+        if self.queue.full():
+            # A slow reader loses the oldest events, every event carries the full state
+            self.queue.get_nowait()
+            self.broker.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """In-process publish/subscribe of per-book events.
+
+    Publishers are ordinary synchronous code (views, the scheduler, the
+    change feed); subscribers are coroutines, typically SSE responses. An
+    idle subscriber costs one Subscription and one asyncio.Queue, and
+    publishing to a book nobody watches is a dict lookup.
+    """
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or getattr(settings, 'GATOR_EVENT_QUEUE_SIZE', 32)
+        self._lock = threading.Lock()
+        self._subscribers = {}  # book_id -> set of Subscription
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, book_id):
+        """Subscribe the running event loop to a book's events"""
+        subscription = Subscription(self, book_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(book_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.book_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.book_id]
+
+    def watching(self, book_id):
+        return book_id in self._subscribers
+
+    def publish(self, book_id, kind, **data):
+        """Send an event to every subscriber of book_id, returns how many were notified"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(book_id, ()))
+        if not subscribers:
+            return 0
+        event = dict(data, type=kind, book_id=book_id)
+        for subscription in subscribers:
+            subscription.deliver(event)
+        self.published += 1
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'books_watched': len(self._subscribers),
+                'subscribers': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'published': self.published,
+                'dropped': self.dropped,
+            }
+
+
+def format_sse(kind, data):
+    """Encode one server-sent event"""
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
@@ -4,12 +4,18 @@ from .models import Book, Reservation
 class BookForm(forms.ModelForm):
     class Meta:
         model = Book
-        fields = ['title', 'author']
+        fields = ['title', 'author', 'branch']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'author': forms.TextInput(attrs={'class': 'form-control'}),
+            'branch': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Books added without a branch go to DEFAULT_BRANCH
+        self.fields['branch'].required = False
+
 class ReservationForm(forms.ModelForm):
     class Meta:
         model = Reservation
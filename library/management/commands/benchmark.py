@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run in-process micro benchmarks of the library's data structures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default all): {', '.join(BENCHMARKS)}")
+        parser.add_argument('--rounds', type=int, help="Workload size per benchmark (default each benchmark's own)")
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+        for name in names:
+            self.stdout.write(f"== {name}")
+            kwargs = {'seed': options['seed']}
+            if options['rounds'] is not None:
+                kwargs['rounds'] = options['rounds']
+            for row in BENCHMARKS[name](**kwargs):
+                cells = [
+                    f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in row.items()
+                ]
+                self.stdout.write("  " + "  ".join(cells))
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from library.managers import gator_library
+from library.models import Book
+from library.replication import ReplicaEmulator
+from library.routers import replica_aliases
+from library.workload import (
+    PERCENTILES, ReplayDriver, WorkloadGenerator, read_workload, write_workload
+)
+
+PATRON_PREFIX = 'loadtest_patron_'
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic workload and replay it against the app in-process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=10000, help='Operations to generate')
+        parser.add_argument('--books', type=int, default=1000, help='Initial catalog size')
+        parser.add_argument('--patrons', type=int, default=50, help='Number of patron accounts')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generator')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for book popularity')
+        parser.add_argument('--clients', type=int, default=1, help='Concurrent client threads')
+        parser.add_argument('--workload', help='Replay operations from this JSONL file instead of generating')
+        parser.add_argument('--save-workload', help='Write the generated operations to this JSONL file')
+        parser.add_argument('--generate-only', action='store_true', help='Only write the workload, do not replay')
+        parser.add_argument('--migrate', action='store_true', help='Run migrations before seeding')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Allow deleting every book of a database not set up by the load test settings'
+        )
+        parser.add_argument(
+            '--replica-interval', type=float, default=0.5,
+            help='With SQLite replicas configured, copy the primary into them every this many seconds'
+        )
+
+    def handle(self, *args, **options):
+        if options['workload']:
+            ops = list(read_workload(options['workload']))
+        else:
+            generator = WorkloadGenerator(
+                books=options['books'],
+                patrons=options['patrons'],
+                seed=options['seed'],
+                zipf_s=options['zipf'],
+            )
+            ops = list(generator.generate(options['ops']))
+        if options['save_workload']:
+            write_workload(ops, options['save_workload'])
+            self.stdout.write(f"Wrote {len(ops)} operations to {options['save_workload']}")
+        if options['generate_only']:
+            return
+        if not ops:
+            raise CommandError("Workload is empty")
+        if not options['reset'] and not self._scratch_database():
+            raise CommandError(
+                "The load test deletes every book before seeding. Run it with "
+                "--settings=gator_library.settings_loadtest, or pass --reset to wipe this database"
+            )
+
+        if options['migrate']:
+            call_command('migrate', verbosity=0)
+        patron_ids, book_id_map = self._seed(options['patrons'], options['books'])
+
+        emulator = None
+        if replica_aliases():
+            # Replicas start from the seeded catalog and then lag behind
+            emulator = ReplicaEmulator(options['replica_interval'])
+            emulator.sync()
+            emulator.start()
+            self.stdout.write(f"Copying the primary to {len(emulator.replicas)} replicas every {emulator.interval}s")
+
+        self.stdout.write(f"Replaying {len(ops)} operations with {options['clients']} client(s)")
+        driver = ReplayDriver(patron_ids, book_id_map, clients=options['clients'])
+        try:
+            result = driver.run(ops)
+        finally:
+            if emulator is not None:
+                emulator.stop()
+        self._report(result)
+
+    @staticmethod
+    def _scratch_database():
+        from django.db import connection
+        return getattr(settings, 'GATOR_LOADTEST_SCRATCH_DB', False) and connection.vendor == 'sqlite'
+
+    def _seed(self, patrons, books):
+        """Create patron accounts and a fresh catalog, then rebuild the tree"""
+        patron_ids = []
+        for i in range(patrons):
+            user, _ = User.objects.get_or_create(username=f"{PATRON_PREFIX}{i}")
+            patron_ids.append(user.id)
+
+        Book.objects.all().delete()
+        created = Book.objects.bulk_create(
+            Book(title=f"Book {i}", author=f"Author {i % 97}") for i in range(1, books + 1)
+        )
+        # bulk_create skips post_save, so load the tree straight from the table
+        gator_library.reload()
+        book_id_map = {i: book.book_id for i, book in enumerate(created, 1)}
+        if len(book_id_map) != books or None in book_id_map.values():
+            ids = Book.objects.order_by('book_id').values_list('book_id', flat=True)
+            book_id_map = dict(enumerate(ids, 1))
+        return patron_ids, book_id_map
+
+    def _report(self, result):
+        total = result.total_ops()
+        self.stdout.write(
+            f"{total} operations in {result.elapsed:.2f}s "
+            f"({total / result.elapsed:.1f} ops/s), {result.skipped} skipped"
+        )
+        header = f"{'op':<10}{'count':>8}{'errors':>8}{'rerender':>10}{'ops/s':>10}" + "".join(
+            f"{f'p{p} ms':>10}" for p in PERCENTILES
+        )
+        self.stdout.write(header)
+        for row in result.summary():
+            self.stdout.write(
+                f"{row['op']:<10}{row['count']:>8}{row['errors']:>8}{row['rerendered']:>10}{row['ops_per_sec']:>10.1f}" + "".join(
+                    f"{row[f'p{p}']:>10.2f}" for p in PERCENTILES
+                )
+            )
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = "Delete change log entries that every worker has long since applied"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Keep entries newer than this many hours')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(f"Deleted {deleted} change log entries older than {options['hours']} hours")
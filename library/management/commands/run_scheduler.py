@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.changefeed import feed_enabled
+from library.managers import gator_library
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire unclaimed holds and flag overdue loans. Runs in its own process with its "
+        "own tree, so it needs GATOR_CHANGE_FEED for the web workers to see its expiries"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Seconds between ticks (defaults to GATOR_SCHEDULER_TICK_SECONDS)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single tick and exit'
+        )
+
+    def handle(self, *args, **options):
+        if not feed_enabled():
+            # Expiries would only reach this process's copy of the tree
+            raise CommandError(
+                "run_scheduler needs GATOR_CHANGE_FEED = True, or set GATOR_SCHEDULER_THREAD = True "
+                "to expire holds inside each web worker instead"
+            )
+        scheduler = gator_library.scheduler
+        interval = options['interval'] or scheduler.wheel.tick_seconds
+
+        while True:
+            # Learn about loans and holds made by the web workers
+            gator_library.sync()
+            expired_holds, new_overdue = scheduler.tick()
+            for book_id in expired_holds:
+                self.stdout.write(f"Hold expired for book {book_id}")
+            for book_id in new_overdue:
+                self.stdout.write(f"Loan overdue for book {book_id}")
+            if options['once']:
+                break
+            time.sleep(interval)
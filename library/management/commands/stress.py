@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.stress import ENGINES, StressFailure, StressRun, run_trace, shrink_trace
+
+
+class Command(BaseCommand):
+    help = "Differential stress test of the tree engines against a sorted-list reference model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=1000000, help='Operations per engine')
+        parser.add_argument('--engine', choices=sorted(ENGINES) + ['all'], default='all', help='Engine to test')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generator')
+        parser.add_argument('--id-space', type=int, default=2000, help='Book ids are drawn from 1..id-space')
+        parser.add_argument('--check-every', type=int, default=10000, help='Operations between full invariant checks')
+        parser.add_argument('--replay', help='Replay a JSON trace written by --save-failure instead of generating')
+        parser.add_argument('--save-failure', default='stress_failure.json', help='Where to write a shrunk failing trace')
+        parser.add_argument('--no-shrink', action='store_true', help='Report failures without shrinking the trace')
+
+    def handle(self, *args, **options):
+        engines = sorted(ENGINES) if options['engine'] == 'all' else [options['engine']]
+        for engine in engines:
+            if options['replay']:
+                with open(options['replay']) as f:
+                    trace = json.load(f)
+                try:
+                    run_trace(trace, ENGINES[engine], check_every=1)
+                except StressFailure as failure:
+                    raise CommandError(f"{engine}: {failure}")
+                self.stdout.write(f"{engine}: {len(trace)} operations replayed, no disagreement")
+                continue
+
+            run = StressRun(engine, seed=options['seed'], id_space=options['id_space'], check_every=options['check_every'])
+            try:
+                run.run(options['ops'])
+            except StressFailure as failure:
+                self._report_failure(engine, failure, options)
+            total = sum(run.counts.values())
+            self.stdout.write(
+                f"{engine}: {total} operations in {run.elapsed:.2f}s "
+                f"({run.ops_per_sec():.0f} ops/s), {run.checks} full invariant checks"
+            )
+            self.stdout.write("  " + "  ".join(f"{op}={count}" for op, count in sorted(run.counts.items())))
+
+    def _report_failure(self, engine, failure, options):
+        self.stdout.write(f"{engine}: {failure}")
+        trace = failure.trace
+        if not options['no_shrink']:
+            self.stdout.write(f"Shrinking a trace of {len(trace)} operations...")
+            trace = shrink_trace(trace, ENGINES[engine])
+            self.stdout.write(f"Minimal reproduction ({len(trace)} operations):")
+            for op in trace:
+                self.stdout.write("  " + json.dumps(op))
+        with open(options['save_failure'], 'w') as f:
+            json.dump(trace, f, indent=1)
+        raise CommandError(
+            f"{engine} disagreed with the reference model, replay with --engine {engine} --replay {options['save_failure']}"
+        )
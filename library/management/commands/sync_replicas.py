@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.replication import ReplicaEmulator
+
+
+class Command(BaseCommand):
+    help = "Copy the SQLite primary into the SQLite replica files, once or every --interval seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Keep copying every this many seconds (0 copies once)')
+
+    def handle(self, *args, **options):
+        try:
+            emulator = ReplicaEmulator(options['interval'] or 1.0)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not emulator.replicas:
+            raise CommandError("No replicas configured in GATOR_DB_REPLICAS")
+        emulator.sync()
+        self.stdout.write(f"Copied {emulator.primary} to {', '.join(emulator.replicas)}")
+        if not options['interval']:
+            return
+        emulator.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            emulator.stop()
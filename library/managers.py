@@ -1,98 +1,709 @@
+import gc
+import marshal
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .changefeed import ChangeFeed
+from .events import EventBroker
+from .routers import use_primary
+from .write_behind import WriteBehindQueue
+
+# Set in shard loader processes, which must release their own connections
+_in_shard_worker = False
+
+
+def _init_shard_worker():
+    global _in_shard_worker
+    _in_shard_worker = True
+
+
+@use_primary()
+def _load_shard_rows(shard=0, shards=1, branch=None):
+    """Read the books with book_id % shards == shard, sorted, as marshal-encoded rows.
+
+    Rows are plain (book_id, title, author, availability_status, borrowed_by,
+    hold_expires_at, due_at) tuples with timestamps as floats, which is far
+    cheaper to ship back from a worker process than pickled tree nodes.
+    """
+    from django.db import connections
+    from django.db.models.functions import Mod
+    from .models import Book
+    books = Book.objects.order_by('book_id')
+    if branch is not None:
+        books = books.filter(branch=branch)
+    if shards > 1:
+        books = books.annotate(shard=Mod('book_id', shards)).filter(shard=shard)
+    try:
+        rows = tuple(
+            (book_id, title, author, status, borrowed_by,
+             hold_expires_at.timestamp() if hold_expires_at else None,
+             due_at.timestamp() if due_at else None)
+            for book_id, title, author, status, borrowed_by, hold_expires_at, due_at in books.values_list(
+                'book_id', 'title', 'author', 'availability_status', 'borrowed_by_id', 'hold_expires_at', 'due_at'
+            ).iterator()
+        )
+    finally:
+        if _in_shard_worker:
+            connections.close_all()
+    return marshal.dumps(rows)
+
+
 class GatorLibraryManager:
-    def __init__(self):
+    def __init__(self, clock=time.time, shards=None, shard_workers=None, write_behind=None):
         print("Initializing GatorLibraryManager")
+        from .scheduler import LibraryScheduler
         self.rb_tree = None
+        # Held by every change to the tree, from request threads, the
+        # scheduler thread, the signal flush and the change feed alike
+        self.tree_lock = threading.RLock()
+        self.invariant_sample_paths = getattr(settings, 'GATOR_INVARIANT_SAMPLE_PATHS', 0)
+        self.shards = shards or getattr(settings, 'GATOR_SHARDS', 1)
+        self.shard_workers = shard_workers or getattr(settings, 'GATOR_SHARD_WORKERS', 1)
+        self.scheduler = LibraryScheduler(self, clock=clock)
+        # Tags this worker's change log entries so its own feed skips them
+        self.origin = uuid.uuid4().hex
+        self.change_feed = ChangeFeed(self, clock=clock)
+        # Allocation, availability and queue events for live subscribers
+        self.events = EventBroker()
+        # Optional queue of Book row writes flushed in the background
+        if write_behind is None:
+            write_behind = getattr(settings, 'GATOR_WRITE_BEHIND', False)
+        if write_behind is True:
+            write_behind = WriteBehindQueue(self)
+        self.write_behind = write_behind or None
+        self.popularity = None
+        self.memory_budget = getattr(settings, 'GATOR_BRANCH_MEMORY_BUDGET', None)
+        self.branch_idle_seconds = getattr(settings, 'GATOR_BRANCH_IDLE_SECONDS', 60)
         self._initialize_tree()
 
+    def reload(self):
+        """Rebuild the RB tree and scheduler from the database"""
+        from .scheduler import LibraryScheduler
+        if self.write_behind is not None:
+            # The table must hold every queued change before it is reloaded
+            self.write_behind.barrier()
+        self.scheduler = LibraryScheduler(self, clock=self.scheduler.clock)
+        with self.tree_lock:
+            self._initialize_tree()
+
+    @use_primary()
     def _initialize_tree(self):
+        """Set up the per-branch tree registry and load the default branch.
+
+        One pass over (book_id, branch, status, deadlines) fills the
+        registry's directory and availability counts and registers every
+        outstanding deadline, so the other branches only need to be built
+        when one of their books is first used.
+        """
         print("Initializing RB tree")
+        # Changes committed while loading are replayed by the next poll
+        self.change_feed.prime()
+        from django.db import DatabaseError
+        from .data_structures.branched import BranchedLibrary
+        from .models import DEFAULT_BRANCH, Book
+        directory = {}
+        summaries = {}
+        self.popularity = self._popularity_tracker()
+        self.rb_tree = BranchedLibrary(
+            self._load_branch,
+            default_branch=DEFAULT_BRANCH,
+            memory_budget=self.memory_budget,
+            min_idle_seconds=self.branch_idle_seconds,
+            busy=self._has_queued_writes
+        )
+        try:
+            rows = Book.objects.values_list(
+                'book_id', 'branch', 'availability_status', 'hold_expires_at', 'due_at'
+            ).order_by().iterator()
+            for book_id, branch, status, hold_expires_at, due_at in rows:
+                branch = directory[book_id] = sys.intern(branch)
+                summary = summaries.setdefault(
+                    branch, {'books': 0, 'available': 0, 'unavailable': 0, 'min_id': book_id, 'max_id': book_id}
+                )
+                summary['books'] += 1
+                summary['available' if status == "Yes" else 'unavailable'] += 1
+                summary['min_id'] = min(summary['min_id'], book_id)
+                summary['max_id'] = max(summary['max_id'], book_id)
+                self._register_deadlines(
+                    book_id,
+                    hold_expires_at.timestamp() if hold_expires_at else None,
+                    due_at.timestamp() if due_at else None
+                )
+        except DatabaseError as e:
+            # Fresh database that has not been migrated yet
+            print(f"Book table not available ({e}), starting with an empty RB tree")
+            return
+        self.rb_tree.directory = directory
+        self.rb_tree.summaries = summaries
+        self._load_popularity()
+        print(f"Found {len(directory)} books in {len(summaries)} branches")
+        self.rb_tree.tree(DEFAULT_BRANCH)
+
+    @use_primary()
+    def _load_branch(self, branch):
+        """Bulk build one branch's tree (sharded when GATOR_SHARDS > 1) from its rows"""
         from .data_structures.rb_tree import GatorLibrary
-        self.rb_tree = GatorLibrary()
-        # Load existing books from database into RB tree
-        from .models import Book
-        books = Book.objects.all()
-        print(f"Loading {books.count()} books from database into RB tree")
-        for book in books:
-            print(f"Inserting book {book.book_id}: {book.title}")
-            self.rb_tree.insert_book(
-                book.book_id,
-                book.title,
-                book.author,
-                book.availability_status
-            )
+        from .data_structures.sharded import ShardedLibrary
+        queue_class = self._queue_class()
+        cache_size = getattr(settings, 'GATOR_NODE_CACHE_SIZE', 1024)
 
-    def insert_book(self, title, author):
-        """Insert a new book into the RB tree and database"""
-        from .models import Book
+        payloads = self._load_rows(max(1, self.shards), branch)
+        trees = [GatorLibrary(queue_class, cache_size) for _ in payloads]
+        for tree, payload in zip(trees, payloads):
+            # Deadlines were registered when the registry was set up
+            tree.bulk_load([row[:5] + (row[5] is not None,) for row in marshal.loads(payload)])
+        print(f"Loaded {sum(tree.root.size for tree in trees)} books of branch {branch!r} from database into RB tree")
+        if self.shards > 1:
+            print(f"Built {len(trees)} shards of {[tree.root.size for tree in trees]} books")
+            return ShardedLibrary(trees)
+        return trees[0]
+
+    @staticmethod
+    def _popularity_tracker():
+        from .data_structures.popularity import PopularityTracker
+        return PopularityTracker(
+            bucket_seconds=getattr(settings, 'GATOR_LOAN_BUCKET_SECONDS', 86400),
+            window_buckets=getattr(settings, 'GATOR_POPULARITY_WINDOW_BUCKETS', 7),
+            k=getattr(settings, 'GATOR_POPULARITY_TOP_K', 20),
+            width=getattr(settings, 'GATOR_POPULARITY_SKETCH_WIDTH', 2048),
+            depth=getattr(settings, 'GATOR_POPULARITY_SKETCH_DEPTH', 4)
+        )
+
+    def _has_queued_writes(self, branch):
+        """Whether write-behind rows of a branch's books are still unwritten.
+
+        Such a branch stays loaded: rebuilding it from the database would
+        lose the loans and returns that only the tree has seen yet.
+        """
+        if self.write_behind is None:
+            return False
+        directory = self.rb_tree.directory
+        return any(directory.get(book_id) == branch for book_id in self.write_behind.pending_books())
+
+    def _load_popularity(self):
+        """Seed the popularity window from per-bucket loan counts, one grouped query"""
+        from django.db import DatabaseError
+        from django.db.models import Count
+        from .models import LoanHistory, loan_bucket
+        tracker = self.popularity
+        oldest = loan_bucket(self.scheduler.clock()) - tracker.window_buckets + 1
+        counts = LoanHistory.objects.filter(bucket__gte=oldest).values('bucket', 'book_id').annotate(
+            loans=Count('id')
+        ).order_by('bucket')
+        try:
+            counts = list(counts)
+        except DatabaseError as e:
+            print(f"Loan history not available ({e}), starting with an empty popularity window")
+            return
+        for row in counts:
+            tracker.record(row['book_id'], row['bucket'] * tracker.bucket_seconds, row['loans'])
+        print(f"Loaded {tracker.recorded} loans into the popularity window")
+
+    @staticmethod
+    def _queue_class():
+        """Reservation queue implementation selected by GATOR_RESERVATION_QUEUE"""
+        from .data_structures.bucket_queue import BucketQueue
+        from .data_structures.min_heap import MinHeap
+        queues = {'heap': MinHeap, 'bucket': BucketQueue}
+        name = getattr(settings, 'GATOR_RESERVATION_QUEUE', 'heap')
+        if name not in queues:
+            raise ImproperlyConfigured(f"GATOR_RESERVATION_QUEUE must be one of {sorted(queues)}, not {name!r}")
+        return queues[name]
+
+    def _load_rows(self, shards, branch=None):
+        """Fetch each shard's rows, in parallel worker processes when configured"""
+        workers = min(self.shard_workers, shards)
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [_load_shard_rows(shard, shards, branch) for shard in range(shards)]
+
+        from django.db import connections
+        # Forked workers must not share the parent's database sockets
+        connections.close_all()
+        print(f"Loading {shards} shards with {workers} worker processes")
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_shard_worker
+        ) as pool:
+            return list(pool.map(_load_shard_rows, range(shards), [shards] * shards, [branch] * shards))
+
+    def _register_deadlines(self, book_id, hold_expires_at, due_at):
+        """Re-register a book's outstanding deadline with the scheduler"""
+        if hold_expires_at is not None:
+            self.scheduler.schedule_hold(book_id, hold_expires_at)
+        elif due_at is not None:
+            self.scheduler.schedule_due(book_id, due_at)
+
+    def insert_book(self, title, author, branch=None):
+        """Insert a new book into its branch's RB tree and the database"""
+        from .models import DEFAULT_BRANCH, Book
         print(f"Creating new book: {title} by {author}")
         # First save to database to get book_id
         book = Book.objects.create(
             title=title,
             author=author,
+            branch=branch or DEFAULT_BRANCH,
             availability_status="Yes"
         )
         print(f"Book created in database with ID: {book.book_id}")
-        # Then insert into RB tree
-        node = self.rb_tree.insert_book(
-            book.book_id,
-            title,
-            author,
-            "Yes"
-        )
+        # The post_save signal inserts into the global tree, only insert
+        # here if that did not already happen
+        with self.tree_lock:
+            node = self.rb_tree.find_node(book.book_id)
+            if node is None:
+                node = self.rb_tree.insert_book(
+                    book.book_id,
+                    title,
+                    author,
+                    "Yes",
+                    branch=book.branch
+                )
         print(f"Book inserted into RB tree")
+        self._verify_recent()
         return node
 
     def borrow_book(self, patron_id, book_id, priority=1):
-        """Borrow a book using RB tree operations"""
+        """Borrow a book with one conditional UPDATE, or join its reservation heap"""
+        from django.db import transaction
+        from django.db.models import Q
+        from django.utils import timezone
+        from .changefeed import log_change
+        from .models import Book, ChangeLogEntry, LoanHistory, Reservation
+        from .scheduler import to_datetime
         print(f"Attempting to borrow book {book_id} for patron {patron_id}")
-        node = self.rb_tree.find_node(book_id)
+        # The bucket queue only has the Reservation priority levels
+        choices = Reservation._meta.get_field('priority').choices
+        if priority not in dict(choices):
+            return False, "Priority must be " + ", ".join(f"{value} ({label})" for value, label in choices)
+        with self.tree_lock:
+            node = self.rb_tree.writable_node(book_id)
         if not node:
             print(f"Book {book_id} not found in RB tree")
             return False, "Book not found"
+        if self.write_behind is not None:
+            return self._borrow_write_behind(node, patron_id, priority)
+
+        # Compare-and-set: only succeeds if the row is free or held for this patron
+        now = self.scheduler.clock()
+        due_at = self.scheduler.due_deadline()
+        claimable = Q(availability_status="Yes") | Q(borrowed_by_id=patron_id, hold_expires_at__isnull=False)
+        with transaction.atomic(savepoint=False):
+            updated = Book.objects.filter(claimable, book_id=book_id).update(
+                availability_status="No",
+                borrowed_by_id=patron_id,
+                due_at=to_datetime(due_at),
+                hold_expires_at=None,
+                updated_at=timezone.now()
+            )
+            if updated:
+                LoanHistory.for_loan(book_id, patron_id, now).save()
+                log_change(ChangeLogEntry.LOAN, book_id, self.origin)
+
+        if updated:
+            self.popularity.record(book_id, now)
+            with self.tree_lock:
+                if not self._claimable(node, patron_id):
+                    # Another worker returned the book since this tree last saw it
+                    self.rb_tree.sync_status(node, "Yes", None)
+                success, message = self.rb_tree.borrow_book(patron_id, book_id, priority, node=node)
+            self.scheduler.schedule_due(book_id, due_at)
+            self.publish(node, 'availability')
+            print(f"Database updated for book {book_id}")
+        else:
+            if self._claimable(node, patron_id):
+                # Another worker lent the book since this tree last saw it
+                if not self._refresh_node(node):
+                    return False, "Book not found"
+                if self._claimable(node, patron_id):
+                    return False, "Book changed while borrowing, please try again"
+            reserved_at = time.time()
+            with self.tree_lock:
+                queued = node.reservation_heap.get_size()
+                success, message = self.rb_tree.borrow_book(
+                    patron_id, book_id, priority, node=node, time_of_reservation=reserved_at
+                )
+                joined = node.reservation_heap.get_size() > queued
+            if joined:
+                # Other workers replay the queue operation with the same timestamp
+                log_change(
+                    ChangeLogEntry.RESERVE, book_id, self.origin,
+                    patron_id=patron_id, priority=priority, reserved_at=reserved_at
+                )
+                self.publish(node, 'queue')
 
-        success, message = self.rb_tree.borrow_book(patron_id, book_id, priority)
         print(f"Borrow attempt result: {success}, {message}")
+        self._verify_recent()
+        return success, message
+
+    def _borrow_write_behind(self, node, patron_id, priority):
+        """Borrow or reserve in the tree now and queue the row write.
+
+        This tree is the authority in write-behind mode, so there is no
+        compare-and-set against the row. The write is queued after the tree
+        lock is released, since a full queue can make the caller flush.
+        """
+        from .models import ChangeLogEntry, LoanHistory
+        now = self.scheduler.clock()
+        due_at = self.scheduler.due_deadline()
+        reserved_at = time.time()
+        with self.tree_lock:
+            queued = node.reservation_heap.get_size()
+            success, message = self.rb_tree.borrow_book(
+                patron_id, node.book_id, priority, node=node, time_of_reservation=reserved_at
+            )
+            joined = node.reservation_heap.get_size() > queued
+            fields = self._row_fields(node, due_at=due_at) if success else None
+            version = node.version
         if success:
-            # Update database to match RB tree state
-            from .models import Book
-            book = Book.objects.get(book_id=book_id)
-            book.availability_status = "No"
-            book.borrowed_by_id = patron_id
-            book.save()
-            print(f"Database updated for book {book_id}")
+            self.scheduler.schedule_due(node.book_id, due_at)
+            self.popularity.record(node.book_id, now)
+            self.write_behind.put(
+                node.book_id, fields, ChangeLogEntry.LOAN,
+                loan=LoanHistory.for_loan(node.book_id, patron_id, now), version=version
+            )
+            self.publish(node, 'availability')
+        elif joined:
+            self.write_behind.put(
+                node.book_id, None, ChangeLogEntry.RESERVE, version=version,
+                patron_id=patron_id, priority=priority, reserved_at=reserved_at
+            )
+            self.publish(node, 'queue')
+        self._verify_recent()
         return success, message
 
+    @staticmethod
+    def _row_fields(node, due_at=None, hold_expires_at=None):
+        """Book columns matching a node's loan state, for the write-behind queue"""
+        from django.utils import timezone
+        from .scheduler import to_datetime
+        return {
+            'availability_status': node.availability_status,
+            'borrowed_by_id': node.borrowed_by,
+            'due_at': to_datetime(due_at),
+            'hold_expires_at': to_datetime(hold_expires_at),
+            'updated_at': timezone.now(),
+        }
+
     def return_book(self, patron_id, book_id):
         """Return a book using RB tree operations"""
-        success, message = self.rb_tree.return_book(patron_id, book_id)
-        if success:
-            # Update database to match RB tree state
-            from .models import Book
-            book = Book.objects.get(book_id=book_id)
-            if "allocated to patron" in message:
-                next_patron_id = int(message.split()[-1])
-                book.borrowed_by_id = next_patron_id
+        with self.tree_lock:
+            node = self.rb_tree.writable_node(book_id)
+        if not node:
+            return False, "Book not found"
+        return self._release(
+            node,
+            patron_id,
+            lambda: self.rb_tree.return_book(patron_id, book_id, node=node),
+            "Book was not borrowed by this patron"
+        )
+
+    def expire_hold(self, book_id):
+        """Expire an unclaimed hold and pass the book to the next reservation"""
+        with self.tree_lock:
+            node = self.rb_tree.writable_node(book_id)
+        if not node or not node.on_hold:
+            return False, "No hold to expire"
+        return self._release(
+            node,
+            node.borrowed_by,
+            lambda: self.rb_tree.expire_hold(book_id, node=node),
+            "No hold to expire",
+            held=True
+        )
+
+    def _release(self, node, patron_id, release, failure_message, held=False):
+        """Pass a book from patron_id to the next reservation, or make it available.
+
+        The next holder is peeked from the heap and written with one
+        conditional UPDATE; the tree operation `release` only runs once the
+        database has accepted the change. The tree lock is held from the
+        peek to the pop, so a reservation arriving in between cannot make
+        the tree allocate to a different patron than the row.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from .changefeed import log_change
+        from .models import Book, ChangeLogEntry
+        from .scheduler import to_datetime
+        if self.write_behind is not None:
+            return self._release_write_behind(node, release)
+        with self.tree_lock:
+            next_reservations = node.reservation_heap.peek(1)
+            hold_expires_at = None
+            if next_reservations:
+                hold_expires_at = self.scheduler.hold_deadline()
+                fields = {
+                    'borrowed_by_id': next_reservations[0].patron_id,
+                    'hold_expires_at': to_datetime(hold_expires_at),
+                }
             else:
-                book.availability_status = "Yes"
-                book.borrowed_by = None
-            book.save()
+                fields = {
+                    'availability_status': "Yes",
+                    'borrowed_by_id': None,
+                    'hold_expires_at': None,
+                }
+
+            rows = Book.objects.filter(book_id=node.book_id, borrowed_by_id=patron_id)
+            if held:
+                rows = rows.filter(hold_expires_at__isnull=False)
+            with transaction.atomic(savepoint=False):
+                updated = rows.update(due_at=None, updated_at=timezone.now(), **fields)
+                if updated and next_reservations:
+                    log_change(ChangeLogEntry.RELEASE, node.book_id, self.origin, patron_id=fields['borrowed_by_id'])
+                elif updated:
+                    log_change(ChangeLogEntry.BOOK, node.book_id, self.origin)
+            if not updated:
+                if node.borrowed_by == patron_id:
+                    # This tree is out of date, resync it before reporting failure
+                    self._refresh_node(node)
+                return False, failure_message
+
+            if node.borrowed_by != patron_id or node.on_hold != held:
+                self.rb_tree.sync_status(node, "No", patron_id, held)
+            success, message = release()
+        if hold_expires_at is not None:
+            self.scheduler.schedule_hold(node.book_id, hold_expires_at)
+            self.publish(node, 'allocated', patron_id=fields['borrowed_by_id'], hold_expires_at=hold_expires_at)
+        else:
+            self.scheduler.clear(node.book_id)
+            self.publish(node, 'availability')
+        self._verify_recent()
+        return success, message
+
+    def _release_write_behind(self, node, release):
+        """Release in the tree now and queue the row write once the tree lock is released"""
+        from .models import ChangeLogEntry
+        hold_expires_at = self.scheduler.hold_deadline()
+        with self.tree_lock:
+            success, message = release()
+            if not success:
+                return success, message
+            holder = node.borrowed_by if node.on_hold else None
+            if holder is None:
+                hold_expires_at = None
+            fields = self._row_fields(node, hold_expires_at=hold_expires_at)
+            version = node.version
+        if holder is not None:
+            self.scheduler.schedule_hold(node.book_id, hold_expires_at)
+            self.write_behind.put(node.book_id, fields, ChangeLogEntry.RELEASE, version=version, patron_id=holder)
+            self.publish(node, 'allocated', patron_id=holder, hold_expires_at=hold_expires_at)
+        else:
+            self.scheduler.clear(node.book_id)
+            self.write_behind.put(node.book_id, fields, ChangeLogEntry.BOOK, version=version)
+            self.publish(node, 'availability')
+        self._verify_recent()
         return success, message
 
+    @staticmethod
+    def _claimable(node, patron_id):
+        return node.availability_status == "Yes" or (node.on_hold and node.borrowed_by == patron_id)
+
+    @use_primary()
+    def _refresh_node(self, node):
+        """Reload a node's loan state from its Book row, False if the row is gone"""
+        from .models import Book
+        row = Book.objects.filter(book_id=node.book_id).values(
+            'availability_status', 'borrowed_by_id', 'hold_expires_at'
+        ).first()
+        if row is None:
+            return False
+        with self.tree_lock:
+            self.rb_tree.sync_status(
+                node,
+                row['availability_status'],
+                row['borrowed_by_id'],
+                row['hold_expires_at'] is not None
+            )
+        return True
+
     def delete_book(self, book_id):
         """Delete a book using RB tree operations"""
-        cancelled_reservations = self.rb_tree.delete_book(book_id)
+        with self.tree_lock:
+            cancelled_reservations = self.rb_tree.delete_book(book_id)
+        self.scheduler.clear(book_id)
+        self.popularity.forget(book_id)
+        if self.write_behind is not None:
+            self.write_behind.discard(book_id)
         # Update database
         from .models import Book
         Book.objects.filter(book_id=book_id).delete()
+        self.events.publish(book_id, 'deleted')
+        self._verify_recent()
         return cancelled_reservations
 
-    def find_closest_book(self, target_id):
-        """Find closest book using RB tree operations"""
-        return self.rb_tree.find_closest_book(target_id)
+    def delete_range(self, min_id, max_id):
+        """Delete every book with min_id <= book_id <= max_id.
+
+        The tree cuts the range out with split/join, then one queryset
+        delete removes the rows. Returns {book_id: [cancelled patron ids]}.
+        """
+        with self.tree_lock:
+            removed = self.rb_tree.delete_range(min_id, max_id)
+        for book_id in removed:
+            self.scheduler.clear(book_id)
+            self.popularity.forget(book_id)
+            if self.write_behind is not None:
+                self.write_behind.discard(book_id)
+        from .models import Book
+        Book.objects.filter(book_id__gte=min_id, book_id__lte=max_id).delete()
+        for book_id in removed:
+            self.events.publish(book_id, 'deleted')
+        self._verify_recent()
+        return removed
+
+    def find_closest_book(self, target_id, branches=None):
+        """Find closest book over the given branches, or all of them"""
+        return self.rb_tree.find_closest_book(target_id, branches)
+
+    def find_closest_available(self, target_id, branches=None):
+        """Find the closest book that can be borrowed right now"""
+        return self.rb_tree.find_closest_available(target_id, branches)
+
+    def count_available(self, min_id=None, max_id=None):
+        """Available books in an optional book_id range, from the tree's subtree counts"""
+        return self.rb_tree.count_available(min_id, max_id)
+
+    def availability_stats(self):
+        """Total, available and unavailable book counts without querying the database"""
+        return self.rb_tree.availability_stats()
+
+    def iter_books(self, min_id=None, max_id=None):
+        """Lazily iterate tree nodes in book_id order within an optional range"""
+        return self.rb_tree.iter_inorder(min_id, max_id)
+
+    def iter_book_chunks(self, min_id=None, max_id=None, chunk_size=500, row=None):
+        """Books in book_id order as lists of row(node), each list read under tree_lock.
+
+        For readers that outlive a request, like the streamed export, which
+        must not hold a tree iterator while other threads change the tree.
+        """
+        return self.rb_tree.iter_chunks(min_id, max_id, chunk_size, self.tree_lock, row)
+
+    def branch_stats(self):
+        """Book counts and load state of every branch, see BranchedLibrary.branch_stats"""
+        return self.rb_tree.branch_stats()
 
     def get_color_flip_count(self):
         """Get the number of color flips in the RB tree"""
         return self.rb_tree.get_color_flip_count()
 
+    def memory_usage(self):
+        """Structural memory accounting of the tree, see GatorLibrary.memory_usage"""
+        return self.rb_tree.memory_usage()
+
+    def node_cache_stats(self):
+        """Hit and miss counters of the find_node cache, see NodeCache"""
+        return self.rb_tree.node_cache_stats()
+
+    def popular_books(self, k=None):
+        """Most borrowed books of the popularity window as (node, estimated loans), O(k)"""
+        ranked = []
+        for book_id, loans in self.popularity.top(now=self.scheduler.clock()):
+            node = self.rb_tree.find_node(book_id)
+            if node is not None:
+                ranked.append((node, loans))
+        return ranked if k is None else ranked[:k]
+
+    def book_state(self, node):
+        """Loan and queue state of a book as sent to event subscribers"""
+        return {
+            'availability_status': node.availability_status,
+            'borrowed_by': node.borrowed_by,
+            'on_hold': node.on_hold,
+            'queue': [entry.patron_id for entry in node.reservation_heap.iter_ordered()],
+        }
+
+    def publish(self, node, kind, **data):
+        """Notify subscribers of a book, the state is only built when someone listens"""
+        if self.events.watching(node.book_id):
+            self.events.publish(node.book_id, kind, **self.book_state(node), **data)
+
+    def barrier(self, timeout=None):
+        """Wait until every queued write is in the database, see WriteBehindQueue.barrier"""
+        if self.write_behind is None:
+            return True
+        return self.write_behind.barrier(timeout)
+
+    def apply_changes(self, book_ids=(), reservation_ids=(), using='default'):
+        """Apply committed Book and Reservation rows to the tree, holding tree_lock for the tree part"""
+        from .changefeed import apply_book_changes, apply_reservations
+        if book_ids:
+            apply_book_changes(self.rb_tree, book_ids, using, lock=self.tree_lock)
+        if reservation_ids:
+            apply_reservations(self.rb_tree, reservation_ids, using, lock=self.tree_lock)
+
+    def sync(self):
+        """Apply other workers' changes from the change log, see ChangeFeed.poll"""
+        return self.change_feed.poll()
+
+    def prepare_fork(self):
+        """Ready the master to fork workers that share its trees copy-on-write.
+
+        Every branch is loaded, background threads and database
+        connections are closed, and everything allocated so far is moved
+        to the collector's permanent generation so that collections in the
+        workers never write to the shared objects.
+
+        Loading every branch deliberately ignores GATOR_BRANCH_MEMORY_BUDGET:
+        the master pays for each tree once instead of every worker paying
+        for the branches it restores, and the shared trees are pinned in the
+        workers. The budget still applies to branches added after fork.
+        """
+        from django.db import connections
+        self.barrier()
+        self.scheduler.stop()
+        if self.write_behind is not None:
+            self.write_behind.close()
+        budget, self.rb_tree.memory_budget = self.rb_tree.memory_budget, None
+        for branch in self.rb_tree.branches():
+            self.rb_tree.tree(branch)
+        self.rb_tree.memory_budget = budget
+        connections.close_all()
+        gc.collect()
+        gc.freeze()
+        print(f"Froze {gc.get_freeze_count()} objects before fork")
+
+    def after_fork(self):
+        """Give a forked worker its own identity, threads and tree overlays"""
+        from .data_structures.rb_tree import GatorLibrary
+        gc.enable()
+        # Workers must not skip each other's change log entries
+        self.origin = uuid.uuid4().hex
+        self.events = EventBroker()
+        queue_class = self._queue_class()
+        cache_size = getattr(settings, 'GATOR_NODE_CACHE_SIZE', 1024)
+        with self.tree_lock:
+            self.rb_tree.share(lambda: GatorLibrary(queue_class, cache_size))
+        if self.write_behind is not None:
+            self.write_behind = WriteBehindQueue(self)
+        if getattr(settings, 'GATOR_SCHEDULER_THREAD', False):
+            self.scheduler.start()
+
+    def memory_footprint(self):
+        """Resident, shared and unique memory of this worker process, see library.preload"""
+        from .preload import memory_footprint
+        return memory_footprint()
+
+    def check_invariants(self, sample=None):
+        """Verify the RB tree and reservation heaps, see GatorLibrary.check_invariants"""
+        return self.rb_tree.check_invariants(sample)
+
+    def _verify_recent(self):
+        """Run the bounded sampled invariant check over recently mutated paths"""
+        if self.invariant_sample_paths:
+            # The check consumes the shared touched paths and walks them, so
+            # it must not run while another thread rotates the tree
+            with self.tree_lock:
+                ok, message = self.rb_tree.check_invariants(sample=self.invariant_sample_paths)
+            if not ok:
+                print(f"WARNING: RB tree invariant violated: {message}")
+
 # Global instance of the library manager
 gator_library = GatorLibraryManager()
\ No newline at end of file
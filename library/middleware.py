@@ -0,0 +1,91 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .profiling import (
+    DEFAULT_WINDOW, instrument_methods, profile_stats, query_wrapper,
+    start_profile, stop_profile
+)
+from .routers import PIN_COOKIE, replica_aliases, start_pinning, stop_pinning
+
+# Public GatorLibrary methods attributed to the rb_tree phase
+RB_TREE_METHODS = (
+    'insert_book', 'find_node', 'writable_node', 'borrow_book', 'return_book', 'expire_hold',
+    'delete_book', 'find_closest_book', 'check_invariants',
+)
+
+
+class RequestProfilingMiddleware:
+    """Attribute request wall time to tree, ORM, signal and template phases.
+
+    Adds a Server-Timing header to every response and feeds the rolling
+    per-view percentiles shown on the staff request profile page. Tree and
+    template methods are wrapped once, when the middleware is built; the
+    wrappers only time calls made while a request profile is active.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        from django.template.backends.django import Template
+        from .data_structures.rb_tree import GatorLibrary
+        instrument_methods(GatorLibrary, RB_TREE_METHODS, 'rb_tree')
+        instrument_methods(Template, ('render',), 'template')
+        profile_stats.window = getattr(settings, 'GATOR_PROFILE_WINDOW', DEFAULT_WINDOW)
+
+    def __call__(self, request):
+        profile, token = start_profile()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(query_wrapper))
+                response = self.get_response(request)
+        finally:
+            stop_profile(token)
+
+        total = profile.total()
+        response['Server-Timing'] = profile.server_timing(total)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        profile_stats.record(f"{request.method} {view}", total, profile)
+        return response
+
+
+class ChangeFeedMiddleware:
+    """Bring this worker's tree up to date with other workers' changes.
+
+    Polls the change log at most every GATOR_CHANGE_FEED_INTERVAL seconds,
+    so the cost is one indexed query per interval rather than per request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .managers import gator_library
+        gator_library.change_feed.maybe_poll()
+        return self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """Read-your-writes on top of PrimaryReplicaRouter.
+
+    Unsafe methods and requests carrying the pin cookie read from the
+    primary. A request that wrote sets the cookie for GATOR_DB_PIN_SECONDS
+    so the patron's next pages do not hit a replica that is behind.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'GATOR_DB_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+        state, token = start_pinning(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_pinning(token)
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
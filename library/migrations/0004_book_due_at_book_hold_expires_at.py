@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_remove_color_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
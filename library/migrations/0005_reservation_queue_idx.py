@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_due_at_book_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'is_active', '-priority', 'reservation_time'], name='reservation_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_reservation_queue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', 'Book changed'), ('reservation', 'Reservation row created'), ('reserve', 'Patron queued for book'), ('release', 'Book passed to next reservation')], max_length=12)),
+                ('object_id', models.IntegerField()),
+                ('patron_id', models.IntegerField(blank=True, null=True)),
+                ('priority', models.IntegerField(blank=True, null=True)),
+                ('reserved_at', models.FloatField(blank=True, null=True)),
+                ('origin', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
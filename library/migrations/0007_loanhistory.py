@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_changelogentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changelogentry',
+            name='kind',
+            field=models.CharField(choices=[('book', 'Book changed'), ('reservation', 'Reservation row created'), ('reserve', 'Patron queued for book'), ('release', 'Book passed to next reservation'), ('loan', 'Book lent, counts towards popularity')], max_length=12),
+        ),
+        migrations.CreateModel(
+            name='LoanHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.IntegerField()),
+                ('patron_id', models.IntegerField()),
+                ('borrowed_at', models.DateTimeField()),
+                ('bucket', models.IntegerField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['bucket', 'book_id'], name='loan_bucket_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_loanhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='branch',
+            field=models.CharField(default='main', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['branch', 'book_id'], name='book_branch_idx'),
+        ),
+    ]
@@ -1,11 +1,16 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
+# Branch of books created without one, and of every book from before branches
+DEFAULT_BRANCH = 'main'
+
 
 class Book(models.Model):
     book_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
+    branch = models.CharField(max_length=64, default=DEFAULT_BRANCH)
     availability_status = models.CharField(
         max_length=5,
         choices=[('Yes', 'Available'), ('No', 'Not Available')],
@@ -21,18 +26,27 @@ class Book(models.Model):
         on_delete=models.SET_NULL,
         related_name='borrowed_books'
     )
+    due_at = models.DateTimeField(null=True, blank=True)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['book_id']
+        indexes = [
+            # Serves loading one branch's books in book_id order
+            models.Index(fields=['branch', 'book_id'], name='book_branch_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} (ID: {self.book_id})"
 
     def save(self, *args, **kwargs):
         print(f"DEBUG: Saving book {self.book_id}")
-        super().save(*args, **kwargs)
+        # The post_save change log entry commits together with the row
+        using = kwargs.get('using') or router.db_for_write(Book, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
 
 
 class Reservation(models.Model):
@@ -59,6 +73,88 @@ class Reservation(models.Model):
 
     class Meta:
         ordering = ['-priority', 'reservation_time']
+        indexes = [
+            # Serves the ordered active queue for one book
+            models.Index(
+                fields=['book', 'is_active', '-priority', 'reservation_time'],
+                name='reservation_queue_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patron.username}'s reservation for {self.book.title}"
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Reservation, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+class ChangeLogEntry(models.Model):
+    """One book or reservation mutation, for other workers to replay.
+
+    The id is the feed version. 'book' and 'loan' entries only name the
+    book, workers re-read its row. Reservation queues live in memory only, so 'reserve'
+    and 'release' carry the queue operation itself.
+    """
+    BOOK = 'book'
+    RESERVATION = 'reservation'
+    RESERVE = 'reserve'
+    RELEASE = 'release'
+    LOAN = 'loan'
+
+    kind = models.CharField(
+        max_length=12,
+        choices=[
+            (BOOK, 'Book changed'),
+            (RESERVATION, 'Reservation row created'),
+            (RESERVE, 'Patron queued for book'),
+            (RELEASE, 'Book passed to next reservation'),
+            (LOAN, 'Book lent, counts towards popularity'),
+        ]
+    )
+    # book_id, or the Reservation pk for RESERVATION entries
+    object_id = models.IntegerField()
+    patron_id = models.IntegerField(null=True, blank=True)
+    priority = models.IntegerField(null=True, blank=True)
+    reserved_at = models.FloatField(null=True, blank=True)
+    # Worker that made the change and has already applied it
+    origin = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
 
     def __str__(self):
-        return f"{self.patron.username}'s reservation for {self.book.title}"
\ No newline at end of file
+        return f"#{self.id} {self.kind} {self.object_id}"
+
+
+def loan_bucket(timestamp):
+    """Time bucket of a loan, GATOR_LOAN_BUCKET_SECONDS wide"""
+    return int(timestamp // getattr(settings, 'GATOR_LOAN_BUCKET_SECONDS', 86400))
+
+
+class LoanHistory(models.Model):
+    """One successful borrow, kept after the book is returned or deleted.
+
+    Rows are grouped by an integer time bucket that leads the index, so
+    per-bucket counts and dropping old buckets only touch their own range.
+    """
+    book_id = models.IntegerField()
+    patron_id = models.IntegerField()
+    borrowed_at = models.DateTimeField()
+    bucket = models.IntegerField()
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['bucket', 'book_id'], name='loan_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Book {self.book_id} lent to patron {self.patron_id}"
+
+    @classmethod
+    def for_loan(cls, book_id, patron_id, timestamp):
+        """Unsaved row for a loan made at timestamp"""
+        from .scheduler import to_datetime
+        return cls(book_id=book_id, patron_id=patron_id, borrowed_at=to_datetime(timestamp), bucket=loan_bucket(timestamp))
\ No newline at end of file
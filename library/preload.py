@@ -0,0 +1,34 @@
+import os
+
+# smaps_rollup fields, reported in kB
+_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared',
+    'Shared_Dirty': 'shared',
+    'Private_Clean': 'unique',
+    'Private_Dirty': 'unique',
+}
+
+
+def memory_footprint(pid='self'):
+    """Resident memory of a process in bytes, None where /proc/<pid>/smaps_rollup is missing.
+
+    'unique' (USS) is what the process would give back by exiting: pages
+    no other process maps, including copy-on-write pages it has written
+    since fork. 'shared' pages are still mapped by the master or other
+    workers, and 'pss' charges each process its share of them.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            lines = rollup.readlines()
+    except OSError:
+        return None
+    usage = {'rss': 0, 'pss': 0, 'shared': 0, 'unique': 0}
+    for line in lines:
+        name, _, value = line.partition(':')
+        key = _FIELDS.get(name)
+        if key is not None:
+            usage[key] += int(value.split()[0]) * 1024
+    usage['pid'] = os.getpid() if pid == 'self' else int(pid)
+    return usage
@@ -0,0 +1,169 @@
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phases reported in Server-Timing, anything unattributed counts as "app"
+PHASES = ("rb_tree", "db", "signals", "template")
+PERCENTILES = (50, 95, 99)
+DEFAULT_WINDOW = 1000
+
+_current = ContextVar("gator_request_profile", default=None)
+
+
+class RequestProfile:
+    """Exclusive wall time per phase for one request.
+
+    Phases nest (a signal handler runs queries, a view renders a template)
+    so entering a phase pauses the enclosing one and the totals add up to
+    at most the request's wall time.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.query_count = 0
+        self._stack = []  # [phase, started_at]
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.durations[parent[0]] += now - parent[1]
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, started_at = self._stack.pop()
+        self.durations[name] += now - started_at
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        """Render the phases as a Server-Timing header value (milliseconds)"""
+        metrics = []
+        for name in PHASES:
+            metric = f"{name};dur={self.durations[name] * 1000:.2f}"
+            if name == "db":
+                metric += f';desc="{self.query_count} queries"'
+            metrics.append(metric)
+        app = max(total - sum(self.durations.values()), 0.0)
+        metrics.append(f"app;dur={app * 1000:.2f}")
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+def start_profile():
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def stop_profile(token):
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Attribute the enclosed block to a phase of the active request profile"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit()
+
+
+def profiled(name):
+    """Decorator form of phase()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with phase(name):
+                return func(*args, **kwargs)
+        wrapper.__profiled__ = True
+        return wrapper
+    return decorator
+
+
+def instrument_methods(cls, names, name):
+    """Wrap methods of a class so their time is attributed to a phase"""
+    for method_name in names:
+        method = getattr(cls, method_name)
+        if not getattr(method, "__profiled__", False):
+            setattr(cls, method_name, profiled(name)(method))
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook that counts and times ORM queries"""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    profile.query_count += 1
+    with phase("db"):
+        return execute(sql, params, many, context)
+
+
+class ProfileStats:
+    """Rolling per-view latency windows and phase totals, kept in memory"""
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._phase_totals = {}
+        self._query_totals = {}
+        self._counts = {}
+
+    def record(self, view, total, profile):
+        with self._lock:
+            if view not in self._latencies:
+                self._latencies[view] = deque(maxlen=self.window)
+                self._phase_totals[view] = dict.fromkeys(PHASES, 0.0)
+                self._query_totals[view] = 0
+                self._counts[view] = 0
+            self._latencies[view].append(total)
+            for name in PHASES:
+                self._phase_totals[view][name] += profile.durations[name]
+            self._query_totals[view] += profile.query_count
+            self._counts[view] += 1
+
+    def summary(self):
+        """Per-view percentiles and mean phase breakdown in milliseconds"""
+        with self._lock:
+            snapshot = {
+                view: (sorted(latencies), dict(self._phase_totals[view]),
+                       self._query_totals[view], self._counts[view])
+                for view, latencies in self._latencies.items()
+            }
+
+        rows = []
+        for view, (latencies, phase_totals, queries, count) in sorted(snapshot.items()):
+            row = {
+                'view': view,
+                'count': count,
+                'mean_queries': queries / count,
+                'phases': [(name, phase_totals[name] / count * 1000) for name in PHASES],
+            }
+            for percentile in PERCENTILES:
+                idx = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+                row[f'p{percentile}'] = latencies[idx] * 1000
+            rows.append(row)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self._phase_totals.clear()
+            self._query_totals.clear()
+            self._counts.clear()
+
+
+profile_stats = ProfileStats()
@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .routers import replica_aliases
+
+
+def copy_sqlite(source, targets, timeout=30):
+    """Copy the SQLite database file source into each target file with the backup API"""
+    with closing(sqlite3.connect(source, timeout=timeout)) as primary:
+        for target in targets:
+            with closing(sqlite3.connect(target, timeout=timeout)) as replica:
+                primary.backup(replica)
+
+
+def sqlite_replicas():
+    """Primary and replica file names when every alias is a SQLite file, otherwise None"""
+    names = {}
+    for alias in (DEFAULT_DB_ALIAS, *replica_aliases()):
+        settings_dict = connections[alias].settings_dict
+        if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+            return None
+        names[alias] = settings_dict['NAME']
+    primary = names.pop(DEFAULT_DB_ALIAS)
+    return primary, list(names.values())
+
+
+class ReplicaEmulator:
+    """Stand-in for asynchronous replication between local SQLite files.
+
+    Every interval seconds the primary file is copied into the replica
+    files, so replicas lag the primary by up to one interval, like a real
+    replica under load.
+    """
+    def __init__(self, interval=1.0):
+        files = sqlite_replicas()
+        if files is None:
+            raise ValueError("Replica emulation needs SQLite primary and replica databases")
+        self.primary, self.replicas = files
+        self.interval = interval
+        self.copies = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        if self.replicas:
+            copy_sqlite(self.primary, self.replicas)
+            self.copies += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="gator-replica-emulator", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            self.sync()
+            print(f"DEBUG: Copied primary to {len(self.replicas)} replicas in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
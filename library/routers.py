@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Set for a while after a request that wrote, so the redirect and the next
+# few pages read the patron's own writes from the primary
+PIN_COOKIE = 'gator_primary'
+
+_state = ContextVar("gator_db_pin", default=None)
+_next_replica = count()
+
+
+class PinState:
+    """Whether the current request (or thread) must read from the primary"""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def current_state():
+    state = _state.get()
+    if state is None:
+        # Outside a request the state lives as long as the thread's context
+        state = PinState()
+        _state.set(state)
+    return state
+
+
+def start_pinning(pinned=False):
+    """Give the current request its own pin state, returns (state, token)"""
+    state = PinState(pinned)
+    return state, _state.set(state)
+
+
+def stop_pinning(token):
+    _state.reset(token)
+
+
+def replica_aliases():
+    return getattr(settings, 'GATOR_DB_REPLICAS', ())
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block, also usable as a decorator.
+
+    For code that must not see replication lag: tree loads, the change
+    feed and the re-read after a failed compare-and-set.
+    """
+    state = current_state()
+    pinned = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        # A write inside the block keeps the pin for read-your-writes
+        state.pinned = pinned or state.wrote
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and reads to the GATOR_DB_REPLICAS aliases.
+
+    Reads rotate over the replicas until the current request writes
+    something; from then on, and for GATOR_DB_PIN_SECONDS in later
+    requests (see ReplicaPinningMiddleware), they go to the primary. With
+    no replicas configured every query uses 'default'.
+    """
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from the same database as the instance
+            return instance._state.db
+        replicas = replica_aliases()
+        if not replicas or current_state().pinned:
+            return DEFAULT_DB_ALIAS
+        return replicas[next(_next_replica) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        state = current_state()
+        state.wrote = True
+        state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in replica_aliases():
+            return False
+        return None
@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .data_structures.timing_wheel import TimingWheel
+
+HOLD = "hold"
+DUE = "due"
+
+
+def to_datetime(timestamp):
+    """Convert a scheduler timestamp to an aware datetime for the database"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+class LibraryScheduler:
+    """Expire unclaimed holds and flag overdue loans using a timing wheel.
+
+    Holds and due dates are registered as the manager allocates and lends
+    books, so each tick only visits deadlines that have actually passed.
+    """
+    def __init__(self, manager, clock=time.time):
+        self.manager = manager
+        self.clock = clock
+        self.hold_seconds = getattr(settings, 'GATOR_HOLD_SECONDS', 2 * 24 * 60 * 60)
+        self.loan_seconds = getattr(settings, 'GATOR_LOAN_SECONDS', 14 * 24 * 60 * 60)
+        self.wheel = TimingWheel(
+            tick_seconds=getattr(settings, 'GATOR_SCHEDULER_TICK_SECONDS', 60),
+            start_time=clock()
+        )
+        # Overdue loans: book_id -> patron_id
+        self.overdue = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def hold_deadline(self):
+        return self.clock() + self.hold_seconds
+
+    def due_deadline(self):
+        return self.clock() + self.loan_seconds
+
+    def schedule_hold(self, book_id, expires_at):
+        """Start the pickup window for a book allocated from the reservation heap"""
+        with self._lock:
+            self.wheel.cancel((DUE, book_id))
+            self.wheel.schedule((HOLD, book_id), expires_at)
+            self.overdue.pop(book_id, None)
+
+    def schedule_due(self, book_id, due_at):
+        """Track the due date of a new loan"""
+        with self._lock:
+            self.wheel.cancel((HOLD, book_id))
+            self.wheel.schedule((DUE, book_id), due_at)
+            self.overdue.pop(book_id, None)
+
+    def clear(self, book_id):
+        """Forget all deadlines for a returned or deleted book"""
+        with self._lock:
+            self.wheel.cancel((HOLD, book_id))
+            self.wheel.cancel((DUE, book_id))
+            self.overdue.pop(book_id, None)
+
+    def tick(self, now=None):
+        """Process every deadline up to now.
+
+        Returns (expired_holds, new_overdue) as lists of book_ids. A hold
+        whose expiry fails, say on a database error, is retried next tick.
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            expired = self.wheel.advance(now)
+
+        expired_holds = []
+        new_overdue = []
+        for kind, book_id in expired:
+            if kind == HOLD:
+                try:
+                    success, message = self.manager.expire_hold(book_id)
+                except Exception as e:
+                    print(f"WARNING: Expiring the hold on book {book_id} failed, will retry: {e}")
+                    with self._lock:
+                        self.wheel.schedule((HOLD, book_id), now)
+                    continue
+                if success:
+                    print(f"DEBUG: {message}")
+                    expired_holds.append(book_id)
+            else:
+                node = self.manager.rb_tree.find_node(book_id)
+                if node and node.availability_status == "No" and not node.on_hold:
+                    with self._lock:
+                        self.overdue[book_id] = node.borrowed_by
+                    new_overdue.append(book_id)
+        return expired_holds, new_overdue
+
+    def get_overdue_loans(self):
+        """Return the currently overdue loans as {book_id: patron_id}"""
+        with self._lock:
+            return dict(self.overdue)
+
+    def start(self, interval=None):
+        """Drive the scheduler from a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        if interval is None:
+            interval = self.wheel.tick_seconds
+        self._stop.clear()
+
+        def run():
+            from django.db import close_old_connections
+            while not self._stop.wait(interval):
+                close_old_connections()
+                try:
+                    self.tick()
+                except Exception as e:
+                    # Keep the thread alive, the next tick picks up from here
+                    print(f"WARNING: Scheduler tick failed: {e}")
+
+        self._thread = threading.Thread(target=run, name="gator-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
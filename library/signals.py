@@ -1,72 +1,64 @@
+import threading
+from functools import partial
+
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Book, Reservation
+from .changefeed import log_change
+from .models import Book, ChangeLogEntry, Reservation
 from .managers import gator_library
+from .profiling import profiled
+
+
+class PendingTreeChanges(threading.local):
+    """Book and reservation ids changed by the current thread, per database alias.
+
+    Only ids are buffered. The flush re-reads the committed rows, so work
+    from a rolled back transaction or savepoint never reaches the tree.
+    """
+    def __init__(self):
+        self.book_ids = {}
+        self.reservation_ids = {}
+
+    def add(self, bucket, using, pk):
+        bucket.setdefault(using, set()).add(pk)
+        # Every change registers the flush, the first one to run after
+        # commit applies the whole batch and the rest find nothing to do.
+        # Django drops callbacks registered in a rolled back block.
+        transaction.on_commit(partial(flush_pending_changes, using), using=using)
+
+    def pop(self, using):
+        return self.book_ids.pop(using, set()), self.reservation_ids.pop(using, set())
+
+
+pending = PendingTreeChanges()
+
+
+@profiled('signals')
+def flush_pending_changes(using):
+    """Apply all buffered changes for a database alias in one batch"""
+    book_ids, reservation_ids = pending.pop(using)
+    gator_library.apply_changes(book_ids, reservation_ids, using)
+
 
 @receiver(post_save, sender=Book)
-def update_tree_and_db(sender, instance, created, **kwargs):
-    """Synchronize RB tree and database after book changes"""
-    if created:
-        print(f"DEBUG: Post-save signal for new book {instance.book_id}")
-        # First insert into RB tree
-        node = gator_library.rb_tree.insert_book(
-            instance.book_id,
-            instance.title,
-            instance.author,
-            instance.availability_status
-        )
-        
-        print(f"DEBUG: Tree insertion complete. Updating DB")
-        # Update database with pointers
-        Book.objects.filter(pk=instance.book_id).update(
-            parent_id=node.parent.book_id if node.parent != gator_library.rb_tree.nil else None,
-            left_id=node.left.book_id if node.left != gator_library.rb_tree.nil else None,
-            right_id=node.right.book_id if node.right != gator_library.rb_tree.nil else None
-        )
-        print(f"DEBUG: Database update complete for book {instance.book_id}")
-        
-        # Also update sibling and parent pointers in database
-        if node.parent != gator_library.rb_tree.nil:
-            Book.objects.filter(pk=node.parent.book_id).update(
-                left_id=node.parent.left.book_id if node.parent.left != gator_library.rb_tree.nil else None,
-                right_id=node.parent.right.book_id if node.parent.right != gator_library.rb_tree.nil else None
-            )
-            print(f"DEBUG: Updated parent {node.parent.book_id} pointers in database")
-    else:
-        print(f"DEBUG: Post-save signal for existing book {instance.book_id}")
-        # For updates, sync the tree node with database
-        node = gator_library.rb_tree.find_node(instance.book_id)
-        if node:
-            node.title = instance.title
-            node.author = instance.author
-            node.availability_status = instance.availability_status
-            if instance.borrowed_by:
-                node.borrowed_by = instance.borrowed_by.id
-                
-            # Update pointers in database
-            Book.objects.filter(pk=instance.book_id).update(
-                parent_id=node.parent.book_id if node.parent != gator_library.rb_tree.nil else None,
-                left_id=node.left.book_id if node.left != gator_library.rb_tree.nil else None,
-                right_id=node.right.book_id if node.right != gator_library.rb_tree.nil else None
-            )
+@profiled('signals')
+def update_tree_and_db(sender, instance, created, using, **kwargs):
+    """Queue a book for tree synchronization once the transaction commits"""
+    log_change(ChangeLogEntry.BOOK, instance.book_id, gator_library.origin, using)
+    pending.add(pending.book_ids, using, instance.book_id)
 
 @receiver(post_delete, sender=Book)
-def handle_book_deletion(sender, instance, **kwargs):
-    """Handle book deletion"""
-    print(f"DEBUG: Deleting book {instance.book_id}")
-    gator_library.rb_tree.delete_book(instance.book_id)
-    
+@profiled('signals')
+def handle_book_deletion(sender, instance, using, **kwargs):
+    """Queue a deleted book for removal from the tree"""
+    log_change(ChangeLogEntry.BOOK, instance.book_id, gator_library.origin, using)
+    pending.add(pending.book_ids, using, instance.book_id)
+
 @receiver(post_save, sender=Reservation)
-def handle_reservation(sender, instance, created, **kwargs):
-    """Handle reservation changes"""
+@profiled('signals')
+def handle_reservation(sender, instance, created, using, **kwargs):
+    """Queue new reservations for the book's reservation heap"""
     if created and instance.is_active:
-        node = gator_library.rb_tree.find_node(instance.book.book_id)
-        if node:
-            success = node.reservation_heap.insert(
-                instance.patron.id,
-                instance.priority
-            )
-            if not success:
-                instance.is_active = False
-                instance.save()
\ No newline at end of file
+        log_change(ChangeLogEntry.RESERVATION, instance.pk, gator_library.origin, using)
+        pending.add(pending.reservation_ids, using, instance.pk)
@@ -0,0 +1,482 @@
+import bisect
+import contextlib
+import json
+import random
+import time
+
+from .data_structures.bucket_queue import BucketQueue
+from .data_structures.min_heap import HEAP_SIZE, MinHeap
+from .data_structures.overlay import OverlayLibrary
+from .data_structures.rb_tree import GatorLibrary
+from .data_structures.sharded import ShardedLibrary
+
+STRESS_OPERATIONS = (
+    'insert', 'delete', 'borrow', 'reserve', 'return', 'expire', 'find',
+    'closest', 'closest_available', 'count_available', 'delete_range', 'split_join', 'bounds',
+)
+
+# Default share of each operation
+STRESS_MIX = {
+    'insert': 0.16,
+    'delete': 0.05,
+    'borrow': 0.16,
+    'reserve': 0.14,
+    'return': 0.14,
+    'expire': 0.04,
+    'find': 0.08,
+    'closest': 0.08,
+    'closest_available': 0.06,
+    'count_available': 0.04,
+    'delete_range': 0.01,
+    'split_join': 0.02,
+    'bounds': 0.02,
+}
+
+
+def sharded_engine(queue_class=MinHeap):
+    """Eight shards, so every range and closest search merges across shards"""
+    return ShardedLibrary([GatorLibrary(queue_class) for _ in range(8)])
+
+
+class RebasingOverlay(OverlayLibrary):
+    """OverlayLibrary that folds everything into a new base every `every` inserts.
+
+    Like a master preloading the tree before each fork, so the trace
+    exercises books in the base, copied into the delta and shadowed.
+    """
+    def __init__(self, every=64):
+        super().__init__(GatorLibrary())
+        self.every = every
+        self.inserts = 0
+
+    def insert_book(self, book_id, title, author, availability_status="Yes"):
+        node = super().insert_book(book_id, title, author, availability_status)
+        self.inserts += 1
+        if self.inserts % self.every == 0:
+            self.rebase()
+        return node
+
+    def rebase(self):
+        nodes = list(self.iter_inorder())
+        base = GatorLibrary()
+        built = base.bulk_load([
+            (node.book_id, node.title, node.author, node.availability_status, node.borrowed_by, node.on_hold)
+            for node in nodes
+        ])
+        for node, copy in zip(nodes, built):
+            copy.reservation_heap = node.reservation_heap
+        OverlayLibrary.__init__(self, base)
+
+
+ENGINES = {
+    'heap': lambda: GatorLibrary(MinHeap),
+    'bucket': lambda: GatorLibrary(BucketQueue),
+    'sharded': sharded_engine,
+    'overlay': RebasingOverlay,
+}
+
+
+class ReferenceLibrary:
+    """Obviously-correct model of GatorLibrary on sorted lists and dicts.
+
+    Every operation is a direct transcription of the documented semantics,
+    with none of the tree's balancing, augmentation or heap machinery.
+    """
+    def __init__(self):
+        self.ids = []  # sorted book ids
+        self.available = []  # sorted ids of available books
+        self.books = {}  # book_id -> {'status', 'borrowed_by', 'on_hold', 'queue'}
+
+    def _set_available(self, book_id, available):
+        idx = bisect.bisect_left(self.available, book_id)
+        present = idx < len(self.available) and self.available[idx] == book_id
+        if available and not present:
+            self.available.insert(idx, book_id)
+        elif not available and present:
+            del self.available[idx]
+
+    def insert(self, book_id):
+        bisect.insort(self.ids, book_id)
+        self.books[book_id] = {'status': "Yes", 'borrowed_by': None, 'on_hold': False, 'queue': []}
+        self._set_available(book_id, True)
+
+    def _remove(self, book_id):
+        book = self.books.pop(book_id)
+        del self.ids[bisect.bisect_left(self.ids, book_id)]
+        self._set_available(book_id, False)
+        return [patron for _, _, patron in book['queue']]
+
+    def delete(self, book_id):
+        if book_id not in self.books:
+            return []
+        return self._remove(book_id)
+
+    def delete_range(self, min_id, max_id):
+        doomed = self.ids[bisect.bisect_left(self.ids, min_id):bisect.bisect_right(self.ids, max_id)]
+        return {book_id: self._remove(book_id) for book_id in doomed}
+
+    def borrow(self, patron_id, book_id, priority, reserved_at):
+        book = self.books.get(book_id)
+        if book is None:
+            return False, "Book not found"
+        if book['on_hold'] and book['borrowed_by'] == patron_id:
+            book['on_hold'] = False
+            return True, "Hold claimed successfully"
+        if book['status'] == "No":
+            if len(book['queue']) >= HEAP_SIZE:
+                return False, "Reservation list is full"
+            # Higher priority first, then earlier reservation
+            bisect.insort(book['queue'], (-priority, reserved_at, patron_id))
+            return False, "Book is currently borrowed. Added to reservation list."
+        book['status'] = "No"
+        book['borrowed_by'] = patron_id
+        self._set_available(book_id, False)
+        return True, "Book borrowed successfully"
+
+    def _release(self, book_id, book):
+        if book['queue']:
+            _, _, patron = book['queue'].pop(0)
+            book['borrowed_by'] = patron
+            book['on_hold'] = True
+            return patron
+        book['status'] = "Yes"
+        book['borrowed_by'] = None
+        book['on_hold'] = False
+        self._set_available(book_id, True)
+        return None
+
+    def return_(self, patron_id, book_id):
+        book = self.books.get(book_id)
+        if book is None:
+            return False, "Book not found"
+        if book['borrowed_by'] != patron_id:
+            return False, "Book was not borrowed by this patron"
+        patron = self._release(book_id, book)
+        if patron is not None:
+            return True, f"Book returned and allocated to patron {patron}"
+        return True, "Book returned successfully"
+
+    def expire(self, book_id):
+        book = self.books.get(book_id)
+        if book is None or not book['on_hold']:
+            return False, "No hold to expire"
+        expired = book['borrowed_by']
+        patron = self._release(book_id, book)
+        if patron is not None:
+            return True, f"Hold for patron {expired} expired, allocated to patron {patron}"
+        return True, f"Hold for patron {expired} expired, book is available"
+
+    def find(self, book_id):
+        book = self.books.get(book_id)
+        if book is None:
+            return None
+        return book['status'], book['borrowed_by'], book['on_hold'], [patron for _, _, patron in book['queue']]
+
+    @staticmethod
+    def _closest(ids, target_id):
+        idx = bisect.bisect_left(ids, target_id)
+        candidates = ids[max(0, idx - 1):idx + 1]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda book_id: (abs(book_id - target_id), book_id))
+
+    def closest(self, target_id):
+        return self._closest(self.ids, target_id)
+
+    def closest_available(self, target_id):
+        return self._closest(self.available, target_id)
+
+    def count_available(self, min_id, max_id):
+        if min_id > max_id:
+            return 0
+        return bisect.bisect_right(self.available, max_id) - bisect.bisect_left(self.available, min_id)
+
+    def bounds(self):
+        return (self.ids[0], self.ids[-1]) if self.ids else (None, None)
+
+    def stats(self):
+        return {'books': len(self.ids), 'available': len(self.available), 'unavailable': len(self.ids) - len(self.available)}
+
+
+class StressGenerator:
+    """Seeded random operations, steered by the reference model's state.
+
+    Operations are plain dicts so traces can be saved as JSON and replayed.
+    Reservation timestamps are a strictly increasing counter, so queue
+    order is fully determined.
+    """
+    def __init__(self, model, seed=0, id_space=2000, patrons=50, mix=None):
+        self.model = model
+        self.rng = random.Random(seed)
+        self.id_space = id_space
+        self.patrons = patrons
+        mix = mix or STRESS_MIX
+        self.ops = [op for op in STRESS_OPERATIONS if mix.get(op)]
+        self.weights = [mix[op] for op in self.ops]
+        self.clock = 0
+
+    def _book(self):
+        """Mostly an existing book, sometimes an id that may not exist"""
+        if self.model.ids and self.rng.random() < 0.9:
+            return self.model.ids[self.rng.randrange(len(self.model.ids))]
+        return self.rng.randint(1, self.id_space)
+
+    def _borrowed(self):
+        """Usually a book that is out on loan, so reservations and returns have work to do"""
+        if self.model.ids and self.rng.random() < 0.8:
+            for _ in range(8):
+                book_id = self.model.ids[self.rng.randrange(len(self.model.ids))]
+                if self.model.books[book_id]['status'] == "No":
+                    return book_id
+        return self._book()
+
+    def next_op(self):
+        rng = self.rng
+        op = rng.choices(self.ops, self.weights)[0]
+        if op == 'insert':
+            if self.model.ids and self.model.ids[-1] < self.id_space and rng.random() < 0.3:
+                # Increasing ids, like AutoField, exercise the append fast path
+                return {'op': 'insert', 'book': self.model.ids[-1] + 1}
+            for _ in range(8):
+                book_id = rng.randint(1, self.id_space)
+                if book_id not in self.model.books:
+                    return {'op': 'insert', 'book': book_id}
+            op = 'find'
+        if op in ('borrow', 'reserve'):
+            self.clock += 1
+            book_id = self._borrowed() if op == 'reserve' else self._book()
+            return {
+                'op': 'borrow', 'book': book_id, 'patron': rng.randrange(self.patrons),
+                'priority': rng.choice((1, 2, 3)), 'at': float(self.clock),
+            }
+        if op == 'return':
+            book_id = self._borrowed()
+            book = self.model.books.get(book_id)
+            patron = book['borrowed_by'] if book and book['borrowed_by'] is not None and rng.random() < 0.9 \
+                else rng.randrange(self.patrons)
+            return {'op': 'return', 'book': book_id, 'patron': patron}
+        if op in ('closest', 'closest_available'):
+            return {'op': op, 'target': rng.randint(-10, self.id_space + 10)}
+        if op in ('count_available', 'delete_range', 'split_join'):
+            low = rng.randint(1, self.id_space)
+            width = rng.randint(0, 40) if op == 'delete_range' else rng.randint(0, self.id_space // 2)
+            if op == 'split_join':
+                return {'op': op, 'key': low}
+            return {'op': op, 'min': low, 'max': low + width}
+        return {'op': op, 'book': self._book()}
+
+    def generate(self, count):
+        for _ in range(count):
+            yield self.next_op()
+
+
+class StressFailure(Exception):
+    def __init__(self, index, op, expected, actual):
+        super().__init__(f"Operation {index} {json.dumps(op)}: expected {expected!r}, got {actual!r}")
+        self.index = index
+        self.op = op
+        self.expected = expected
+        self.actual = actual
+
+
+def _node_id(node):
+    return node.book_id if node is not None else None
+
+
+def apply_op(engine, model, op):
+    """Run one operation on both, returns (expected, actual)"""
+    kind = op['op']
+    if kind == 'insert':
+        if op['book'] in model.books:
+            # Duplicate ids are not part of the contract, a shrunk trace may produce them
+            return None, None
+        model.insert(op['book'])
+        node = engine.insert_book(op['book'], f"Book {op['book']}", "Author")
+        return op['book'], node.book_id
+    if kind == 'delete':
+        return model.delete(op['book']), engine.delete_book(op['book'])
+    if kind == 'borrow':
+        return (
+            model.borrow(op['patron'], op['book'], op['priority'], op['at']),
+            engine.borrow_book(op['patron'], op['book'], op['priority'], time_of_reservation=op['at']),
+        )
+    if kind == 'return':
+        return model.return_(op['patron'], op['book']), engine.return_book(op['patron'], op['book'])
+    if kind == 'expire':
+        return model.expire(op['book']), engine.expire_hold(op['book'])
+    if kind == 'find':
+        node = engine.find_node(op['book'])
+        actual = None if node is None else (
+            node.availability_status, node.borrowed_by, node.on_hold,
+            [entry.patron_id for entry in node.reservation_heap.iter_ordered()],
+        )
+        return model.find(op['book']), actual
+    if kind == 'closest':
+        return model.closest(op['target']), _node_id(engine.find_closest_book(op['target']))
+    if kind == 'closest_available':
+        return model.closest_available(op['target']), _node_id(engine.find_closest_available(op['target']))
+    if kind == 'count_available':
+        return model.count_available(op['min'], op['max']), engine.count_available(op['min'], op['max'])
+    if kind == 'delete_range':
+        return model.delete_range(op['min'], op['max']), engine.delete_range(op['min'], op['max'])
+    if kind == 'bounds':
+        return model.bounds(), (_node_id(engine.min()), _node_id(engine.max()))
+    if kind == 'split_join':
+        if not hasattr(engine, 'split'):
+            return None, None
+        # Splitting and joining back must leave the same books in the same states
+        upper = engine.split(op['key'])
+        engine.join(upper)
+        return model.ids, [node.book_id for node in engine.iter_inorder()]
+    raise ValueError(f"Unknown stress operation {kind!r}")
+
+
+def check_engine(engine, model):
+    """Full invariant pass plus whole-catalog comparison, returns (expected, actual) on mismatch"""
+    ok, message = engine.check_invariants()
+    if not ok:
+        return "invariants hold", message
+    stats = engine.availability_stats()
+    if stats != model.stats():
+        return model.stats(), stats
+    ids = [node.book_id for node in engine.iter_inorder()]
+    if ids != model.ids:
+        return model.ids, ids
+    return None
+
+
+class _Discard:
+    """stdout sink for the tree's DEBUG prints"""
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _replay(ops, engine, model, check_every, trace):
+    """Apply ops to engine and model, appending each to trace before it runs.
+
+    Raises StressFailure at the first disagreement, exception or failed
+    invariant check. Returns (operation counts, full checks run).
+    """
+    counts = {}
+    checks = 0
+    index = -1
+    with contextlib.redirect_stdout(_Discard()):
+        for index, op in enumerate(ops):
+            trace.append(op)
+            try:
+                expected, actual = apply_op(engine, model, op)
+            except Exception as exc:
+                raise StressFailure(index, op, "no exception", repr(exc)) from exc
+            if expected != actual:
+                raise StressFailure(index, op, expected, actual)
+            counts[op['op']] = counts.get(op['op'], 0) + 1
+            if check_every and (index + 1) % check_every == 0:
+                checks += 1
+                mismatch = check_engine(engine, model)
+                if mismatch:
+                    raise StressFailure(index, {'op': 'check', 'after': op}, *mismatch)
+        checks += 1
+        mismatch = check_engine(engine, model)
+        if mismatch:
+            raise StressFailure(index + 1, {'op': 'check'}, *mismatch)
+    return counts, checks
+
+
+def run_trace(ops, engine_factory, check_every=0):
+    """Replay a saved trace against a fresh engine and model, see _replay"""
+    return _replay(ops, engine_factory(), ReferenceLibrary(), check_every, [])
+
+
+def _fails(ops, engine_factory, kind):
+    try:
+        run_trace(ops, engine_factory)
+    except StressFailure as failure:
+        return failure.op['op'] == kind
+    return False
+
+
+def shrink_trace(ops, engine_factory, kind=None):
+    """Delta-debug a failing trace down to a short one that still fails.
+
+    Repeatedly drops chunks of operations, halving the chunk size when no
+    chunk can be dropped, and keeps the failure on the same operation kind
+    so the result reproduces the original bug rather than a different one.
+    Results are compared after every operation, invariants once at the end.
+    """
+    if kind is None:
+        try:
+            run_trace(ops, engine_factory)
+        except StressFailure as failure:
+            kind = failure.op['op']
+            # Nothing after the failing operation matters
+            ops = ops[:failure.index + 1]
+        else:
+            return list(ops)
+
+    ops = list(ops)
+    chunk = max(1, len(ops) // 2)
+    while chunk >= 1:
+        start, removed = 0, False
+        while start < len(ops):
+            candidate = ops[:start] + ops[start + chunk:]
+            if candidate and _fails(candidate, engine_factory, kind):
+                ops, removed = candidate, True
+            else:
+                start += chunk
+        if not removed:
+            chunk //= 2
+    return ops
+
+
+class StressRun:
+    """Generate and check operations against one engine, reporting throughput.
+
+    The operations run in rounds of round_size, each on a fresh engine and
+    model with its own derived seed, so a failing trace is at most one round
+    long and cheap to shrink. A StressFailure raised by run() carries that
+    round's trace in its `trace` attribute.
+    """
+    def __init__(self, engine='heap', seed=0, id_space=2000, patrons=50, check_every=1000, round_size=20000):
+        # An ENGINES name or any callable returning a fresh engine
+        self.engine_factory = ENGINES[engine] if isinstance(engine, str) else engine
+        self.seed = seed
+        self.id_space = id_space
+        self.patrons = patrons
+        self.check_every = check_every
+        self.round_size = round_size
+        self.counts = {}
+        self.elapsed = 0.0
+        self.checks = 0
+        self.rounds = 0
+
+    def run(self, total):
+        """Run total operations across as many rounds as needed"""
+        start = time.perf_counter()
+        try:
+            done = 0
+            while done < total:
+                size = min(self.round_size, total - done)
+                model = ReferenceLibrary()
+                generator = StressGenerator(
+                    model, seed=self.seed * 1000003 + self.rounds, id_space=self.id_space, patrons=self.patrons
+                )
+                trace = []
+                try:
+                    counts, checks = _replay(generator.generate(size), self.engine_factory(), model, self.check_every, trace)
+                except StressFailure as failure:
+                    failure.trace = trace
+                    raise
+                for op, count in counts.items():
+                    self.counts[op] = self.counts.get(op, 0) + count
+                self.checks += checks
+                self.rounds += 1
+                done += size
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def ops_per_sec(self):
+        total = sum(self.counts.values())
+        return total / self.elapsed if self.elapsed else 0.0
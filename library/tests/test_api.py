@@ -0,0 +1,268 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from library.data_structures.rb_tree import GatorLibrary
+from library.managers import gator_library
+from library.models import DEFAULT_BRANCH, Book, Reservation
+
+
+class MutationVersionTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        self.node = self.tree.insert_book(1, "Book 1", "Author 1")
+        self.other = self.tree.insert_book(2, "Book 2", "Author 2")
+
+    def test_versions_only_move_forward(self):
+        seen = [self.tree.version]
+        self.tree.borrow_book(101, 1)
+        seen.append(self.tree.version)
+        self.tree.borrow_book(102, 1, 2)
+        seen.append(self.tree.version)
+        self.tree.return_book(101, 1)
+        seen.append(self.tree.version)
+        self.tree.delete_book(2)
+        seen.append(self.tree.version)
+        self.assertEqual(seen, sorted(set(seen)))
+
+    def test_node_version_tracks_its_own_changes(self):
+        other_version = self.other.version
+        self.tree.borrow_book(101, 1)
+        self.assertEqual(self.node.version, self.tree.version)
+        self.assertEqual(self.other.version, other_version)
+
+        # Failed operations leave the version alone
+        version = self.tree.version
+        self.tree.return_book(999, 1)
+        self.assertEqual(self.tree.version, version)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        # Start each test from a tree built from the test database
+        gator_library.reload()
+        self.user = User.objects.create_user('kiosk', password='secret')
+        self.client.login(username='kiosk', password='secret')
+        self.book_id = gator_library.insert_book("Kiosk Book", "Author").book_id
+
+    def test_book_detail_returns_304_until_changed(self):
+        url = f'/api/books/{self.book_id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['availability_status'], "Yes")
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        gator_library.borrow_book(self.user.id, self.book_id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['availability_status'], "No")
+
+    def test_not_modified_skips_the_session_and_user(self):
+        url = f'/api/books/{self.book_id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 302)
+
+    def test_representations_have_distinct_etags(self):
+        etags = {
+            self.client.get(f'/api/books/{self.book_id}/{suffix}')['ETag']
+            for suffix in ('', 'availability/', 'reservations/')
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_list_etag_follows_global_version(self):
+        response = self.client.get('/api/books/')
+        etag = response['ETag']
+        self.assertIn(self.book_id, [book['book_id'] for book in response.json()['books']])
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        gator_library.insert_book("Another Book", "Author")
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_reservation_queue_is_ordered(self):
+        patrons = [User.objects.create_user(f'patron{i}') for i in range(3)]
+        gator_library.borrow_book(self.user.id, self.book_id)
+        gator_library.borrow_book(patrons[0].id, self.book_id, 1)
+        gator_library.borrow_book(patrons[1].id, self.book_id, 3)
+        gator_library.borrow_book(patrons[2].id, self.book_id, 2)
+
+        queue = self.client.get(f'/api/books/{self.book_id}/reservations/').json()['reservations']
+        self.assertEqual([entry['patron_id'] for entry in queue], [patrons[1].id, patrons[2].id, patrons[0].id])
+        self.assertEqual([entry['position'] for entry in queue], [1, 2, 3])
+
+    def test_missing_book_is_404(self):
+        self.assertEqual(self.client.get('/api/books/999999/').status_code, 404)
+
+
+class BookDetailQueueTests(TestCase):
+    def setUp(self):
+        # Start each test from a tree built from the test database
+        gator_library.reload()
+        self.owner = User.objects.create_user('owner', password='secret')
+        self.patrons = [User.objects.create_user(f'reader{i}', password='secret') for i in range(3)]
+        self.book_id = gator_library.insert_book("Queued Book", "Author").book_id
+        gator_library.borrow_book(self.owner.id, self.book_id)
+
+    def test_reserve_action_queues_and_renders_in_order(self):
+        for patron, priority in zip(self.patrons, ('1', '3', '2')):
+            self.client.force_login(patron)
+            self.client.post(f'/book/{self.book_id}/', {'action': 'reserve', 'priority': priority})
+
+        self.client.force_login(self.patrons[0])
+        response = self.client.get(f'/book/{self.book_id}/')
+        queue = response.context['reservations']
+        self.assertEqual([entry['patron'] for entry in queue], [self.patrons[1], self.patrons[2], self.patrons[0]])
+        self.assertEqual(response.context['queue_position'], 3)
+        self.assertContains(response, "Your position: 3")
+
+    @override_settings(GATOR_RESERVATION_QUEUE='bucket')
+    def test_out_of_range_priority_is_rejected(self):
+        gator_library.reload()
+        self.addCleanup(gator_library.reload)
+        self.client.force_login(self.patrons[0])
+        for priority in ('0', '4'):
+            response = self.client.post(f'/book/{self.book_id}/', {'action': 'reserve', 'priority': priority}, follow=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "Priority must be 1 (Low), 2 (Medium), 3 (High)")
+        self.assertEqual(gator_library.rb_tree.find_node(self.book_id).reservation_heap.get_size(), 0)
+
+
+class AddBookViewTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        self.client.force_login(User.objects.create_user('librarian', password='secret'))
+
+    def test_branch_is_optional(self):
+        response = self.client.post('/book/add/', {'title': "No Branch", 'author': "Author"})
+        book = Book.objects.get(title="No Branch")
+        self.assertRedirects(response, f'/book/{book.book_id}/', fetch_redirect_response=False)
+        self.assertEqual(book.branch, DEFAULT_BRANCH)
+        self.assertEqual(gator_library.rb_tree.branch_of(book.book_id), DEFAULT_BRANCH)
+
+    def test_branch_is_kept(self):
+        self.client.post('/book/add/', {'title': "East Book", 'author': "Author", 'branch': 'east'})
+        self.assertEqual(Book.objects.get(title="East Book").branch, 'east')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        self.client.force_login(User.objects.create_user('reader', password='secret'))
+        self.book_ids = [gator_library.insert_book(f"Book {i}", "Author").book_id for i in range(5)]
+
+    def test_export_streams_every_book_across_chunks(self):
+        from library import views
+        original, views.EXPORT_CHUNK_SIZE = views.EXPORT_CHUNK_SIZE, 2
+        self.addCleanup(setattr, views, 'EXPORT_CHUNK_SIZE', original)
+        response = self.client.get('/export/')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['book_id'] for row in rows], self.book_ids)
+
+        response = self.client.get('/export/', {'format': 'csv', 'min_id': self.book_ids[3]})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+
+class PopularBooksApiTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        self.patron = User.objects.create_user('reader', password='secret')
+        self.ids = [gator_library.insert_book(f"Book {i}", "Author").book_id for i in range(3)]
+        for book_id, loans in zip(self.ids, (1, 3, 2)):
+            for _ in range(loans):
+                gator_library.borrow_book(self.patron.id, book_id)
+                gator_library.return_book(self.patron.id, book_id)
+
+    def test_leaderboard_is_ranked_and_limited(self):
+        self.client.force_login(self.patron)
+        response = self.client.get('/api/books/popular/?k=2')
+        books = response.json()['books']
+        self.assertEqual([(book['book_id'], book['loans']) for book in books], [(self.ids[1], 3), (self.ids[2], 2)])
+        self.assertEqual(self.client.get('/api/books/popular/?k=x').status_code, 400)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        caches['template_fragments'].clear()
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+        self.book_ids = [gator_library.insert_book(f"Book {i}", "Author").book_id for i in range(5)]
+        self.client.force_login(self.alice)
+
+    def test_unchanged_list_is_served_from_cache(self):
+        first = self.client.get('/')
+        self.assertEqual(len(caches['template_fragments']._cache), 1 + len(self.book_ids))
+        with self.assertNumQueries(3):
+            # Session, user and the user's loans; no book rows
+            second = self.client.get('/')
+        self.assertEqual(first.content, second.content)
+
+    def test_borrow_invalidates_only_that_row(self):
+        self.client.get('/')
+        cache = caches['template_fragments']
+        before = set(cache._cache)
+        gator_library.borrow_book(self.bob.id, self.book_ids[2])
+
+        response = self.client.get('/')
+        self.assertContains(response, "bg-danger", count=1)
+        # A new page fragment and one new row
+        self.assertEqual(len(set(cache._cache) - before), 2)
+
+    def test_user_controls_stay_out_of_shared_fragments(self):
+        gator_library.borrow_book(self.alice.id, self.book_ids[0])
+        response = self.client.get('/')
+        self.assertContains(response, 'value="return"', count=1)
+
+        self.client.force_login(self.bob)
+        response = self.client.get('/')
+        self.assertNotContains(response, 'value="return"')
+        self.assertNotContains(response, "Delete")
+
+        self.bob.is_staff = True
+        self.bob.save()
+        self.assertContains(self.client.get('/'), "Delete", count=len(self.book_ids))
+
+    def test_detail_reservations_follow_the_tree(self):
+        book_id = self.book_ids[0]
+        gator_library.borrow_book(self.bob.id, book_id)
+        self.assertNotContains(self.client.get(f'/book/{book_id}/'), "Current Reservations")
+
+        self.client.post(f'/book/{book_id}/', {'action': 'reserve', 'priority': '2'})
+        response = self.client.get(f'/book/{book_id}/')
+        self.assertContains(response, "Current Reservations")
+        self.assertContains(response, "Your position: 1")
+
+    @override_settings(GATOR_FRAGMENT_CACHE_SECONDS=0)
+    def test_zero_timeout_disables_caching(self):
+        self.client.get('/')
+        with self.assertNumQueries(4):
+            # The book rows are read again
+            self.client.get('/')
+
+    @override_settings(GATOR_FRAGMENT_CACHE_SECONDS=0)
+    def test_rows_missing_from_the_tree_share_one_count_query(self):
+        # bulk_create skips the signals, so these rows never reach the tree
+        missing = Book.objects.bulk_create([Book(title=f"Unsynced {i}", author="Author") for i in range(3)])
+        Reservation.objects.bulk_create([
+            Reservation(book=book, patron=patron)
+            for book in missing
+            for patron in (self.alice, self.bob)
+        ])
+        with self.assertNumQueries(5):
+            # Session, user, books, the missing rows' reservation counts and the user's loans
+            response = self.client.get('/')
+        rows = {book.book_id: book.reservation_count for book in response.context['rows']()}
+        self.assertEqual([rows[book.book_id] for book in missing], [2, 2, 2])
+        self.assertEqual(rows[self.book_ids[0]], 0)
\ No newline at end of file
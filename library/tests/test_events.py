@@ -0,0 +1,121 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase
+from library.events import EventBroker
+from library.managers import gator_library
+from library.models import Book
+
+
+def parse_sse(chunk):
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode()
+    kind, data = chunk.strip().split("\n")
+    return kind[len("event: "):], json.loads(data[len("data: "):])
+
+
+class EventBrokerTests(TestCase):
+    async def test_publish_from_another_thread_reaches_subscriber(self):
+        broker = EventBroker()
+        subscription = broker.subscribe(7)
+        self.assertTrue(broker.watching(7))
+        thread = threading.Thread(target=broker.publish, args=(7, 'availability'), kwargs={'borrowed_by': 3})
+        thread.start()
+        thread.join()
+
+        event = await subscription.get(timeout=1)
+        self.assertEqual(event, {'type': 'availability', 'book_id': 7, 'borrowed_by': 3})
+        self.assertEqual(broker.publish(8, 'availability'), 0)
+
+    async def test_slow_subscriber_keeps_newest_events(self):
+        broker = EventBroker(queue_size=2)
+        subscription = broker.subscribe(1)
+        for position in range(4):
+            broker.publish(1, 'queue', position=position)
+        await asyncio.sleep(0)
+
+        events = [await subscription.get(timeout=1) for _ in range(2)]
+        self.assertEqual([event['position'] for event in events], [2, 3])
+        self.assertEqual(broker.dropped, 2)
+        self.assertIsNone(await subscription.get(timeout=0.01))
+
+    async def test_unsubscribe_stops_delivery(self):
+        broker = EventBroker()
+        subscription = broker.subscribe(1)
+        broker.unsubscribe(subscription)
+        self.assertFalse(broker.watching(1))
+        self.assertEqual(broker.publish(1, 'queue'), 0)
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+
+class BookEventStreamTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        self.owner = User.objects.create_user('owner')
+        self.waiting = User.objects.create_user('waiting')
+        self.book_id = gator_library.insert_book("Awaited Book", "Author").book_id
+        gator_library.borrow_book(self.owner.id, self.book_id)
+        gator_library.borrow_book(self.waiting.id, self.book_id, 2)
+
+    async def open_stream(self, user):
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(f'/book/{self.book_id}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content.__aiter__()
+
+    async def next_event(self, chunks):
+        return parse_sse(await asyncio.wait_for(chunks.__anext__(), timeout=5))
+
+    async def test_waiting_patron_is_told_about_allocation(self):
+        chunks = await self.open_stream(self.waiting)
+        kind, state = await self.next_event(chunks)
+        self.assertEqual(kind, 'state')
+        self.assertEqual((state['position'], state['queue_length']), (1, 1))
+        self.assertNotIn('queue', state)
+
+        await sync_to_async(gator_library.return_book)(self.owner.id, self.book_id)
+        kind, event = await self.next_event(chunks)
+        self.assertEqual(kind, 'allocated')
+        self.assertTrue(event['allocated_to_you'])
+        self.assertTrue(event['on_hold'])
+        self.assertIsNone(event['position'])
+        await chunks.aclose()
+
+    async def test_queue_and_delete_events(self):
+        chunks = await self.open_stream(self.owner)
+        kind, state = await self.next_event(chunks)
+        self.assertTrue(state['borrowed_by_you'])
+
+        late = await sync_to_async(User.objects.create_user)('late')
+        await sync_to_async(gator_library.borrow_book)(late.id, self.book_id, 1)
+        kind, event = await self.next_event(chunks)
+        self.assertEqual((kind, event['queue_length']), ('queue', 2))
+
+        await sync_to_async(gator_library.delete_book)(self.book_id)
+        kind, event = await self.next_event(chunks)
+        self.assertEqual(kind, 'deleted')
+        with self.assertRaises(StopAsyncIteration):
+            await chunks.__anext__()
+        self.assertFalse(gator_library.events.watching(self.book_id))
+
+    async def test_requires_login_and_known_book(self):
+        response = await self.async_client.get(f'/book/{self.book_id}/events/')
+        self.assertEqual(response.status_code, 403)
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get('/book/999999/events/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_book_in_unloaded_branch(self):
+        book = await sync_to_async(Book.objects.create)(title="East Book", author="Author", branch='east')
+        await sync_to_async(gator_library.reload)()
+        self.assertNotIn('east', gator_library.rb_tree.trees)
+
+        self.book_id = book.book_id
+        chunks = await self.open_stream(self.owner)
+        kind, state = await self.next_event(chunks)
+        self.assertEqual((kind, state['availability_status']), ('state', 'Yes'))
+        self.assertIn('east', gator_library.rb_tree.trees)
+        await chunks.aclose()
@@ -0,0 +1,630 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from library.data_structures.bucket_queue import BucketQueue
+from library.data_structures.overlay import OverlayLibrary
+from library.managers import GatorLibraryManager, gator_library
+from library.write_behind import WriteBehindQueue
+from library.models import Book, ChangeLogEntry, LoanHistory
+
+
+class AtomicBorrowTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.book = Book.objects.create(title="Contended Book", author="Author")
+        # Two workers, each with its own tree built from the same rows
+        self.worker_a = GatorLibraryManager()
+        self.worker_b = GatorLibraryManager()
+
+    def test_only_one_worker_can_lend_a_book(self):
+        success_a, _ = self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        success_b, message_b = self.worker_b.borrow_book(self.bob.id, self.book.book_id)
+
+        self.assertTrue(success_a)
+        self.assertFalse(success_b)
+        self.assertIn("reservation", message_b.lower())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.borrowed_by_id, self.alice.id)
+
+        # Worker B's tree has caught up and queued Bob behind Alice
+        node = self.worker_b.rb_tree.find_node(self.book.book_id)
+        self.assertEqual(node.borrowed_by, self.alice.id)
+        self.assertEqual(node.reservation_heap.position_of(self.bob.id), 1)
+
+    @override_settings(GATOR_CHANGE_FEED=False)
+    def test_borrow_and_return_query_counts(self):
+        # The conditional UPDATE and the LoanHistory INSERT
+        with self.assertNumQueries(2):
+            success, _ = self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.assertTrue(success)
+        with self.assertNumQueries(1):
+            success, _ = self.worker_a.borrow_book(self.bob.id, self.book.book_id, 2)
+        self.assertFalse(success)
+        with self.assertNumQueries(1):
+            success, message = self.worker_a.return_book(self.alice.id, self.book.book_id)
+        self.assertTrue(success)
+        self.assertIn(f"allocated to patron {self.bob.id}", message)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.borrowed_by_id, self.bob.id)
+        self.assertIsNotNone(self.book.hold_expires_at)
+
+    def test_stale_return_is_rejected_and_resynced(self):
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.worker_b.rb_tree.sync_status(self.worker_b.rb_tree.find_node(self.book.book_id), "No", self.alice.id)
+        self.worker_a.return_book(self.alice.id, self.book.book_id)
+
+        # Worker B still thinks Alice has the book
+        success, _ = self.worker_b.return_book(self.alice.id, self.book.book_id)
+        self.assertFalse(success)
+        self.assertEqual(self.worker_b.rb_tree.find_node(self.book.book_id).availability_status, "Yes")
+
+    def test_borrow_after_another_worker_returned(self):
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.worker_b.rb_tree.sync_status(self.worker_b.rb_tree.find_node(self.book.book_id), "No", self.alice.id)
+        self.worker_a.return_book(self.alice.id, self.book.book_id)
+
+        success, _ = self.worker_b.borrow_book(self.bob.id, self.book.book_id)
+        self.assertTrue(success)
+        self.assertEqual(self.worker_b.rb_tree.find_node(self.book.book_id).borrowed_by, self.bob.id)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        self.book = Book.objects.create(title="Shared Book", author="Author")
+        self.worker_a = GatorLibraryManager()
+        self.worker_b = GatorLibraryManager()
+
+    def node_b(self):
+        return self.worker_b.rb_tree.find_node(self.book.book_id)
+
+    def test_writes_log_one_entry_in_the_same_query_budget(self):
+        with self.assertNumQueries(3):
+            self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        entry = ChangeLogEntry.objects.latest('id')
+        self.assertEqual((entry.kind, entry.object_id, entry.origin), (ChangeLogEntry.LOAN, self.book.book_id, self.worker_a.origin))
+
+    def test_sync_applies_other_workers_loans_and_reservations(self):
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.worker_a.borrow_book(self.bob.id, self.book.book_id, 1)
+        self.worker_a.borrow_book(self.carol.id, self.book.book_id, 3)
+        self.assertEqual(self.node_b().availability_status, "Yes")
+
+        self.assertEqual(self.worker_b.sync(), 3)
+        node = self.node_b()
+        self.assertEqual((node.availability_status, node.borrowed_by), ("No", self.alice.id))
+        self.assertEqual([entry.patron_id for entry in node.reservation_heap.peek(2)], [self.carol.id, self.bob.id])
+        self.assertIn(("due", self.book.book_id), self.worker_b.scheduler.wheel)
+
+        self.worker_a.return_book(self.alice.id, self.book.book_id)
+        self.assertEqual(self.worker_b.sync(), 1)
+        node = self.node_b()
+        self.assertEqual(node.borrowed_by, self.carol.id)
+        self.assertEqual([entry.patron_id for entry in node.reservation_heap.peek(2)], [self.bob.id])
+        self.assertTrue(self.worker_b.rb_tree.check_invariants()[0])
+
+    def test_own_entries_are_skipped(self):
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.worker_a.borrow_book(self.bob.id, self.book.book_id)
+        self.assertEqual(self.worker_a.sync(), 0)
+        self.assertEqual(self.worker_a.rb_tree.find_node(self.book.book_id).reservation_heap.get_size(), 1)
+        self.assertEqual(self.worker_a.change_feed.version, ChangeLogEntry.objects.latest('id').id)
+
+    def test_late_committing_entry_is_picked_up_from_gaps(self):
+        ChangeLogEntry.objects.create(kind=ChangeLogEntry.BOOK, object_id=self.book.book_id, origin='other')
+        late = ChangeLogEntry.objects.create(kind=ChangeLogEntry.BOOK, object_id=self.book.book_id, origin='other')
+        last = ChangeLogEntry.objects.create(kind=ChangeLogEntry.BOOK, object_id=self.book.book_id, origin='other')
+        # Entry "late" has not committed yet when worker B polls
+        late_id = late.id
+        late.delete()
+        self.assertEqual(self.worker_b.sync(), 2)
+        self.assertEqual(self.worker_b.change_feed.version, last.id)
+        self.assertIn(late_id, self.worker_b.change_feed.gaps)
+
+        ChangeLogEntry.objects.create(id=late_id, kind=ChangeLogEntry.BOOK, object_id=self.book.book_id, origin='other')
+        self.assertEqual(self.worker_b.sync(), 1)
+        self.assertEqual(self.worker_b.change_feed.gaps, {})
+        self.assertEqual(self.worker_b.change_feed.version, last.id)
+
+    def test_stats_report_position_and_lag(self):
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.worker_b.sync()
+        stats = self.worker_b.change_feed.stats()
+        self.assertEqual(stats['version'], ChangeLogEntry.objects.latest('id').id)
+        self.assertEqual(stats['applied'], 1)
+        self.assertTrue(stats['caught_up'])
+        self.assertGreaterEqual(stats['lag_seconds'], 0.0)
+
+    @override_settings(GATOR_CHANGE_FEED=False)
+    def test_disabled_feed_logs_nothing(self):
+        before = ChangeLogEntry.objects.count()
+        self.worker_a.borrow_book(self.alice.id, self.book.book_id)
+        self.assertEqual(ChangeLogEntry.objects.count(), before)
+        self.assertEqual(self.worker_b.change_feed.maybe_poll(), 0)
+
+
+class ConcurrentBorrowTests(TransactionTestCase):
+    def test_concurrent_borrowers_single_winner(self):
+        patrons = [User.objects.create_user(f'patron{i}') for i in range(8)]
+        book = Book.objects.create(title="Hot Book", author="Author")
+        workers = [GatorLibraryManager() for _ in patrons]
+        barrier = threading.Barrier(len(patrons))
+        results = []
+        errors = []
+
+        def borrow(worker, patron):
+            try:
+                barrier.wait()
+                results.append(worker.borrow_book(patron.id, book.book_id)[0])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow, args=pair) for pair in zip(workers, patrons)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), len(patrons))
+        self.assertEqual(results.count(True), 1)
+        book.refresh_from_db()
+        self.assertIn(book.borrowed_by_id, [patron.id for patron in patrons])
+
+    def test_reservation_during_release_waits_for_the_allocation(self):
+        alice, bob, carol = (User.objects.create_user(name) for name in ('alice', 'bob', 'carol'))
+        book = Book.objects.create(title="Returned Book", author="Author")
+        manager = GatorLibraryManager()
+        manager.borrow_book(alice.id, book.book_id)
+        manager.borrow_book(bob.id, book.book_id, 1)
+        node = manager.rb_tree.find_node(book.book_id)
+
+        def reserve():
+            # A higher priority reservation arriving while the row is written
+            with manager.tree_lock:
+                manager.rb_tree.borrow_book(carol.id, book.book_id, 3, node=node)
+
+        racer = threading.Thread(target=reserve)
+
+        def race_update(execute, sql, params, many, context):
+            if sql.startswith('UPDATE') and racer.ident is None:
+                racer.start()
+                racer.join(0.2)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(race_update):
+            self.assertTrue(manager.return_book(alice.id, book.book_id)[0])
+        racer.join()
+
+        book.refresh_from_db()
+        self.assertEqual((book.borrowed_by_id, node.borrowed_by), (bob.id, bob.id))
+        self.assertEqual(node.reservation_heap.position_of(carol.id), 1)
+
+    def test_sampled_invariant_check_waits_for_the_tree_lock(self):
+        Book.objects.create(title="Checked Book", author="Author")
+        manager = GatorLibraryManager()
+        manager.invariant_sample_paths = 4
+        with manager.tree_lock:
+            checker = threading.Thread(target=manager._verify_recent)
+            checker.start()
+            checker.join(0.2)
+            self.assertTrue(checker.is_alive())
+        checker.join()
+        self.assertTrue(manager.rb_tree.last_invariant_check['ok'])
+
+    def test_background_changes_wait_for_the_tree_lock(self):
+        books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(2)]
+        manager = GatorLibraryManager()
+        Book.objects.filter(book_id=books[1].book_id).update(title="Renamed")
+
+        def run(target, *args):
+            try:
+                target(*args)
+            finally:
+                connection.close()
+
+        with manager.tree_lock:
+            threads = [
+                threading.Thread(target=run, args=(manager.delete_book, books[0].book_id)),
+                threading.Thread(target=run, args=(manager.apply_changes, {books[1].book_id})),
+            ]
+            for thread in threads:
+                thread.start()
+                thread.join(0.2)
+                self.assertTrue(thread.is_alive())
+            self.assertIsNotNone(manager.rb_tree.find_node(books[0].book_id))
+            self.assertEqual(manager.rb_tree.find_node(books[1].book_id).title, "Book 1")
+        for thread in threads:
+            thread.join()
+
+        self.assertIsNone(manager.rb_tree.find_node(books[0].book_id))
+        self.assertEqual(manager.rb_tree.find_node(books[1].book_id).title, "Renamed")
+        self.assertTrue(manager.check_invariants()[0])
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(3)]
+        self.book = self.books[0]
+        self.manager = GatorLibraryManager(write_behind=False)
+        # Flushed only by barrier(), in this thread
+        self.manager.write_behind = WriteBehindQueue(self.manager, workers=0, max_pending=2, policy='caller_runs')
+
+    def test_requests_do_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            success, _ = self.manager.borrow_book(self.alice.id, self.book.book_id)
+        self.assertTrue(success)
+        self.assertEqual(self.manager.rb_tree.find_node(self.book.book_id).borrowed_by, self.alice.id)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability_status, "Yes")
+
+        self.assertTrue(self.manager.barrier())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.availability_status, self.book.borrowed_by_id), ("No", self.alice.id))
+        self.assertIsNotNone(self.book.due_at)
+
+    def test_writes_to_one_book_are_coalesced(self):
+        self.manager.borrow_book(self.alice.id, self.book.book_id)
+        self.manager.borrow_book(self.bob.id, self.book.book_id, 2)
+        self.manager.return_book(self.alice.id, self.book.book_id)
+        with self.assertNumQueries(5):
+            # Transaction, one bulk UPDATE, one INSERT each of the loans and the log entries, commit
+            self.manager.barrier()
+
+        stats = self.manager.write_behind.stats()
+        self.assertEqual((stats['enqueued'], stats['coalesced'], stats['rows_written']), (3, 2, 1))
+        self.assertEqual(stats['depth'], 0)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.borrowed_by_id, self.bob.id)
+        self.assertIsNotNone(self.book.hold_expires_at)
+        self.assertIsNone(self.book.due_at)
+        self.assertEqual(LoanHistory.objects.filter(book_id=self.book.book_id, patron_id=self.alice.id).count(), 1)
+
+    def test_flushed_changes_reach_other_workers(self):
+        other = GatorLibraryManager()
+        self.manager.borrow_book(self.alice.id, self.book.book_id)
+        self.manager.borrow_book(self.bob.id, self.book.book_id, 3)
+        self.assertEqual(other.sync(), 0)
+
+        self.manager.barrier()
+        other.sync()
+        node = other.rb_tree.find_node(self.book.book_id)
+        self.assertEqual(node.borrowed_by, self.alice.id)
+        self.assertEqual(node.reservation_heap.position_of(self.bob.id), 1)
+
+    def test_full_queue_makes_the_caller_flush(self):
+        for book in self.books:
+            self.manager.borrow_book(self.alice.id, book.book_id)
+        stats = self.manager.write_behind.stats()
+        self.assertEqual(stats['caller_flushes'], 1)
+        self.assertEqual(stats['depth'], 1)
+        self.assertEqual(Book.objects.filter(borrowed_by=self.alice).count(), 2)
+
+    def test_delete_drops_the_row_write_but_keeps_loans_and_log(self):
+        self.manager.borrow_book(self.alice.id, self.book.book_id)
+        self.manager.delete_book(self.book.book_id)
+        self.assertIsNone(self.manager.write_behind.pending[self.book.book_id].fields)
+        self.assertFalse(Book.objects.filter(book_id=self.book.book_id).exists())
+
+        self.assertTrue(self.manager.barrier())
+        self.assertEqual(LoanHistory.objects.filter(book_id=self.book.book_id, patron_id=self.alice.id).count(), 1)
+        self.assertTrue(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.LOAN, object_id=self.book.book_id).exists())
+
+    def test_late_put_does_not_overwrite_newer_state(self):
+        queue = self.manager.write_behind
+        queue.put(self.book.book_id, {'availability_status': "Yes"}, ChangeLogEntry.BOOK, version=7)
+        queue.put(self.book.book_id, {'availability_status': "No"}, ChangeLogEntry.LOAN, version=6)
+        item = queue.pending[self.book.book_id]
+        self.assertEqual((item.fields, item.version), ({'availability_status': "Yes"}, 7))
+        self.assertEqual([version for version, _ in sorted(item.log)], [6, 7])
+
+    def test_barrier_without_workers_drops_a_failing_row(self):
+        queue = WriteBehindQueue(self.manager, workers=0, interval=0, max_attempts=3)
+        self.manager.write_behind = queue
+        for book in self.books:
+            self.manager.borrow_book(self.alice.id, book.book_id)
+        queue.pending[self.book.book_id].fields['due_at'] = "not a date"
+
+        self.assertTrue(self.manager.barrier())
+        self.assertEqual(queue.stats()['dropped'], [self.book.book_id])
+        self.assertEqual(Book.objects.filter(borrowed_by=self.alice).count(), len(self.books) - 1)
+
+    def test_caller_flush_runs_outside_the_tree_lock(self):
+        queue = self.manager.write_behind
+        write = queue._write
+        locked = []
+
+        def try_lock():
+            acquired = self.manager.tree_lock.acquire(timeout=0.5)
+            locked.append(not acquired)
+            if acquired:
+                self.manager.tree_lock.release()
+
+        def probe(batch):
+            # The tree lock is reentrant, so ask from another thread
+            prober = threading.Thread(target=try_lock)
+            prober.start()
+            prober.join()
+            write(batch)
+
+        queue._write = probe
+        for book in self.books:
+            self.manager.borrow_book(self.alice.id, book.book_id)
+        self.assertEqual(locked, [False])
+
+
+class BackgroundWriteBehindTests(TransactionTestCase):
+    def test_background_flush_and_barrier(self):
+        alice = User.objects.create_user('alice')
+        books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(50)]
+        manager = GatorLibraryManager(write_behind=False)
+        manager.write_behind = WriteBehindQueue(manager, workers=2, batch_size=10, interval=0.01)
+        try:
+            for book in books:
+                manager.borrow_book(alice.id, book.book_id)
+            self.assertTrue(manager.barrier(timeout=10))
+            self.assertEqual(Book.objects.filter(borrowed_by=alice).count(), len(books))
+
+            stats = manager.write_behind.stats()
+            self.assertEqual(stats['rows_written'], len(books))
+            self.assertGreaterEqual(stats['batches'], 5)
+            self.assertGreater(stats['flush_ms_max'], 0.0)
+        finally:
+            manager.write_behind.close()
+
+    def test_failing_row_is_dropped_without_blocking_the_batch(self):
+        alice = User.objects.create_user('alice')
+        books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(5)]
+        manager = GatorLibraryManager(write_behind=False)
+        manager.write_behind = WriteBehindQueue(manager, workers=1, batch_size=10, interval=0.01, max_attempts=4)
+        try:
+            with manager.write_behind._cond:
+                for book in books:
+                    manager.borrow_book(alice.id, book.book_id)
+                # A row the database will never accept
+                manager.write_behind.pending[books[2].book_id].fields['due_at'] = "not a date"
+            self.assertTrue(manager.barrier(timeout=10))
+
+            borrowed = set(Book.objects.filter(borrowed_by=alice).values_list('book_id', flat=True))
+            self.assertEqual(borrowed, {book.book_id for book in books} - {books[2].book_id})
+            stats = manager.write_behind.stats()
+            self.assertEqual((stats['rows_dropped'], stats['dropped'], stats['depth']), (1, [books[2].book_id], 0))
+            # Two whole-batch failures, then the bad row alone until it is dropped
+            self.assertEqual(stats['errors'], 4)
+        finally:
+            manager.write_behind.close()
+
+
+class ShardedManagerTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(10)]
+        self.ids = [book.book_id for book in self.books]
+        self.manager = GatorLibraryManager(shards=3, shard_workers=1)
+
+    def test_shards_partition_the_catalog(self):
+        tree = self.manager.rb_tree.tree('main')
+        self.assertEqual(len(tree.shards), 3)
+        self.assertEqual([node.book_id for node in self.manager.iter_books()], self.ids)
+        # Sequential ids fill the shards evenly
+        self.assertEqual(sorted(shard.root.size for shard in tree.shards), [3, 3, 4])
+        self.assertTrue(self.manager.check_invariants()[0])
+
+    def test_operations_route_to_shards(self):
+        book_id = self.ids[5]
+        success, _ = self.manager.borrow_book(self.alice.id, book_id)
+        self.assertTrue(success)
+        self.assertEqual(self.manager.rb_tree.find_node(book_id).borrowed_by, self.alice.id)
+        self.assertTrue(self.manager.return_book(self.alice.id, book_id)[0])
+
+        self.manager.delete_book(self.ids[4])
+        self.assertEqual(self.manager.find_closest_book(self.ids[4]).book_id, self.ids[3])
+        node = self.manager.insert_book("New Book", "Author")
+        shards = self.manager.rb_tree.tree('main').shards
+        self.assertIs(shards[node.book_id % 3].find_node(node.book_id), node)
+
+    def test_loans_and_deadlines_survive_reload(self):
+        self.manager.borrow_book(self.alice.id, self.ids[0])
+        reloaded = GatorLibraryManager(shards=3, shard_workers=1)
+        self.assertEqual(reloaded.rb_tree.find_node(self.ids[0]).borrowed_by, self.alice.id)
+        self.assertIn(("due", self.ids[0]), reloaded.scheduler.wheel)
+
+
+class DeleteRangeTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.ids = [Book.objects.create(title=f"Book {i}", author="Author").book_id for i in range(12)]
+        self.manager = GatorLibraryManager(shards=2, shard_workers=1)
+
+    def test_range_is_removed_from_tree_and_database(self):
+        self.manager.borrow_book(self.alice.id, self.ids[4])
+        self.manager.borrow_book(self.bob.id, self.ids[4])
+
+        removed = self.manager.delete_range(self.ids[3], self.ids[8])
+        self.assertEqual(list(removed), self.ids[3:9])
+        self.assertEqual(removed[self.ids[4]], [self.bob.id])
+        self.assertEqual(list(Book.objects.values_list('book_id', flat=True)), self.ids[:3] + self.ids[9:])
+        self.assertEqual([node.book_id for node in self.manager.iter_books()], self.ids[:3] + self.ids[9:])
+        self.assertNotIn(("due", self.ids[4]), self.manager.scheduler.wheel)
+        self.assertTrue(self.manager.check_invariants()[0])
+
+
+class BranchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.main = [Book.objects.create(title=f"Main {i}", author="Author").book_id for i in range(3)]
+        self.east = [Book.objects.create(title=f"East {i}", author="Author", branch='east').book_id for i in range(3)]
+        self.manager = GatorLibraryManager()
+
+    def test_only_default_branch_is_loaded_at_startup(self):
+        tree = self.manager.rb_tree
+        self.assertEqual(tree.branches(), ['east', 'main'])
+        self.assertEqual(list(tree.trees), ['main'])
+        self.assertEqual(self.manager.availability_stats(), {'books': 6, 'available': 6, 'unavailable': 0})
+        self.assertEqual(self.manager.find_closest_book(self.main[0]).book_id, self.main[0])
+        self.assertEqual(list(tree.trees), ['main'])
+
+        with self.assertNumQueries(1):
+            node = tree.find_node(self.east[1])
+        self.assertEqual(node.title, "East 1")
+        self.assertIsNone(tree.tree('main').find_node(self.east[1]))
+        self.assertTrue(self.manager.check_invariants()[0])
+
+    def test_closest_search_merges_branches(self):
+        self.assertEqual(self.manager.find_closest_book(self.east[0]).book_id, self.east[0])
+        self.assertEqual(self.manager.find_closest_book(self.east[0], ['main']).book_id, self.main[2])
+        self.manager.borrow_book(self.alice.id, self.east[0])
+        # Both neighbours are one away, ties go to the smaller id
+        self.assertEqual(self.manager.find_closest_available(self.east[0]).book_id, self.main[2])
+        self.assertEqual(self.manager.find_closest_available(self.east[0], ['east']).book_id, self.east[1])
+
+    def test_new_and_moved_books_follow_their_branch(self):
+        node = self.manager.insert_book("West", "Author", branch='west')
+        self.assertEqual(Book.objects.get(book_id=node.book_id).branch, 'west')
+        self.assertIs(self.manager.rb_tree.tree('west').find_node(node.book_id), node)
+
+        # Edits reach the global manager through the post_save signal
+        gator_library.reload()
+        gator_library.borrow_book(self.alice.id, self.main[0])
+        gator_library.borrow_book(self.bob.id, self.main[0])
+        book = Book.objects.get(book_id=self.main[0])
+        book.branch = 'east'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        moved = gator_library.rb_tree.tree('east').find_node(self.main[0])
+        self.assertEqual(moved.borrowed_by, self.alice.id)
+        self.assertEqual(moved.reservation_heap.get_size(), 1)
+        self.assertIsNone(gator_library.rb_tree.tree('main').find_node(self.main[0]))
+        self.assertTrue(gator_library.check_invariants()[0])
+
+    @override_settings(GATOR_BRANCH_MEMORY_BUDGET=1, GATOR_BRANCH_IDLE_SECONDS=0)
+    def test_evicted_branch_restores_loans_and_queues(self):
+        manager = GatorLibraryManager()
+        manager.borrow_book(self.alice.id, self.east[0])
+        manager.borrow_book(self.bob.id, self.east[0])
+        self.assertEqual(list(manager.rb_tree.trees), ['east'])
+
+        node = manager.rb_tree.find_node(self.main[0])
+        self.assertEqual(list(manager.rb_tree.trees), ['main'])
+        self.assertEqual(manager.availability_stats()['unavailable'], 1)
+
+        self.assertTrue(manager.return_book(self.alice.id, self.east[0])[0])
+        restored = manager.rb_tree.find_node(self.east[0])
+        self.assertEqual(restored.borrowed_by, self.bob.id)
+        self.assertTrue(restored.on_hold)
+        self.assertIsNotNone(node)
+
+    @override_settings(GATOR_BRANCH_MEMORY_BUDGET=1, GATOR_BRANCH_IDLE_SECONDS=0)
+    def test_branch_with_queued_writes_is_not_evicted(self):
+        manager = GatorLibraryManager()
+        manager.write_behind = WriteBehindQueue(manager, workers=0)
+        manager.borrow_book(self.alice.id, self.east[0])
+        manager.rb_tree.find_node(self.main[0])
+        self.assertEqual(sorted(manager.rb_tree.trees), ['east', 'main'])
+
+        self.assertTrue(manager.barrier())
+        self.assertEqual(manager.rb_tree.evict_idle(keep='main'), ['east'])
+        self.assertEqual(manager.rb_tree.find_node(self.east[0]).borrowed_by, self.alice.id)
+
+    def test_forked_worker_writes_to_an_overlay(self):
+        manager = GatorLibraryManager()
+        origin = manager.origin
+        manager.rb_tree.tree('east')
+        base = manager.rb_tree.tree('main')
+        manager.after_fork()
+        self.assertNotEqual(manager.origin, origin)
+        self.assertEqual(manager.rb_tree.pinned, {'main', 'east'})
+        overlay = manager.rb_tree.tree('main')
+        self.assertIsInstance(overlay, OverlayLibrary)
+        self.assertIs(overlay.base, base)
+
+        self.assertTrue(manager.borrow_book(self.alice.id, self.main[0])[0])
+        self.assertIsNone(base.find_node(self.main[0]).borrowed_by)
+        self.assertEqual(manager.rb_tree.find_node(self.main[0]).borrowed_by, self.alice.id)
+        self.assertEqual(manager.availability_stats(), {'books': 6, 'available': 5, 'unavailable': 1})
+        self.assertEqual(manager.memory_usage()['copied_books'], 1)
+        self.assertTrue(manager.check_invariants()[0])
+
+
+class ReservationQueueSettingTests(TestCase):
+    @override_settings(GATOR_RESERVATION_QUEUE='bucket')
+    def test_bucket_queue_is_selectable(self):
+        book = Book.objects.create(title="Queued", author="Author")
+        manager = GatorLibraryManager()
+        self.assertIsInstance(manager.rb_tree.find_node(book.book_id).reservation_heap, BucketQueue)
+        self.assertIsInstance(manager.insert_book("New", "Author").reservation_heap, BucketQueue)
+
+    @override_settings(GATOR_RESERVATION_QUEUE='fifo')
+    def test_unknown_queue_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            GatorLibraryManager()
+
+
+@override_settings(GATOR_LOAN_BUCKET_SECONDS=100, GATOR_POPULARITY_WINDOW_BUCKETS=3, GATOR_POPULARITY_TOP_K=2)
+class LoanHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.ids = [Book.objects.create(title=f"Book {i}", author="Author").book_id for i in range(3)]
+        self.now = 10000.0
+        self.manager = GatorLibraryManager(clock=lambda: self.now)
+
+    def lend(self, book_id, times=1):
+        for _ in range(times):
+            self.manager.borrow_book(self.alice.id, book_id)
+            self.manager.return_book(self.alice.id, book_id)
+
+    def ranking(self, manager=None):
+        return [(node.book_id, loans) for node, loans in (manager or self.manager).popular_books()]
+
+    def test_borrow_records_history_and_leaderboard(self):
+        self.lend(self.ids[0], 3)
+        self.lend(self.ids[1])
+        self.lend(self.ids[2], 2)
+        # Queued reservations are not loans
+        self.manager.borrow_book(self.alice.id, self.ids[1])
+        self.manager.borrow_book(self.bob.id, self.ids[1])
+
+        self.assertEqual(LoanHistory.objects.filter(book_id=self.ids[0]).count(), 3)
+        self.assertEqual(set(LoanHistory.objects.values_list('bucket', flat=True)), {100})
+        self.assertEqual(self.ranking(), [(self.ids[0], 3), (self.ids[2], 2)])
+        self.assertEqual(self.manager.popularity.estimate(self.ids[1]), 2)
+
+    def test_window_slides_and_reload_restores_it(self):
+        self.lend(self.ids[0], 3)
+        self.now += 100
+        self.lend(self.ids[1], 2)
+        self.now += 100
+        self.lend(self.ids[2], 1)
+        self.assertEqual(self.ranking(), [(self.ids[0], 3), (self.ids[1], 2)])
+
+        reloaded = GatorLibraryManager(clock=lambda: self.now)
+        self.assertEqual(self.ranking(reloaded), [(self.ids[0], 3), (self.ids[1], 2)])
+
+        # The first bucket leaves the window
+        self.now += 100
+        self.assertEqual(self.ranking(), [(self.ids[1], 2), (self.ids[2], 1)])
+        self.assertEqual(self.ranking(GatorLibraryManager(clock=lambda: self.now)), [(self.ids[1], 2), (self.ids[2], 1)])
+
+    def test_other_workers_loans_and_deletes(self):
+        other = GatorLibraryManager(clock=lambda: self.now)
+        self.lend(self.ids[1], 2)
+        other.sync()
+        self.assertEqual(self.ranking(other), [(self.ids[1], 2)])
+
+        self.manager.delete_book(self.ids[1])
+        self.assertEqual(self.ranking(), [])
+        self.assertEqual(LoanHistory.objects.filter(book_id=self.ids[1]).count(), 2)
@@ -0,0 +1,115 @@
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from library.managers import gator_library
+from library.profiling import (
+    ProfileStats, instrument_methods, phase, profile_stats, start_profile, stop_profile
+)
+
+
+class RequestProfileTests(TestCase):
+    def test_nested_phases_are_exclusive(self):
+        profile, token = start_profile()
+        try:
+            with phase("signals"):
+                time.sleep(0.01)
+                with phase("db"):
+                    time.sleep(0.02)
+        finally:
+            stop_profile(token)
+
+        self.assertGreaterEqual(profile.durations["db"], 0.02)
+        self.assertGreaterEqual(profile.durations["signals"], 0.01)
+        self.assertLess(profile.durations["signals"], 0.02)
+        self.assertLessEqual(sum(profile.durations.values()), profile.total())
+
+    def test_phase_is_noop_without_profile(self):
+        with phase("db"):
+            pass
+
+    def test_methods_are_wrapped_once_and_timed_only_inside_a_profile(self):
+        class Tree:
+            def lookup(self):
+                time.sleep(0.01)
+                return 1
+
+        instrument_methods(Tree, ('lookup',), 'rb_tree')
+        wrapped = Tree.lookup
+        instrument_methods(Tree, ('lookup',), 'rb_tree')
+        self.assertIs(Tree.lookup, wrapped)
+        self.assertEqual(Tree().lookup(), 1)
+
+        profile, token = start_profile()
+        try:
+            Tree().lookup()
+        finally:
+            stop_profile(token)
+        self.assertGreaterEqual(profile.durations["rb_tree"], 0.01)
+
+    def test_percentiles(self):
+        stats = ProfileStats(window=100)
+        profile, token = start_profile()
+        stop_profile(token)
+        for ms in range(1, 201):
+            stats.record("GET book_list", ms / 1000, profile)
+
+        row, = stats.summary()
+        self.assertEqual(row['count'], 200)
+        # Only the most recent 100 requests (101..200 ms) are in the window
+        self.assertAlmostEqual(row['p50'], 151)
+        self.assertAlmostEqual(row['p95'], 196)
+        self.assertAlmostEqual(row['p99'], 200)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        # Start each test from a tree built from the test database
+        gator_library.reload()
+        profile_stats.reset()
+        self.user = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.login(username='staff', password='secret')
+        self.book_id = gator_library.insert_book("Profiled Book", "Author").book_id
+
+    def test_server_timing_breakdown(self):
+        response = self.client.post(f'/book/{self.book_id}/', {'action': 'borrow'})
+        timing = response['Server-Timing']
+        for name in ("rb_tree", "db", "signals", "template", "app", "total"):
+            self.assertIn(f"{name};dur=", timing)
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    def test_staff_stats_page(self):
+        self.client.get('/')
+        response = self.client.get('/stats/profile/')
+        self.assertContains(response, "GET book_list")
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/stats/profile/').status_code, 302)
+
+
+class MemoryStatsViewTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        gator_library.insert_book("Sized Book", "Author")
+
+    def test_staff_only(self):
+        User.objects.create_user('reader', password='secret')
+        self.client.login(username='reader', password='secret')
+        self.assertEqual(self.client.get('/stats/memory/').status_code, 302)
+
+    def test_reports_usage(self):
+        User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.login(username='admin', password='secret')
+        response = self.client.get('/stats/memory/')
+        self.assertContains(response, "Reservation Heap Occupancy")
+
+        usage = self.client.get('/stats/memory/', {'format': 'json'}).json()
+        self.assertEqual(usage['books'], 1)
+        self.assertEqual(usage['heap_occupancy'][0], 1)
+        self.assertGreater(usage['total'], 0)
+        self.assertIn('hits', usage['node_cache'])
+        self.assertEqual(usage['branch_trees'][0]['branch'], 'main')
+        self.assertContains(response, "Node Cache")
+        self.assertContains(response, "Branches")
+        self.assertIn('process', usage)
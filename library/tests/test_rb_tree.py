@@ -1,6 +1,17 @@
+import random
+import sys
+import threading
+
 from django.test import TestCase
+from library.data_structures.branched import BranchedLibrary
+from library.data_structures.bucket_queue import BucketQueue
 from library.data_structures.rb_tree import GatorLibrary
 from library.data_structures.min_heap import MinHeap, HeapNode, HEAP_SIZE
+from library.data_structures.node_cache import NodeCache
+from library.data_structures.overlay import OverlayLibrary
+from library.data_structures.popularity import CountMinSketch, PopularityTracker, TopK
+from library.data_structures.sharded import ShardedLibrary
+from library.stress import ENGINES, StressFailure, StressRun, run_trace, shrink_trace
 
 class RBTreeTests(TestCase):
     def setUp(self):
@@ -371,4 +382,862 @@ class RBTreeTests(TestCase):
             "No color flips recorded during insertions"
         )
         
-        print(f"Total color flips during test: {final_count - initial_count}")
\ No newline at end of file
+        print(f"Total color flips during test: {final_count - initial_count}")
+
+class InvariantCheckerTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        for book_id in range(1, 32):
+            self.tree.insert_book(book_id, f"Book {book_id}", f"Author {book_id}")
+
+    def test_full_check_passes_after_mixed_operations(self):
+        self.tree.borrow_book(101, 5)
+        self.tree.borrow_book(102, 5, 3)
+        self.tree.borrow_book(103, 5, 1)
+        for book_id in (4, 16, 8, 23, 1):
+            self.tree.delete_book(book_id)
+            ok, message = self.tree.check_invariants()
+            self.assertTrue(ok, message)
+        self.assertEqual(self.tree.last_invariant_check['mode'], "full")
+        self.assertEqual(self.tree.last_invariant_check['nodes_checked'], 26)
+
+    def test_full_check_detects_red_red(self):
+        node = self.tree.find_node(31)
+        node.color = "red"
+        node.parent.color = "red"
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+        self.assertEqual(self.tree.invariant_violations, 1)
+
+    def test_full_check_detects_black_height(self):
+        leaf = self.tree._minimum(self.tree.root)
+        leaf.color = "black" if leaf.color == "red" else "red"
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+
+    def test_full_check_detects_bst_order(self):
+        self.tree.find_node(10).book_id = 100
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+        self.assertIn("BST order", message)
+
+    def test_full_check_detects_heap_order(self):
+        node = self.tree.find_node(7)
+        node.reservation_heap.insert(101, 3)
+        node.reservation_heap.insert(102, 1)
+        node.reservation_heap.swap(1, 2)
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+        self.assertIn("Heap order", message)
+
+    def test_sampled_check_only_visits_recent_paths(self):
+        self.tree.check_invariants(sample=len(self.tree.touched))
+        self.assertEqual(len(self.tree.touched), 0)
+
+        self.tree.borrow_book(101, 12)
+        self.tree.borrow_book(102, 12, 2)
+        ok, message = self.tree.check_invariants(sample=4)
+        self.assertTrue(ok, message)
+        self.assertLessEqual(self.tree.last_invariant_check['nodes_checked'], 2 * 6)
+
+    def test_sampled_check_detects_corruption_on_touched_path(self):
+        self.tree.check_invariants(sample=len(self.tree.touched))
+        node = self.tree.find_node(20)
+        self.tree.borrow_book(101, 20)
+        self.tree.borrow_book(102, 20, 1)
+        self.tree.borrow_book(103, 20, 3)
+        node.reservation_heap.swap(1, 2)
+        ok, message = self.tree.check_invariants(sample=1)
+        self.assertFalse(ok)
+        self.assertEqual(self.tree.last_invariant_check['mode'], "sampled")
+
+
+class InorderIteratorTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        for book_id in [50, 20, 80, 10, 30, 70, 90, 60, 40]:
+            self.tree.insert_book(book_id, f"Book {book_id}", f"Author {book_id}")
+
+    def test_yields_sorted_ids(self):
+        ids = [node.book_id for node in self.tree.iter_inorder()]
+        self.assertEqual(ids, [10, 20, 30, 40, 50, 60, 70, 80, 90])
+
+    def test_range_bounds_are_inclusive(self):
+        ids = [node.book_id for node in self.tree.iter_inorder(30, 70)]
+        self.assertEqual(ids, [30, 40, 50, 60, 70])
+        ids = [node.book_id for node in self.tree.iter_inorder(31, 69)]
+        self.assertEqual(ids, [40, 50, 60])
+        self.assertEqual(list(self.tree.iter_inorder(91)), [])
+        self.assertEqual(list(GatorLibrary().iter_inorder()), [])
+
+    def test_iteration_is_lazy(self):
+        iterator = self.tree.iter_inorder(min_id=45)
+        self.assertEqual(next(iterator).book_id, 50)
+        self.assertEqual(next(iterator).book_id, 60)
+
+    def test_large_tree_does_not_recurse(self):
+        tree = GatorLibrary()
+        for book_id in range(1, 5001):
+            tree.insert_book(book_id, "", "")
+        self.assertEqual(sum(1 for _ in tree.iter_inorder()), 5000)
+
+
+class HeapPeekTests(TestCase):
+    def setUp(self):
+        self.heap = MinHeap()
+        reservations = [(201, 1), (202, 3), (203, 2), (204, 3), (205, 1), (206, 2)]
+        for offset, (patron_id, priority) in enumerate(reservations):
+            self.heap.insert(patron_id, priority, time_of_reservation=1000 + offset)
+
+    def test_iter_ordered_matches_delete_order(self):
+        ordered = [node.patron_id for node in self.heap.iter_ordered()]
+        self.assertEqual(self.heap.get_size(), 6)
+
+        deleted = []
+        while self.heap.get_size():
+            deleted.append(self.heap.delete().patron_id)
+        self.assertEqual(ordered, deleted)
+        self.assertEqual(ordered, [202, 204, 203, 206, 201, 205])
+
+    def test_peek_does_not_mutate(self):
+        snapshot = list(self.heap.heap)
+        self.assertEqual([node.patron_id for node in self.heap.peek(3)], [202, 204, 203])
+        self.assertEqual([node.patron_id for node in self.heap.peek(10)], [202, 204, 203, 206, 201, 205])
+        self.assertEqual(self.heap.heap, snapshot)
+        self.assertEqual(MinHeap().peek(2), [])
+
+    def test_position_of(self):
+        self.assertEqual(self.heap.position_of(202), 1)
+        self.assertEqual(self.heap.position_of(206), 4)
+        self.assertEqual(self.heap.position_of(205), 6)
+        self.assertIsNone(self.heap.position_of(999))
+
+
+class BulkLoadTests(TestCase):
+    def rows(self, ids):
+        return [(book_id, f"Book {book_id}", "Author", "Yes", None, False) for book_id in ids]
+
+    def test_bulk_load_satisfies_invariants_for_every_size(self):
+        for size in range(0, 70):
+            tree = GatorLibrary()
+            nodes = tree.bulk_load(self.rows(range(1, size + 1)))
+            ok, message = tree.check_invariants()
+            self.assertTrue(ok, f"size {size}: {message}")
+            self.assertEqual([node.book_id for node in tree.iter_inorder()], list(range(1, size + 1)))
+            self.assertEqual(nodes, list(tree.iter_inorder()))
+            self.assertEqual(tree.get_color_flip_count(), 0)
+
+    def test_bulk_loaded_tree_supports_updates(self):
+        tree = GatorLibrary()
+        tree.bulk_load(self.rows(range(2, 202, 2)))
+        for book_id in range(1, 60, 2):
+            tree.insert_book(book_id, f"Book {book_id}", "Author")
+        for book_id in range(2, 120, 4):
+            tree.delete_book(book_id)
+        self.assertTrue(tree.check_invariants()[0])
+
+    def test_bulk_load_requires_empty_tree(self):
+        self.tree = GatorLibrary()
+        self.tree.insert_book(1, "Book 1", "Author 1")
+        with self.assertRaises(ValueError):
+            self.tree.bulk_load(self.rows([2]))
+
+
+class ShardedLibraryTests(TestCase):
+    def setUp(self):
+        self.tree = ShardedLibrary(3)
+        for book_id in (5, 50, 150, 290):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+
+    def test_routes_by_modulo(self):
+        self.assertEqual([shard.find_node(150) is not None for shard in self.tree.shards], [True, False, False])
+        self.assertEqual([node.book_id for node in self.tree.iter_inorder()], [5, 50, 150, 290])
+        self.assertEqual([node.book_id for node in self.tree.iter_inorder(40, 200)], [50, 150])
+
+    def test_sequential_inserts_spread_across_shards(self):
+        tree = ShardedLibrary(4)
+        for book_id in range(1, 1001):
+            tree.insert_book(book_id, "Title", "Author")
+        self.assertEqual([shard.root.size for shard in tree.shards], [250] * 4)
+        for book_id in range(1001, 1101):
+            tree.insert_book(book_id, "Title", "Author")
+        self.assertEqual([shard.root.size for shard in tree.shards], [275] * 4)
+        self.assertEqual([node.book_id for node in tree.iter_inorder(995, 1005)], list(range(995, 1006)))
+
+    def test_closest_crosses_shards(self):
+        self.assertEqual(self.tree.find_closest_book(105).book_id, 150)
+        self.assertEqual(self.tree.find_closest_book(101).book_id, 150)
+        self.assertEqual(self.tree.find_closest_book(100).book_id, 50)
+        self.assertEqual(self.tree.find_closest_book(230).book_id, 290)
+        self.tree.delete_book(150)
+        self.assertEqual(self.tree.find_closest_book(200).book_id, 290)
+        # Ties go to the smaller id, as in a single tree
+        self.assertEqual(self.tree.find_closest_book(170).book_id, 50)
+
+    def test_closest_matches_single_tree(self):
+        single = GatorLibrary()
+        for node in self.tree.iter_inorder():
+            single.insert_book(node.book_id, node.title, node.author)
+        for target in range(-10, 320, 7):
+            self.assertEqual(self.tree.find_closest_book(target).book_id, single.find_closest_book(target).book_id)
+
+    def test_version_and_invariants_aggregate(self):
+        version = self.tree.version
+        self.tree.borrow_book(101, 150)
+        self.assertGreater(self.tree.version, version)
+        self.assertTrue(self.tree.check_invariants()[0])
+        self.assertTrue(self.tree.last_invariant_check['ok'])
+
+        # A book in the wrong shard is reported
+        self.tree.shards[0].insert_book(251, "Misplaced", "Author")
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+        self.assertIn("Shard 0", message)
+
+
+class BranchedLibraryTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.catalog = {
+            'north': [(book_id, f"Book {book_id}", "Author", "Yes", None, False) for book_id in (1, 4, 30)],
+            'south': [(book_id, f"Book {book_id}", "Author", "Yes", None, False) for book_id in (10, 20, 40)],
+        }
+        self.loaded = []
+        directory = {row[0]: branch for branch, rows in self.catalog.items() for row in rows}
+        self.tree = BranchedLibrary(self.load, directory, default_branch='north', clock=lambda: self.now)
+
+    def load(self, branch):
+        self.loaded.append(branch)
+        tree = GatorLibrary()
+        tree.bulk_load(self.catalog.get(branch, []))
+        return tree
+
+    def test_branches_load_on_first_use(self):
+        self.assertEqual(self.tree.branches(), ['north', 'south'])
+        self.assertEqual(self.loaded, [])
+        self.assertEqual(self.tree.find_node(20).book_id, 20)
+        self.assertEqual(self.loaded, ['south'])
+        self.assertIsNone(self.tree.find_node(99))
+        self.assertEqual(self.loaded, ['south'])
+
+        node = self.tree.insert_book(50, "New", "Author", branch='east')
+        self.assertIs(self.tree.tree('east').find_node(50), node)
+        self.assertEqual(self.tree.branch_of(50), 'east')
+        self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_closest_merges_branches(self):
+        self.assertEqual(self.tree.find_closest_book(8).book_id, 10)
+        self.assertEqual(self.tree.find_closest_book(8, ['north']).book_id, 4)
+        self.assertEqual(self.tree.find_closest_book(35).book_id, 30)
+        self.assertEqual([node.book_id for node in self.tree.iter_inorder()], [1, 4, 10, 20, 30, 40])
+
+        self.tree.borrow_book(101, 10)
+        self.assertEqual(self.tree.find_closest_available(9).book_id, 4)
+        self.assertEqual(self.tree.find_closest_available(12, ['south']).book_id, 20)
+        self.assertEqual(self.tree.count_available(), 5)
+
+    def test_idle_branches_are_evicted_over_budget(self):
+        self.tree.memory_budget = 1
+        self.tree.min_idle_seconds = 10
+        self.tree.find_node(1)
+        self.tree.borrow_book(101, 1)
+        self.tree.borrow_book(102, 1)
+        version = self.tree.version
+        # north was used too recently to be evicted
+        self.now = 5
+        self.tree.find_node(10)
+        self.assertEqual(sorted(self.tree.trees), ['north', 'south'])
+
+        # Loading a third branch evicts the idle ones, least recently used first
+        self.now = 20
+        self.tree.insert_book(50, "New", "Author", branch='east')
+        self.assertEqual(sorted(self.tree.trees), ['east'])
+        self.assertEqual(self.tree.evictions, 2)
+        self.assertGreater(self.tree.version, version)
+        self.assertEqual(self.tree.availability_stats(), {'books': 7, 'available': 6, 'unavailable': 1})
+        self.assertEqual(self.tree.memory_usage()['parked_queues'], 1)
+
+        # The rebuilt node gets its reservation queue back
+        node = self.tree.find_node(1)
+        self.assertEqual(self.loaded, ['north', 'south', 'east', 'north'])
+        self.assertEqual(sorted(self.tree.trees), ['east', 'north'])
+        self.assertEqual([entry.patron_id for entry in node.reservation_heap.iter_ordered()], [102])
+
+    def test_searches_skip_evicted_branches_that_cannot_answer(self):
+        for branch in ('north', 'south'):
+            self.tree.tree(branch)
+            self.tree.evict(branch)
+        self.assertEqual(self.tree.summaries['south']['min_id'], 10)
+        del self.loaded[:]
+
+        self.assertEqual(self.tree.find_closest_book(5).book_id, 4)
+        self.assertEqual(self.loaded, ['north'])
+        # Every south book is further than 30, north's largest
+        self.assertEqual(self.tree.find_closest_available(33).book_id, 30)
+        self.assertEqual(self.tree.min().book_id, 1)
+        self.assertEqual(self.tree.count_available(41, 50), 0)
+        self.assertEqual(self.loaded, ['north'])
+
+        # Scans read evicted branches without restoring them
+        self.assertEqual([node.book_id for node in self.tree.iter_inorder()], [1, 4, 10, 20, 30, 40])
+        self.assertEqual(sorted(self.tree.trees), ['north'])
+
+        # A tie with the smaller id in south has to restore it
+        self.assertEqual(self.tree.find_closest_book(25).book_id, 20)
+        self.assertEqual(self.tree.max().book_id, 40)
+        self.assertEqual(sorted(self.tree.trees), ['north', 'south'])
+
+    def test_chunks_seek_past_changes_between_them(self):
+        self.tree.tree('north')
+        self.tree.evict('north')
+        chunks = self.tree.iter_chunks(chunk_size=2, row=lambda node: node.book_id)
+        self.assertEqual(next(chunks), [1, 4])
+        # Rotations and deletes between chunks neither repeat nor skip books
+        self.tree.delete_book(10)
+        for book_id in range(11, 19):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author", branch='south')
+        self.tree.insert_book(2, "Behind", "Author", branch='south')
+        self.assertEqual([book_id for chunk in chunks for book_id in chunk], list(range(11, 19)) + [20, 30, 40])
+        self.assertEqual(self.loaded.count('north'), 2)
+        self.assertEqual(sorted(self.tree.trees), ['south'])
+
+    def test_move_keeps_queue(self):
+        self.tree.borrow_book(101, 4)
+        self.tree.borrow_book(102, 4)
+        moved = self.tree.move_book(4, 'south')
+        self.assertEqual(self.tree.branch_of(4), 'south')
+        self.assertIsNone(self.tree.tree('north').find_node(4))
+        self.assertEqual(moved.borrowed_by, 101)
+        self.assertEqual(moved.reservation_heap.get_size(), 1)
+        self.assertEqual(self.tree.tree('south').availability_stats()['unavailable'], 1)
+        self.assertTrue(self.tree.check_invariants()[0])
+
+
+class MemoryUsageTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        for book_id in range(1, 41):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Shared Author")
+
+    def test_accounts_for_books_and_reservations(self):
+        usage = self.tree.memory_usage()
+        self.assertEqual(usage['books'], 40)
+        self.assertEqual(usage['heap_occupancy'][0], 40)
+        self.assertEqual(usage['reservations'], 0)
+        self.assertEqual(usage['total'], sum(usage[key] for key in ('nodes', 'strings', 'heaps', 'reservations', 'sentinel')))
+
+        self.tree.borrow_book(100, 7)
+        for patron_id in range(101, 104):
+            self.tree.borrow_book(patron_id, 7)
+        grown = self.tree.memory_usage()
+        self.assertGreater(grown['reservations'], 0)
+        self.assertEqual(grown['reservation_count'], 3)
+        self.assertEqual(grown['heap_occupancy'][3], 1)
+        self.assertEqual(grown['heap_occupancy'][0], 39)
+
+    def test_shared_strings_are_counted_once(self):
+        usage = self.tree.memory_usage()
+        self.tree.insert_book(41, "Book 41", "Shared Author")
+        # Only the new title is new, the author string object is shared
+        self.assertEqual(self.tree.memory_usage()['strings'] - usage['strings'], sys.getsizeof("Book 41"))
+
+    def test_delete_leaves_nothing_behind(self):
+        self.tree.borrow_book(100, 5)
+        self.tree.borrow_book(101, 5)
+        self.tree.return_book(100, 5)
+        usage = self.tree.memory_usage()
+        self.assertEqual(usage['stale_heap_slots'], 0)
+
+        for book_id in range(1, 41, 2):
+            self.tree.delete_book(book_id)
+        usage = self.tree.memory_usage()
+        self.assertEqual(usage['books'], 20)
+        self.assertIsNone(self.tree.nil.parent)
+        # Only the bounded touched-path buffer may still refer to deleted nodes
+        self.assertLessEqual(usage['detached_nodes'], len(self.tree.touched))
+        self.tree.touched.clear()
+        self.assertEqual(self.tree.memory_usage()['detached_nodes'], 0)
+
+
+class SplitJoinTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        self.ids = list(range(1, 101))
+        for book_id in self.ids:
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+
+    def ids_of(self, tree):
+        return [node.book_id for node in tree.iter_inorder()]
+
+    def test_split_and_join_round_trip(self):
+        for key in (0, 1, 37, 64, 100, 101):
+            right = self.tree.split(key)
+            self.assertEqual(self.ids_of(self.tree), [i for i in self.ids if i < key])
+            self.assertEqual(self.ids_of(right), [i for i in self.ids if i >= key])
+            self.assertTrue(self.tree.check_invariants()[0])
+            self.assertTrue(right.check_invariants()[0])
+
+            self.tree.join(right)
+            self.assertEqual(self.ids_of(self.tree), self.ids)
+            self.assertEqual(self.ids_of(right), [])
+            self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_join_rejects_overlapping_or_foreign_trees(self):
+        right = self.tree.split(50)
+        with self.assertRaises(ValueError):
+            right.join(self.tree)
+        with self.assertRaises(ValueError):
+            self.tree.join(GatorLibrary())
+
+    def test_delete_range_returns_cancelled_reservations(self):
+        self.tree.borrow_book(500, 30)
+        self.tree.borrow_book(501, 30)
+        self.tree.borrow_book(502, 30, 3)
+        version = self.tree.version
+
+        removed = self.tree.delete_range(20, 39)
+        self.assertEqual(list(removed), list(range(20, 40)))
+        self.assertEqual(removed[30], [502, 501])
+        self.assertEqual(removed[20], [])
+        self.assertEqual(self.ids_of(self.tree), list(range(1, 20)) + list(range(40, 101)))
+        self.assertTrue(self.tree.check_invariants()[0])
+        self.assertGreater(self.tree.version, version)
+
+        self.assertEqual(self.tree.delete_range(200, 300), {})
+        self.assertEqual(list(self.tree.delete_range(0, 1000)), list(range(1, 20)) + list(range(40, 101)))
+        self.assertEqual(self.tree.root, self.tree.nil)
+
+    def test_delete_range_touches_few_nodes(self):
+        flips = self.tree.get_color_flip_count()
+        self.tree.delete_range(45, 47)
+        # Rebalancing stays near the cut rather than once per removed book
+        self.assertLess(self.tree.get_color_flip_count() - flips, 20)
+        self.assertTrue(self.tree.check_invariants()[0])
+
+
+class BucketQueueTests(TestCase):
+    def test_matches_min_heap_order(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            heap, bucket = MinHeap(), BucketQueue()
+            for patron_id in rng.sample(range(100), HEAP_SIZE):
+                priority = rng.choice((1, 2, 3))
+                reserved_at = float(rng.randrange(1000))
+                heap.insert(patron_id, priority, reserved_at)
+                bucket.insert(patron_id, priority, reserved_at)
+            self.assertTrue(bucket.check_invariants()[0])
+            self.assertEqual(
+                [(node.priority_number, node.time_of_reservation) for node in bucket.iter_ordered()],
+                [(node.priority_number, node.time_of_reservation) for node in heap.iter_ordered()]
+            )
+            popped = []
+            while bucket.get_size():
+                node = bucket.delete()
+                popped.append((node.priority_number, node.time_of_reservation))
+            self.assertEqual(popped, sorted(popped, key=lambda entry: (-entry[0], entry[1])))
+            self.assertIsNone(bucket.delete())
+
+    def test_capacity_and_positions(self):
+        queue = BucketQueue()
+        for patron_id in range(HEAP_SIZE):
+            self.assertTrue(queue.insert(patron_id, 1 + patron_id % 3, 1000 + patron_id))
+        self.assertFalse(queue.insert(99, 3))
+        self.assertEqual(queue.position_of(2), 1)
+        self.assertEqual(queue.position_of(0), HEAP_SIZE - 6)
+        self.assertIsNone(queue.position_of(99))
+        with self.assertRaises(ValueError):
+            BucketQueue().insert(1, 4)
+
+    def test_tree_can_use_bucket_queues(self):
+        tree = GatorLibrary(queue_class=BucketQueue)
+        tree.insert_book(1, "Book 1", "Author 1")
+        tree.borrow_book(101, 1)
+        tree.borrow_book(102, 1, 1)
+        tree.borrow_book(103, 1, 3)
+        node = tree.find_node(1)
+        self.assertIsInstance(node.reservation_heap, BucketQueue)
+        self.assertEqual(tree.return_book(101, 1), (True, "Book returned and allocated to patron 103"))
+        self.assertTrue(tree.check_invariants()[0])
+        self.assertEqual(tree.memory_usage()['reservation_count'], 1)
+        self.assertIsInstance(tree.split(1).find_node(1).reservation_heap, BucketQueue)
+
+
+class AvailabilityAugmentationTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        for book_id in range(1, 31):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+        # Lend out everything from 10 to 20
+        for book_id in range(10, 21):
+            self.tree.borrow_book(100 + book_id, book_id)
+
+    def available_ids(self):
+        return [node.book_id for node in self.tree.iter_inorder() if node.availability_status == "Yes"]
+
+    def test_closest_available_skips_borrowed_books(self):
+        self.assertEqual(self.tree.find_closest_book(15).book_id, 15)
+        self.assertEqual(self.tree.find_closest_available(15).book_id, 9)
+        self.assertEqual(self.tree.find_closest_available(16).book_id, 21)
+        self.assertEqual(self.tree.find_closest_available(100).book_id, 30)
+
+        self.tree.return_book(114, 14)
+        self.assertEqual(self.tree.find_closest_available(16).book_id, 14)
+        for book_id in self.available_ids():
+            self.tree.borrow_book(1, book_id)
+        self.assertIsNone(self.tree.find_closest_available(16))
+
+    def test_counts_follow_status_changes(self):
+        self.assertEqual(self.tree.availability_stats(), {'books': 30, 'available': 19, 'unavailable': 11})
+        self.assertEqual(self.tree.count_available(5, 25), 10)
+        self.assertEqual(self.tree.count_available(10, 20), 0)
+        self.assertEqual(self.tree.count_available(), 19)
+        self.assertEqual(self.tree.count_available(25, 5), 0)
+
+        # A return that hands the book to a reservation keeps it unavailable
+        self.tree.borrow_book(200, 12)
+        self.tree.return_book(112, 12)
+        self.assertEqual(self.tree.count_available(10, 20), 0)
+        self.tree.expire_hold(12)
+        self.assertEqual(self.tree.count_available(10, 20), 1)
+        self.tree.sync_status(self.tree.find_node(13), "Yes", None)
+        self.assertEqual(self.tree.count_available(10, 20), 2)
+        self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_counts_survive_restructuring(self):
+        self.tree.delete_book(9)
+        self.tree.delete_range(21, 23)
+        self.tree.join(self.tree.split(17))
+        for book_id in range(31, 60):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+        self.assertTrue(self.tree.check_invariants()[0])
+        self.assertEqual(self.tree.availability_stats()['available'], len(self.available_ids()))
+        self.assertEqual(self.tree.find_closest_available(15).book_id, 8)
+
+        loaded = GatorLibrary()
+        loaded.bulk_load([
+            (node.book_id, node.title, node.author, node.availability_status, None, False)
+            for node in self.tree.iter_inorder()
+        ])
+        self.assertEqual(loaded.availability_stats(), self.tree.availability_stats())
+        self.assertTrue(loaded.check_invariants()[0])
+
+    def test_checker_detects_stale_counts(self):
+        self.tree.find_node(15).availability_status = "Yes"
+        ok, message = self.tree.check_invariants()
+        self.assertFalse(ok)
+        self.assertIn("counts", message)
+
+    def test_sharded_queries_match(self):
+        sharded = ShardedLibrary(3)
+        for node in self.tree.iter_inorder():
+            sharded.insert_book(node.book_id, node.title, node.author, node.availability_status)
+        self.assertEqual(sharded.availability_stats(), self.tree.availability_stats())
+        for target in range(-3, 40):
+            self.assertEqual(
+                sharded.find_closest_available(target).book_id,
+                self.tree.find_closest_available(target).book_id
+            )
+            self.assertEqual(sharded.count_available(target, target + 9), self.tree.count_available(target, target + 9))
+
+
+class LargerOnTieLibrary(GatorLibrary):
+    """Seeded bug: ties in closest-book search go to the larger ID"""
+    def find_closest_book(self, target_id):
+        nodes = list(self.iter_inorder())
+        if not nodes:
+            return None
+        return min(nodes, key=lambda node: (abs(node.book_id - target_id), -node.book_id))
+
+
+class StressHarnessTests(TestCase):
+    def test_engines_agree_with_reference_model(self):
+        for engine in ENGINES:
+            run = StressRun(engine, seed=3, id_space=300, check_every=500, round_size=2000)
+            run.run(4000)
+            self.assertEqual(sum(run.counts.values()), 4000)
+            self.assertEqual(run.rounds, 2)
+            self.assertGreater(run.ops_per_sec(), 0)
+            self.assertTrue(all(run.counts.get(op) for op in ('insert', 'borrow', 'return', 'closest', 'delete_range')))
+
+    def test_seeded_bug_is_shrunk_to_minimal_trace(self):
+        run = StressRun(LargerOnTieLibrary, seed=0, id_space=50, round_size=5000)
+        with self.assertRaises(StressFailure) as caught:
+            run.run(5000)
+        self.assertEqual(caught.exception.op['op'], 'closest')
+
+        trace = shrink_trace(caught.exception.trace, LargerOnTieLibrary)
+        self.assertEqual([op['op'] for op in trace], ['insert', 'insert', 'closest'])
+        low, high = sorted(op['book'] for op in trace[:2])
+        self.assertEqual(trace[2]['target'] * 2, low + high)
+
+        # The shrunk trace still fails on its own and passes on the real tree
+        with self.assertRaises(StressFailure):
+            run_trace(trace, LargerOnTieLibrary)
+        self.assertEqual(run_trace(trace, ENGINES['heap'])[0]['closest'], 1)
+
+    def test_broken_invariant_is_caught_by_periodic_check(self):
+        class LeakyCounts(GatorLibrary):
+            def borrow_book(self, *args, **kwargs):
+                result = super().borrow_book(*args, **kwargs)
+                self.root.size += 1
+                return result
+
+        with self.assertRaises(StressFailure) as caught:
+            StressRun(LeakyCounts, seed=1, id_space=100, check_every=50).run(200)
+        self.assertEqual(caught.exception.op['op'], 'check')
+
+
+class PopularityTests(TestCase):
+    def test_sketch_never_undercounts(self):
+        rng = random.Random(3)
+        sketch = CountMinSketch(width=64, depth=4)
+        counts = {}
+        for _ in range(5000):
+            key = int(rng.paretovariate(1.2)) % 500
+            counts[key] = counts.get(key, 0) + 1
+            sketch.add(key)
+        for key, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(key), count)
+        # Heavy hitters are close to exact
+        top_key = max(counts, key=counts.get)
+        self.assertLess(sketch.estimate(top_key) - counts[top_key], 0.05 * sketch.total)
+
+    def test_sketches_subtract(self):
+        first, second = CountMinSketch(32, 3), CountMinSketch(32, 3)
+        first.add(1, 5)
+        second.add(1, 2)
+        second.add(2, 4)
+        first.merge(second)
+        self.assertEqual((first.estimate(1), first.total), (7, 11))
+        first.subtract(second)
+        self.assertEqual((first.estimate(1), first.estimate(2), first.total), (5, 0, 5))
+        with self.assertRaises(ValueError):
+            first.merge(CountMinSketch(16, 3))
+
+    def test_top_k_matches_sorting(self):
+        rng = random.Random(5)
+        top = TopK(5)
+        counts = {}
+        for _ in range(2000):
+            key = rng.randrange(40)
+            counts[key] = counts.get(key, 0) + 1
+            top.offer(key, counts[key])
+        expected = sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))[:5]
+        self.assertEqual([count for _, count in top.top()], [count for _, count in expected])
+        self.assertEqual(len(top.heap), 5)
+        self.assertTrue(all(top.heap[position][1] == key for key, position in top.index.items()))
+
+    def test_tracker_window_expires_buckets(self):
+        tracker = PopularityTracker(bucket_seconds=10, window_buckets=2, k=3, width=256)
+        tracker.record(1, 0, 5)
+        tracker.record(2, 12, 3)
+        tracker.record(3, 15)
+        self.assertEqual(tracker.top(), [(1, 5), (2, 3), (3, 1)])
+        self.assertEqual(tracker.top(now=25), [(2, 3), (3, 1)])
+        self.assertEqual(tracker.estimate(1), 0)
+        self.assertFalse(tracker.record(1, 5))
+        tracker.forget(2)
+        self.assertEqual(tracker.top(), [(3, 1)])
+
+    def test_tracker_concurrent_records(self):
+        tracker = PopularityTracker(bucket_seconds=10, window_buckets=100, k=5, width=256)
+
+        def record(offset):
+            for i in range(2000):
+                tracker.record((offset + i) % 50, i // 20)
+                if i % 100 == 0:
+                    tracker.top(now=i // 20)
+
+        previous = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=record, args=(offset,)) for offset in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(previous)
+
+        self.assertEqual((tracker.recorded, tracker.window_sketch.total), (8000, 8000))
+        self.assertEqual([entry[0] for entry in tracker.buckets], list(range(10)))
+        for top in [tracker.window_top] + [entry[2] for entry in tracker.buckets]:
+            self.assertEqual(len(top.index), len(top.heap))
+            self.assertTrue(all(top.heap[position][1] == key for key, position in top.index.items()))
+
+
+class AppendFastPathTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+
+    def bounds(self):
+        low, high = self.tree.min(), self.tree.max()
+        return (low.book_id if low else None, high.book_id if high else None)
+
+    def test_increasing_ids_are_appended(self):
+        for book_id in range(1, 201):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+        self.assertEqual(self.tree.appends, 199)
+        self.assertEqual(self.bounds(), (1, 200))
+        self.assertEqual([node.book_id for node in self.tree.iter_inorder()], list(range(1, 201)))
+        self.assertTrue(self.tree.check_invariants()[0])
+
+        # A smaller id still descends from the root
+        self.tree.delete_book(50)
+        self.tree.insert_book(50, "Book 50", "Author")
+        self.assertEqual(self.tree.appends, 199)
+        self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_bounds_follow_deletes(self):
+        self.assertEqual(self.bounds(), (None, None))
+        for book_id in (5, 3, 8, 1, 9, 7):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+        self.tree.delete_book(9)
+        self.tree.delete_book(1)
+        self.assertEqual(self.bounds(), (3, 8))
+        for book_id in (3, 8, 5, 7):
+            self.tree.delete_book(book_id)
+            self.assertTrue(self.tree.check_invariants()[0])
+        self.assertEqual(self.bounds(), (None, None))
+
+    def test_bounds_after_bulk_load_split_and_range_delete(self):
+        self.tree.bulk_load([(book_id, "Title", "Author", "Yes", None, False) for book_id in range(10, 110)])
+        self.assertEqual(self.bounds(), (10, 109))
+        upper = self.tree.split(60)
+        self.assertEqual((self.bounds(), (upper.min().book_id, upper.max().book_id)), ((10, 59), (60, 109)))
+        self.tree.join(upper)
+        self.assertEqual((self.bounds(), upper.max()), ((10, 109), None))
+        self.tree.delete_range(100, 200)
+        self.tree.insert_book(150, "Appended", "Author")
+        self.assertEqual((self.bounds(), self.tree.appends), ((10, 150), 1))
+        self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_stale_pointer_is_reported(self):
+        for book_id in range(1, 4):
+            self.tree.insert_book(book_id, "Title", "Author")
+        self.tree.max_node = self.tree.find_node(2)
+        self.assertFalse(self.tree.check_invariants()[0])
+
+    def test_sharded_bounds(self):
+        sharded = ShardedLibrary(3)
+        self.assertIsNone(sharded.max())
+        for book_id in (150, 120, 170):
+            sharded.insert_book(book_id, "Title", "Author")
+        self.assertEqual((sharded.min().book_id, sharded.max().book_id), (120, 170))
+
+
+class NodeCacheTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary(cache_size=4)
+        for book_id in range(1, 21):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+
+    def test_hits_survive_rotations(self):
+        node = self.tree.find_node(3)
+        # Enough inserts to rotate the cached node around
+        for book_id in range(21, 200):
+            self.tree.insert_book(book_id, f"Book {book_id}", "Author")
+        self.assertIs(self.tree.find_node(3), node)
+        stats = self.tree.node_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_delete_invalidates(self):
+        self.tree.find_node(7)
+        self.tree.delete_book(7)
+        self.assertIsNone(self.tree.find_node(7))
+        replacement = self.tree.insert_book(7, "New Book 7", "Author")
+        self.assertIs(self.tree.find_node(7), replacement)
+        self.assertEqual(self.tree.node_cache_stats()['invalidations'], 1)
+
+    def test_split_and_range_delete_clear_the_cache(self):
+        for book_id in (5, 15):
+            self.tree.find_node(book_id)
+        upper = self.tree.split(10)
+        self.assertIsNone(self.tree.find_node(15))
+        self.assertEqual(upper.find_node(15).book_id, 15)
+        self.tree.join(upper)
+        self.tree.find_node(12)
+        self.tree.delete_range(11, 13)
+        self.assertIsNone(self.tree.find_node(12))
+        self.assertTrue(self.tree.check_invariants()[0])
+
+    def test_clock_keeps_referenced_books(self):
+        cache = NodeCache(3)
+        nodes = {book_id: self.tree.find_node(book_id) for book_id in (1, 2, 3, 4)}
+        for book_id in (1, 2, 3):
+            cache.put(nodes[book_id], cache.generation)
+        # Every slot gets a second chance, then 2 and 3 are referenced again
+        cache.put(nodes[4], cache.generation)
+        cache.get(2)
+        cache.get(4)
+        cache.put(nodes[1], cache.generation)
+        self.assertEqual(sorted(cache.index), [1, 2, 4])
+        self.assertEqual(cache.evictions, 2)
+
+    def test_put_after_invalidate_is_dropped(self):
+        cache = NodeCache(2)
+        node = self.tree.find_node(9)
+        generation = cache.generation
+        cache.invalidate(9)
+        cache.put(node, generation)
+        self.assertIsNone(cache.get(9))
+
+
+class OverlayTests(TestCase):
+    def setUp(self):
+        self.base = GatorLibrary()
+        self.base.bulk_load([(book_id, f"Book {book_id}", "Author", "Yes", None, False) for book_id in range(1, 101)])
+        self.overlay = OverlayLibrary(self.base)
+
+    def test_writes_leave_the_base_untouched(self):
+        version = self.base.version
+        shared = self.base.find_node(10)
+        cache = self.base.node_cache_stats()
+        self.assertIs(self.overlay.find_node(10), shared)
+        self.assertIs(self.overlay.find_node(20), self.base._search(20))
+        # Lookups go through the overlay's own cache, not the shared one
+        self.assertEqual(self.base.node_cache_stats(), cache)
+        self.assertEqual(self.overlay.base_cache.misses, 2)
+
+        success, _ = self.overlay.borrow_book(1, 10)
+        self.assertTrue(success)
+        self.overlay.borrow_book(2, 10, priority=3)
+        node = self.overlay.find_node(10)
+        self.assertIsNot(node, shared)
+        self.assertEqual((node.availability_status, node.borrowed_by), ("No", 1))
+        self.assertEqual(node.reservation_heap.get_size(), 1)
+        self.assertGreater(node.version, version)
+        # The copy is made once, later writes find it in the delta
+        self.assertIs(self.overlay.writable_node(10), node)
+        self.assertEqual(self.overlay.copies, 1)
+
+        self.assertEqual(self.base.version, version)
+        self.assertEqual((shared.availability_status, shared.borrowed_by), ("Yes", None))
+        self.assertEqual(shared.reservation_heap.get_size(), 0)
+        self.assertEqual(self.overlay.count_available(), 99)
+        self.assertEqual(self.base.count_available(), 100)
+
+    def test_deleted_base_books_are_shadowed(self):
+        self.overlay.delete_book(1)
+        self.assertEqual(self.overlay.delete_range(50, 59), {book_id: [] for book_id in range(50, 60)})
+        self.overlay.insert_book(150, "New", "Author")
+        self.assertIsNone(self.overlay.find_node(1))
+        self.assertIsNotNone(self.base.find_node(1))
+        self.assertEqual(self.overlay.min().book_id, 2)
+        self.assertEqual(self.overlay.max().book_id, 150)
+        self.assertEqual(self.overlay.availability_stats(), {'books': 90, 'available': 90, 'unavailable': 0})
+        self.assertEqual(self.overlay.count_available(40, 70), 21)
+        ids = [node.book_id for node in self.overlay.iter_inorder(45, 65)]
+        self.assertEqual(ids, list(range(45, 50)) + list(range(60, 66)))
+        usage = self.overlay.memory_usage()
+        self.assertEqual((usage['books'], usage['shared_books'], usage['shadowed_books']), (1, 89, 11))
+        self.assertTrue(self.overlay.check_invariants()[0])
+
+    def test_closest_search_skips_shadowed_books(self):
+        self.overlay.delete_range(40, 60)
+        self.overlay.borrow_book(1, 39)
+        self.assertEqual(self.overlay.find_closest_book(50).book_id, 39)
+        self.assertEqual(self.overlay.find_closest_available(50).book_id, 61)
+        self.overlay.insert_book(52, "New", "Author")
+        self.assertEqual(self.overlay.find_closest_available(50).book_id, 52)
+        self.assertEqual(self.base.find_closest_available(50).book_id, 50)
\ No newline at end of file
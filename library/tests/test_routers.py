@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from library.middleware import ReplicaPinningMiddleware
+from library.models import Book
+from library.replication import copy_sqlite
+from library.routers import PIN_COOKIE, PrimaryReplicaRouter, start_pinning, stop_pinning, use_primary
+
+
+@override_settings(GATOR_DB_REPLICAS=['replica1', 'replica2'])
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        _, self.token = start_pinning()
+
+    def tearDown(self):
+        stop_pinning(self.token)
+
+    def test_reads_rotate_over_replicas_until_a_write(self):
+        reads = {self.router.db_for_read(Book) for _ in range(4)}
+        self.assertEqual(reads, {'replica1', 'replica2'})
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_use_primary_only_pins_inside_the_block(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Book), 'default')
+        self.assertIn(self.router.db_for_read(Book), ('replica1', 'replica2'))
+
+    def test_related_reads_follow_the_instance(self):
+        book = Book(title="Routed", author="Author")
+        book._state.db = 'replica2'
+        self.assertEqual(self.router.db_for_read(User, instance=book), 'replica2')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'library'))
+        self.assertIsNone(self.router.allow_migrate('default', 'library'))
+
+    @override_settings(GATOR_DB_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+
+@override_settings(GATOR_DB_REPLICAS=['replica1'], GATOR_DB_PIN_SECONDS=7)
+class ReplicaPinningMiddlewareTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_view(self, request, write=False):
+        reads = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Book)
+            reads.append(self.router.db_for_read(Book))
+            return HttpResponse()
+
+        return ReplicaPinningMiddleware(view)(request), reads[0]
+
+    def test_write_sets_the_pin_cookie(self):
+        response, read = self.run_view(self.factory.post('/book/1/'), write=True)
+        self.assertEqual(read, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 7)
+
+        response, read = self.run_view(self.factory.get('/'))
+        self.assertEqual(read, 'replica1')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_pinned_request_reads_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        _, read = self.run_view(request)
+        self.assertEqual(read, 'default')
+
+
+class ReplicaEmulationTests(TestCase):
+    def test_copy_sqlite_replicates_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+            with closing(sqlite3.connect(primary)) as connection:
+                connection.execute("CREATE TABLE book (id INTEGER PRIMARY KEY)")
+                connection.executemany("INSERT INTO book VALUES (?)", [(1,), (2,)])
+                connection.commit()
+            copy_sqlite(primary, [replica])
+            with closing(sqlite3.connect(replica)) as connection:
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM book").fetchone(), (2,))
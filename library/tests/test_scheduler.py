@@ -0,0 +1,210 @@
+import time
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from library.data_structures.rb_tree import GatorLibrary
+from library.data_structures.timing_wheel import TimingWheel
+from library.managers import GatorLibraryManager, gator_library
+from library.models import Book
+
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TimingWheelTests(TestCase):
+    def setUp(self):
+        self.wheel = TimingWheel(tick_seconds=10, slot_count=8, start_time=0)
+
+    def test_expires_only_passed_deadlines(self):
+        self.wheel.schedule("a", 25)
+        self.wheel.schedule("b", 40)
+        self.assertEqual(self.wheel.advance(20), [])
+        self.assertEqual(self.wheel.advance(30), ["a"])
+        self.assertEqual(self.wheel.advance(39), [])
+        self.assertEqual(self.wheel.advance(40), ["b"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel_and_reschedule(self):
+        self.wheel.schedule("a", 20)
+        self.wheel.schedule("b", 20)
+        self.assertTrue(self.wheel.cancel("a"))
+        self.assertFalse(self.wheel.cancel("a"))
+        self.wheel.schedule("b", 60)
+        self.assertEqual(self.wheel.advance(50), [])
+        self.assertEqual(self.wheel.advance(60), ["b"])
+
+    def test_deadlines_beyond_horizon_cascade(self):
+        # Horizon is 8 slots of 10 seconds
+        self.wheel.schedule("far", 1000)
+        self.wheel.schedule("near", 30)
+        self.wheel.schedule("cancelled", 500)
+        self.wheel.cancel("cancelled")
+        self.assertEqual(self.wheel.advance(30), ["near"])
+        self.assertEqual(self.wheel.advance(990), [])
+        self.assertEqual(self.wheel.advance(1000), ["far"])
+
+    def test_large_jump_skips_empty_ticks(self):
+        self.wheel.schedule("a", 10 ** 9)
+        self.assertEqual(self.wheel.advance(10 ** 9 + 5), ["a"])
+        self.assertEqual(self.wheel.current_tick, 10 ** 8)
+
+    def test_past_deadline_fires_next_advance(self):
+        self.wheel.advance(100)
+        self.wheel.schedule("late", 50)
+        self.assertEqual(self.wheel.advance(110), ["late"])
+
+
+class HoldExpiryTreeTests(TestCase):
+    def setUp(self):
+        self.tree = GatorLibrary()
+        self.node = self.tree.insert_book(1, "Book 1", "Author 1")
+        self.tree.borrow_book(101, 1)
+        self.tree.borrow_book(102, 1, 3)
+        self.tree.borrow_book(103, 1, 1)
+
+    def test_return_places_hold_that_can_be_claimed(self):
+        self.tree.return_book(101, 1)
+        self.assertTrue(self.node.on_hold)
+        self.assertEqual(self.node.borrowed_by, 102)
+
+        success, message = self.tree.borrow_book(102, 1)
+        self.assertTrue(success)
+        self.assertFalse(self.node.on_hold)
+
+    def test_expire_hold_advances_queue(self):
+        self.tree.return_book(101, 1)
+        success, message = self.tree.expire_hold(1)
+        self.assertTrue(success)
+        self.assertIn("allocated to patron 103", message)
+        self.assertEqual(self.node.borrowed_by, 103)
+
+        success, _ = self.tree.expire_hold(1)
+        self.assertTrue(success)
+        self.assertEqual(self.node.availability_status, "Yes")
+        self.assertFalse(self.node.on_hold)
+        self.assertEqual(self.tree.expire_hold(1), (False, "No hold to expire"))
+
+
+@override_settings(GATOR_HOLD_SECONDS=100, GATOR_LOAN_SECONDS=1000, GATOR_SCHEDULER_TICK_SECONDS=10)
+class LibrarySchedulerTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1_000_000)
+        self.manager = GatorLibraryManager(clock=self.clock)
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.carol = User.objects.create_user("carol")
+        self.book_id = self.manager.insert_book("Book", "Author").book_id
+
+    def test_overdue_loan_is_flagged(self):
+        self.manager.borrow_book(self.alice.id, self.book_id)
+        self.assertIsNotNone(Book.objects.get(pk=self.book_id).due_at)
+
+        self.clock.advance(999)
+        self.assertEqual(self.manager.scheduler.tick(), ([], []))
+        self.clock.advance(11)
+        self.assertEqual(self.manager.scheduler.tick(), ([], [self.book_id]))
+        self.assertEqual(self.manager.scheduler.get_overdue_loans(), {self.book_id: self.alice.id})
+
+        self.manager.return_book(self.alice.id, self.book_id)
+        self.assertEqual(self.manager.scheduler.get_overdue_loans(), {})
+
+    def test_staff_see_overdue_loans(self):
+        gator_library.reload()
+        gator_library.borrow_book(self.alice.id, self.book_id)
+        gator_library.scheduler.tick(now=time.time() + 10 ** 8)
+        self.addCleanup(gator_library.reload)
+        staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.client.force_login(staff)
+        overdue = self.client.get('/stats/overdue/').json()['overdue']
+        self.assertEqual([(row['book_id'], row['patron']) for row in overdue], [(self.book_id, 'alice')])
+
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/stats/overdue/').status_code, 302)
+
+    def test_failed_hold_expiry_is_retried(self):
+        self.manager.borrow_book(self.alice.id, self.book_id)
+        self.manager.borrow_book(self.bob.id, self.book_id, 2)
+        self.manager.return_book(self.alice.id, self.book_id)
+        self.clock.advance(110)
+
+        def expire_hold(book_id):
+            raise DatabaseError("database is down")
+
+        self.manager.expire_hold = expire_hold
+        self.assertEqual(self.manager.scheduler.tick(), ([], []))
+        del self.manager.expire_hold
+        self.clock.advance(10)
+        self.assertEqual(self.manager.scheduler.tick(), ([self.book_id], []))
+
+    def test_background_thread_survives_a_failing_tick(self):
+        ticks = []
+
+        def tick():
+            ticks.append(len(ticks))
+            if len(ticks) == 1:
+                raise DatabaseError("database is down")
+
+        scheduler = self.manager.scheduler
+        scheduler.tick = tick
+        scheduler.start(interval=0.01)
+        try:
+            deadline = time.monotonic() + 5
+            while len(ticks) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(scheduler._thread.is_alive())
+        finally:
+            scheduler.stop()
+        self.assertGreaterEqual(len(ticks), 3)
+
+    def test_unclaimed_hold_expires_to_next_reservation(self):
+        self.manager.borrow_book(self.alice.id, self.book_id)
+        self.manager.borrow_book(self.bob.id, self.book_id, 3)
+        self.manager.borrow_book(self.carol.id, self.book_id, 1)
+        self.manager.return_book(self.alice.id, self.book_id)
+
+        book = Book.objects.get(pk=self.book_id)
+        self.assertEqual(book.borrowed_by_id, self.bob.id)
+        self.assertIsNotNone(book.hold_expires_at)
+        self.assertIsNone(book.due_at)
+
+        self.clock.advance(110)
+        self.assertEqual(self.manager.scheduler.tick(), ([self.book_id], []))
+        self.assertEqual(Book.objects.get(pk=self.book_id).borrowed_by_id, self.carol.id)
+
+        # Carol claims before her hold runs out, turning it into a loan
+        success, _ = self.manager.borrow_book(self.carol.id, self.book_id)
+        self.assertTrue(success)
+        book = Book.objects.get(pk=self.book_id)
+        self.assertIsNone(book.hold_expires_at)
+        self.assertIsNotNone(book.due_at)
+        self.clock.advance(110)
+        self.assertEqual(self.manager.scheduler.tick(), ([], []))
+
+    def test_last_hold_expiry_makes_book_available(self):
+        self.manager.borrow_book(self.alice.id, self.book_id)
+        self.manager.borrow_book(self.bob.id, self.book_id, 2)
+        self.manager.return_book(self.alice.id, self.book_id)
+
+        self.clock.advance(110)
+        self.manager.scheduler.tick()
+        book = Book.objects.get(pk=self.book_id)
+        self.assertEqual(book.availability_status, "Yes")
+        self.assertIsNone(book.borrowed_by)
+        self.assertIsNone(book.hold_expires_at)
+
+    def test_deadlines_reload_from_database(self):
+        self.manager.borrow_book(self.alice.id, self.book_id)
+        reloaded = GatorLibraryManager(clock=self.clock)
+        self.assertEqual(reloaded.rb_tree.find_node(self.book_id).borrowed_by, self.alice.id)
+
+        self.clock.advance(1010)
+        self.assertEqual(reloaded.scheduler.tick(), ([], [self.book_id]))
@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase
+from library.data_structures.min_heap import HEAP_SIZE
+from library.managers import gator_library
+from library.models import Book, Reservation
+
+
+class CoalescedSignalTests(TestCase):
+    def setUp(self):
+        gator_library.reload()
+        self.tree = gator_library.rb_tree
+
+    def test_changes_apply_once_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            book = Book.objects.create(title="Draft", author="Author")
+            for title in ("Second Draft", "Final Title"):
+                book.title = title
+                book.save()
+            self.assertIsNone(self.tree.find_node(book.book_id))
+
+        self.assertEqual(len(callbacks), 3)
+        node = self.tree.find_node(book.book_id)
+        self.assertEqual(node.title, "Final Title")
+
+    def test_bulk_edit_costs_two_queries_to_flush(self):
+        books = [Book.objects.create(title=f"Book {i}", author="Author") for i in range(10)]
+        with self.captureOnCommitCallbacks() as callbacks:
+            for book in books:
+                book.author = "Edited"
+                book.save()
+
+        # One SELECT of the committed rows plus one bulk pointer UPDATE
+        with self.assertNumQueries(2):
+            for callback in callbacks:
+                callback()
+        self.assertTrue(all(self.tree.find_node(book.book_id).author == "Edited" for book in books))
+
+    def test_rolled_back_transaction_never_touches_tree(self):
+        version = self.tree.version
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Book.objects.create(title="Ghost", author="Author")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.tree.version, version)
+        self.assertEqual([node.title for node in self.tree.iter_inorder()], [])
+
+    def test_rolled_back_savepoint_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = Book.objects.create(title="Kept", author="Author")
+            try:
+                with transaction.atomic():
+                    Book.objects.create(title="Dropped", author="Author")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual([node.title for node in self.tree.iter_inorder()], ["Kept"])
+        self.assertEqual(self.tree.find_node(kept.book_id).title, "Kept")
+
+    def test_delete_removes_node(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title="Doomed", author="Author")
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertIsNone(self.tree.find_node(book.book_id))
+
+    def test_reservations_fill_heap_and_overflow_is_deactivated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title="Popular", author="Author")
+        patrons = [User.objects.create_user(f"reader{i}") for i in range(HEAP_SIZE + 2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for patron in patrons:
+                Reservation.objects.create(book=book, patron=patron, priority=2)
+
+        self.assertEqual(self.tree.find_node(book.book_id).reservation_heap.get_size(), HEAP_SIZE)
+        self.assertEqual(Reservation.objects.filter(book=book, is_active=False).count(), 2)
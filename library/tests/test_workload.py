@@ -0,0 +1,79 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from library.managers import gator_library
+from library.models import Book
+from library.workload import OPERATIONS, ReplayDriver, WorkloadGenerator
+
+
+class WorkloadGeneratorTests(TestCase):
+    def test_same_seed_same_workload(self):
+        first = list(WorkloadGenerator(books=100, seed=7).generate(500))
+        second = list(WorkloadGenerator(books=100, seed=7).generate(500))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, list(WorkloadGenerator(books=100, seed=8).generate(500)))
+
+    def test_mix_covers_every_operation(self):
+        ops = Counter(op['op'] for op in WorkloadGenerator(books=100, seed=1).generate(5000))
+        self.assertEqual(set(ops), set(OPERATIONS))
+        self.assertGreater(ops['detail'], ops['delete'])
+
+    def test_book_popularity_is_skewed(self):
+        generator = WorkloadGenerator(books=1000, seed=3, mix={'detail': 1.0})
+        hits = Counter(op['book'] for op in generator.generate(20000))
+        top_ten = sum(count for _, count in hits.most_common(10))
+        # Uniform popularity would give the top 10 books about 1% of requests
+        self.assertGreater(top_ten / 20000, 0.25)
+
+    def test_returns_follow_loans(self):
+        generator = WorkloadGenerator(books=50, seed=5)
+        loans = {}
+        for op in generator.generate(2000):
+            if op['op'] == 'borrow':
+                loans[op['book']] = op['patron']
+            elif op['op'] == 'return':
+                self.assertEqual(loans.pop(op['book']), op['patron'])
+            elif op['op'] == 'delete':
+                loans.pop(op['book'], None)
+
+
+class ReplayDriverTests(TestCase):
+    def test_replay_reports_every_operation(self):
+        gator_library.reload()
+        patrons = [User.objects.create_user(f"patron{i}").id for i in range(5)]
+        book_id_map = {
+            i: gator_library.insert_book(f"Book {i}", "Author").book_id for i in range(1, 21)
+        }
+        ops = list(WorkloadGenerator(books=20, patrons=5, seed=11).generate(200))
+
+        result = ReplayDriver(patrons, book_id_map).run(ops)
+
+        self.assertEqual(result.total_ops() + result.skipped, len(ops))
+        # Every add and delete lands, failed borrows and returns re-render
+        # the page with a message and never error out
+        self.assertEqual(result.errors['add'] + result.errors['delete'], 0)
+        self.assertEqual(sum(result.errors.values()), sum(result.rerendered.values()))
+        for row in result.summary():
+            self.assertLessEqual(row['p50'], row['p99'])
+
+    def test_rerendered_form_counts_as_failure(self):
+        gator_library.reload()
+        patron = User.objects.create_user("patron").id
+        ops = [{'op': 'add', 'book': 1, 'title': "", 'author': "Author"}]
+
+        result = ReplayDriver([patron], {}).run(ops)
+
+        self.assertEqual(result.errors['add'], 1)
+        self.assertEqual(result.summary()[0]['rerendered'], 1)
+
+
+class LoadTestCommandTests(TestCase):
+    @override_settings(GATOR_LOADTEST_SCRATCH_DB=False)
+    def test_refuses_to_wipe_other_databases(self):
+        Book.objects.create(title="Keep Me", author="Author")
+        with self.assertRaises(CommandError):
+            call_command('loadtest', ops=10)
+        self.assertTrue(Book.objects.filter(title="Keep Me").exists())
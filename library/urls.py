@@ -1,11 +1,22 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.book_list, name='book_list'),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('book/<int:book_id>/events/', views.book_events, name='book_events'),
     path('book/add/', views.add_book, name='add_book'),
     path('book/<int:book_id>/delete/', views.delete_book, name='delete_book'),
     path('book/find-closest/', views.find_closest_book, name='find_closest_book'),
+    path('export/', views.export_catalog, name='export_catalog'),
     path('stats/color-flips/', views.color_flip_count, name='color_flip_count'),
+    path('stats/profile/', views.request_profile, name='request_profile'),
+    path('stats/memory/', views.memory_stats, name='memory_stats'),
+    path('stats/sync/', views.sync_stats, name='sync_stats'),
+    path('stats/overdue/', views.overdue_loans, name='overdue_loans'),
+    path('api/books/', api.book_list, name='api_book_list'),
+    path('api/books/popular/', api.popular_books, name='api_popular_books'),
+    path('api/books/<int:book_id>/', api.book_detail, name='api_book_detail'),
+    path('api/books/<int:book_id>/availability/', api.book_availability, name='api_book_availability'),
+    path('api/books/<int:book_id>/reservations/', api.book_reservations, name='api_book_reservations'),
 ]
\ No newline at end of file
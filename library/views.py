@@ -1,15 +1,112 @@
+import csv
+import json
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.contrib import messages
-from .models import Book
+from django.utils.functional import SimpleLazyObject
+from .models import Book, Reservation
 from .forms import BookForm, ReservationForm
+from .events import format_sse
 from .managers import gator_library
+from .profiling import PHASES, profile_stats
+
+def fragment_timeout():
+    """Lifetime of cached template fragments, 0 disables fragment caching"""
+    return getattr(settings, 'GATOR_FRAGMENT_CACHE_SECONDS', 600)
+
+def _node_version(tree, book_id):
+    """Cache key part that changes whenever the book's node is modified, None if it is not in the tree"""
+    node = tree.find_node(book_id)
+    if node is None:
+        return None, node
+    return f"{tree.epoch}-{node.version}", node
+
+def catalog_rows(books, tree):
+    """Annotate books with their tree version and reservation count as they are rendered.
+
+    Books missing from this worker's tree get their counts from one grouped query.
+    """
+    books = list(books)
+    nodes = [tree.find_node(book.book_id) for book in books]
+    missing = [book.book_id for book, node in zip(books, nodes) if node is None]
+    counts = {}
+    if missing:
+        counts = dict(
+            Reservation.objects
+            .filter(book_id__in=missing, is_active=True)
+            .values_list('book_id')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+    for book, node in zip(books, nodes):
+        if node is not None:
+            book.tree_version = f"{tree.epoch}-{node.version}"
+            book.reservation_count = node.reservation_heap.get_size()
+        else:
+            book.reservation_count = counts.get(book.book_id, 0)
+            book.tree_version = f"db-{book.reservation_count}"
+        yield book
 
 @login_required
 def book_list(request):
-    # Get books from database for display
-    books = Book.objects.all()
-    return render(request, 'library/book_list.html', {'books': books})
+    tree = gator_library.rb_tree
+    books = Book.objects.select_related('borrowed_by')
+    # Rows are only fetched when the page fragment is not cached
+    return render(request, 'library/book_list.html', {
+        'rows': partial(catalog_rows, books, tree),
+        # Every saved, deleted or fed-in book bumps the tree version
+        'catalog_version': f"{tree.epoch}-{tree.version}",
+        'fragment_timeout': fragment_timeout(),
+        'my_loans': Book.objects.filter(borrowed_by=request.user).values('book_id', 'title'),
+    })
+
+PRIORITY_LABELS = dict(Reservation._meta.get_field('priority').choices)
+
+def _reservation_queue(book):
+    """Reservation queue in allocation order, read from the tree's heap when possible"""
+    node = gator_library.rb_tree.find_node(book.book_id)
+    if node is not None:
+        entries = list(node.reservation_heap.iter_ordered())
+        patrons = User.objects.in_bulk([entry.patron_id for entry in entries])
+        return [
+            {
+                'position': position,
+                'patron_id': entry.patron_id,
+                'patron': patrons.get(entry.patron_id),
+                'priority_label': PRIORITY_LABELS.get(entry.priority_number, entry.priority_number),
+                'reservation_time': datetime.fromtimestamp(entry.time_of_reservation, tz=timezone.utc),
+            }
+            for position, entry in enumerate(entries, 1)
+        ]
+
+    # Book is not in this worker's tree, fall back to the database
+    reservations = (
+        book.reservations
+        .filter(is_active=True)
+        .select_related('patron')
+        .order_by('-priority', 'reservation_time')
+    )
+    return [
+        {
+            'position': position,
+            'patron_id': reservation.patron_id,
+            'patron': reservation.patron,
+            'priority_label': reservation.get_priority_display(),
+            'reservation_time': reservation.reservation_time,
+        }
+        for position, reservation in enumerate(reservations, 1)
+    ]
 
 @login_required
 def book_detail(request, book_id):
@@ -18,31 +115,123 @@ def book_detail(request, book_id):
     if request.method == 'POST':
         action = request.POST.get('action')
         
-        if action == 'borrow':
-            # Use RB tree for borrowing logic
+        if action in ('borrow', 'reserve'):
+            # Use RB tree for borrowing logic, unavailable books go to the reservation heap
+            try:
+                priority = int(request.POST.get('priority', 1))
+            except ValueError:
+                priority = 1
             success, message = gator_library.borrow_book(
                 request.user.id,
                 book_id,
-                request.POST.get('priority', 1)
+                priority
             )
             if success:
                 messages.success(request, message)
-            else:
-                messages.error(request, message)
+                return redirect('book_detail', book_id=book_id)
+            messages.error(request, message)
+            node = gator_library.rb_tree.find_node(book_id)
+            if node is not None and node.reservation_heap.position_of(request.user.id) is not None:
+                # Queued for the book, the request took effect
+                return redirect('book_detail', book_id=book_id)
                 
         elif action == 'return':
             # Use RB tree for return logic
             success, message = gator_library.return_book(request.user.id, book_id)
             if success:
                 messages.success(request, message)
-            else:
-                messages.error(request, message)
+                return redirect('book_detail', book_id=book_id)
+            messages.error(request, message)
     
+    tree_version, node = _node_version(gator_library.rb_tree, book.book_id)
+    if node is not None:
+        # The queue itself is only built when its fragment is not cached
+        reservations = SimpleLazyObject(partial(_reservation_queue, book))
+        queue_position = node.reservation_heap.position_of(request.user.id)
+        timeout = fragment_timeout()
+    else:
+        reservations = _reservation_queue(book)
+        queue_position = next(
+            (entry['position'] for entry in reservations if entry['patron_id'] == request.user.id),
+            None
+        )
+        timeout = 0
     return render(request, 'library/book_detail.html', {
         'book': book,
         'form': ReservationForm(),
+        'reservations': reservations,
+        'queue_position': queue_position,
+        'tree_version': tree_version,
+        'fragment_timeout': timeout,
     })
 
+def _event_for(patron_id, event):
+    """Personalise a book event for one patron, other patrons' ids are not sent"""
+    queue = event.get('queue', [])
+    data = {
+        'book_id': event['book_id'],
+        'availability_status': event.get('availability_status'),
+        'on_hold': event.get('on_hold'),
+        'borrowed_by_you': event.get('borrowed_by') == patron_id,
+        'position': queue.index(patron_id) + 1 if patron_id in queue else None,
+        'queue_length': len(queue),
+    }
+    if event['type'] == 'allocated':
+        data['allocated_to_you'] = event['patron_id'] == patron_id
+        data['hold_expires_at'] = event['hold_expires_at']
+    return data
+
+def _stream_state(book_id):
+    """A book's current state for book_events, None if it is not in the catalog.
+
+    Synchronous because finding a book in an evicted branch loads the
+    branch from the database, which must not run on the event loop.
+    """
+    node = gator_library.rb_tree.find_node(book_id)
+    if node is None:
+        return None
+    return dict(gator_library.book_state(node), type='state', book_id=book_id)
+
+async def book_events(request, book_id):
+    """Server-sent events for one book: allocation, availability, queue position and deletion.
+
+    Runs on the ASGI event loop, so an idle listener holds no thread, only
+    an event queue. The first event is the current state.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    if await sync_to_async(_stream_state)(book_id) is None:
+        raise Http404("Book not found")
+    heartbeat = getattr(settings, 'GATOR_EVENT_HEARTBEAT_SECONDS', 15)
+
+    async def stream():
+        # Subscribe before reading the state so no change falls in between
+        subscription = gator_library.events.subscribe(book_id)
+        try:
+            state = await sync_to_async(_stream_state)(book_id)
+            if state is None:
+                yield format_sse('deleted', {'book_id': book_id})
+                return
+            yield format_sse('state', _event_for(user.id, state))
+            while True:
+                event = await subscription.get(heartbeat)
+                if event is None:
+                    # Keeps proxies from closing the connection, and notices disconnects
+                    yield ": keep-alive\n\n"
+                    continue
+                if event['type'] == 'deleted':
+                    yield format_sse('deleted', {'book_id': book_id})
+                    return
+                yield format_sse(event['type'], _event_for(user.id, event))
+        finally:
+            gator_library.events.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def add_book(request):
     if request.method == 'POST':
@@ -51,7 +240,8 @@ def add_book(request):
             # Insert book using RB tree
             node = gator_library.insert_book(
                 form.cleaned_data['title'],
-                form.cleaned_data['author']
+                form.cleaned_data['author'],
+                form.cleaned_data['branch']
             )
             messages.success(request, f'Successfully added book')
             return redirect('book_detail', book_id=node.book_id)
@@ -79,16 +269,146 @@ def find_closest_book(request):
     if target_id:
         try:
             target_id = int(target_id)
-            # Find closest book using RB tree
-            closest_node = gator_library.find_closest_book(target_id)
+            # Every branch by default, or just the one asked for
+            branch = request.GET.get('branch', '').strip()
+            branches = [branch] if branch else None
+            # Find closest book using RB tree, optionally skipping borrowed ones
+            if request.GET.get('available'):
+                closest_node = gator_library.find_closest_available(target_id, branches)
+            else:
+                closest_node = gator_library.find_closest_book(target_id, branches)
             if closest_node:
                 return redirect('book_detail', book_id=closest_node.book_id)
-            messages.error(request, 'No books found in the library')
+            if request.GET.get('available'):
+                messages.error(request, 'No available books in the library')
+            else:
+                messages.error(request, 'No books found in the library')
         except ValueError:
             messages.error(request, 'Please enter a valid book ID')
     return redirect('book_list')
 
+EXPORT_FIELDS = ['book_id', 'title', 'author', 'availability_status', 'borrowed_by', 'on_hold', 'reservations']
+# Books read from the tree per lock acquisition while streaming the export
+EXPORT_CHUNK_SIZE = 500
+
+
+class Echo:
+    """Pseudo-buffer that hands csv.writer output straight back"""
+    def write(self, value):
+        return value
+
+
+def _export_row(node):
+    return {
+        'book_id': node.book_id,
+        'title': node.title,
+        'author': node.author,
+        'availability_status': node.availability_status,
+        'borrowed_by': node.borrowed_by,
+        'on_hold': node.on_hold,
+        'reservations': node.reservation_heap.get_size(),
+    }
+
+def _export_rows(min_id, max_id):
+    # The response is streamed after the view returns, so rows are copied
+    # out of the tree a chunk at a time under the tree lock
+    for chunk in gator_library.iter_book_chunks(min_id, max_id, EXPORT_CHUNK_SIZE, _export_row):
+        yield from chunk
+
+@login_required
+def export_catalog(request):
+    """Stream the catalog from the RB tree as JSONL or CSV"""
+    try:
+        min_id = int(request.GET['min_id']) if request.GET.get('min_id') else None
+        max_id = int(request.GET['max_id']) if request.GET.get('max_id') else None
+    except ValueError:
+        return HttpResponseBadRequest('min_id and max_id must be integers')
+
+    export_format = request.GET.get('format', 'jsonl')
+    rows = _export_rows(min_id, max_id)
+    if export_format == 'jsonl':
+        lines = (json.dumps(row) + '\n' for row in rows)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    elif export_format == 'csv':
+        writer = csv.writer(Echo())
+        lines = chain(
+            [writer.writerow(EXPORT_FIELDS)],
+            (writer.writerow([row[field] for field in EXPORT_FIELDS]) for row in rows)
+        )
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+    else:
+        return HttpResponseBadRequest('format must be jsonl or csv')
+
+    response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+    return response
+
 @login_required
 def color_flip_count(request):
     count = gator_library.get_color_flip_count()
-    return render(request, 'library/color_flip_count.html', {'count': count})
\ No newline at end of file
+    # Staff can trigger a full O(n) pass, everyone else sees the last result
+    if request.user.is_staff and request.GET.get('check') == 'full':
+        gator_library.check_invariants()
+    return render(request, 'library/color_flip_count.html', {
+        'count': count,
+        'availability': gator_library.availability_stats(),
+        'invariants': gator_library.rb_tree.last_invariant_check,
+        'invariant_violations': gator_library.rb_tree.invariant_violations,
+    })
+
+@staff_member_required
+def request_profile(request):
+    if request.method == 'POST':
+        profile_stats.reset()
+        return redirect('request_profile')
+    return render(request, 'library/request_profile.html', {
+        'phases': PHASES,
+        'rows': profile_stats.summary(),
+        'window': profile_stats.window,
+    })
+
+@staff_member_required
+def memory_stats(request):
+    usage = gator_library.memory_usage()
+    usage['node_cache'] = gator_library.node_cache_stats()
+    usage['branch_trees'] = gator_library.branch_stats()
+    # Resident memory of this worker, unique vs still shared with the master after fork
+    usage['process'] = gator_library.memory_footprint()
+    # Allocator view of the whole process, only available under `python -X tracemalloc`
+    if tracemalloc.is_tracing():
+        usage['traced_current'], usage['traced_peak'] = tracemalloc.get_traced_memory()
+    if request.GET.get('format') == 'json':
+        return JsonResponse(usage)
+    return render(request, 'library/memory_stats.html', {
+        'usage': usage,
+        'breakdown': [(key, usage[key]) for key in ('nodes', 'strings', 'heaps', 'reservations', 'sentinel')],
+        'bytes_per_book': usage['total'] / usage['books'] if usage['books'] else 0,
+        'occupancy': [(size, count) for size, count in enumerate(usage['heap_occupancy']) if count],
+    })
+
+@staff_member_required
+def overdue_loans(request):
+    """Loans the scheduler has flagged as overdue, most overdue first.
+
+    Flags are kept by the scheduler that ticks in this process, so with
+    run_scheduler in its own process the command's output lists them.
+    """
+    overdue = gator_library.scheduler.get_overdue_loans()
+    books = Book.objects.filter(book_id__in=overdue).select_related('borrowed_by').order_by('due_at')
+    return JsonResponse({'overdue': [
+        {
+            'book_id': book.book_id,
+            'title': book.title,
+            'patron_id': overdue[book.book_id],
+            'patron': book.borrowed_by.username if book.borrowed_by else None,
+            'due_at': book.due_at.isoformat() if book.due_at else None,
+        }
+        for book in books
+    ]})
+
+@staff_member_required
+def sync_stats(request):
+    """Change feed position and replication lag of this worker, and its write-behind queue"""
+    stats = gator_library.change_feed.stats()
+    if gator_library.write_behind is not None:
+        stats['write_behind'] = gator_library.write_behind.stats()
+    return JsonResponse(stats)
\ No newline at end of file
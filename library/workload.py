@@ -0,0 +1,283 @@
+import bisect
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+OPERATIONS = ('list', 'detail', 'borrow', 'reserve', 'return', 'add', 'delete', 'closest')
+
+# Default share of each operation, roughly what the kiosks and web UI produce
+DEFAULT_MIX = {
+    'list': 0.15,
+    'detail': 0.40,
+    'borrow': 0.12,
+    'reserve': 0.08,
+    'return': 0.12,
+    'add': 0.04,
+    'delete': 0.02,
+    'closest': 0.07,
+}
+PERCENTILES = (50, 95, 99)
+
+# Operations that redirect when they succeed and re-render the page with an
+# error message when they fail
+REDIRECTING = ('borrow', 'reserve', 'return', 'add', 'delete')
+
+
+class ZipfSampler:
+    """Sample ranks 0..n-1 with P(rank k) proportional to 1 / (k + 1) ** s"""
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.cdf = []
+        total = 0.0
+        for rank in range(1, n + 1):
+            total += 1.0 / rank ** s
+            self.cdf.append(total)
+        self.total = total
+
+    def sample(self, limit):
+        """Sample a rank below limit (limit must not exceed n)"""
+        while True:
+            rank = bisect.bisect_left(self.cdf, self.rng.random() * self.total)
+            if rank < limit:
+                return rank
+
+
+class WorkloadGenerator:
+    """Generate a reproducible operation mix against a simulated catalog.
+
+    Book popularity is Zipfian: the generator keeps live book ids in
+    popularity order and samples positions from a Zipf distribution. It
+    tracks loans and reservations loosely so returns and reservations
+    mostly target books in a sensible state.
+    """
+    def __init__(self, books=1000, patrons=100, seed=0, zipf_s=1.1, mix=None, max_books=None):
+        self.rng = random.Random(seed)
+        self.patrons = patrons
+        self.mix = mix or DEFAULT_MIX
+        self.ops = [op for op in OPERATIONS if self.mix.get(op)]
+        self.weights = [self.mix[op] for op in self.ops]
+
+        self.book_ids = list(range(1, books + 1))
+        self.rng.shuffle(self.book_ids)
+        self.next_book_id = books + 1
+        self.sampler = ZipfSampler(max_books or books * 2, zipf_s, self.rng)
+        self.loans = {}  # book_id -> patron
+
+    def _popular_book(self):
+        limit = min(len(self.book_ids), len(self.sampler.cdf))
+        return self.book_ids[self.sampler.sample(limit)]
+
+    def _patron(self):
+        return self.rng.randrange(self.patrons)
+
+    def next_op(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if not self.book_ids and op not in ('add', 'list'):
+            op = 'add'
+
+        if op == 'list':
+            return {'op': 'list'}
+        if op == 'detail':
+            return {'op': 'detail', 'book': self._popular_book()}
+        if op == 'closest':
+            return {'op': 'closest', 'target': self.rng.randrange(1, self.next_book_id + 1)}
+        if op == 'add':
+            book_id = self.next_book_id
+            self.next_book_id += 1
+            # New titles start in the long tail
+            self.book_ids.append(book_id)
+            return {'op': 'add', 'book': book_id, 'title': f"Book {book_id}", 'author': f"Author {book_id % 97}"}
+        if op == 'delete':
+            book_id = self.book_ids[-1 - self.rng.randrange(min(len(self.book_ids), 10))]
+            self.book_ids.remove(book_id)
+            self.loans.pop(book_id, None)
+            return {'op': 'delete', 'book': book_id}
+        if op == 'return' and self.loans:
+            book_id = self.rng.choice(list(self.loans))
+            return {'op': 'return', 'book': book_id, 'patron': self.loans.pop(book_id)}
+
+        book_id = self._popular_book()
+        patron = self._patron()
+        if op == 'reserve' or book_id in self.loans:
+            return {'op': 'reserve', 'book': book_id, 'patron': patron, 'priority': self.rng.choice((1, 2, 3))}
+        self.loans[book_id] = patron
+        return {'op': 'borrow', 'book': book_id, 'patron': patron}
+
+    def generate(self, count):
+        for _ in range(count):
+            yield self.next_op()
+
+
+def write_workload(ops, path):
+    with open(path, 'w') as f:
+        for op in ops:
+            f.write(json.dumps(op) + "\n")
+
+
+def read_workload(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ReplayResult:
+    """Latencies and outcomes per operation type"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # Failures answered with the page re-rendered instead of a redirect
+        self.rerendered = defaultdict(int)
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def record(self, op, latency, ok, status=None):
+        with self._lock:
+            self.latencies[op].append(latency)
+            if not ok:
+                self.errors[op] += 1
+                if status == 200 and op in REDIRECTING:
+                    self.rerendered[op] += 1
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def summary(self):
+        rows = []
+        for op in OPERATIONS:
+            latencies = sorted(self.latencies.get(op, ()))
+            if not latencies:
+                continue
+            row = {
+                'op': op,
+                'count': len(latencies),
+                'errors': self.errors[op],
+                'rerendered': self.rerendered[op],
+                'ops_per_sec': len(latencies) / self.elapsed if self.elapsed else 0.0,
+            }
+            for percentile in PERCENTILES:
+                idx = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+                row[f'p{percentile}'] = latencies[idx] * 1000
+            rows.append(row)
+        return rows
+
+    def total_ops(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+
+class ReplayDriver:
+    """Replay a workload against the Django app in-process.
+
+    Requests go through django.test.Client, so the whole stack (middleware,
+    views, signals, templates) runs without a network server. Workload book
+    ids are mapped to the ids the database actually assigns.
+    """
+    def __init__(self, patron_ids, book_id_map, clients=1):
+        self.patron_ids = patron_ids
+        self.book_id_map = dict(book_id_map)
+        self.clients = clients
+        self._map_lock = threading.Lock()
+
+    def _book(self, workload_id):
+        with self._map_lock:
+            return self.book_id_map.get(workload_id)
+
+    def _client_for(self, clients, patron):
+        from django.contrib.auth.models import User
+        from django.test import Client
+        client = clients.get(patron)
+        if client is None:
+            client = Client()
+            client.force_login(User.objects.get(pk=self.patron_ids[patron % len(self.patron_ids)]))
+            clients[patron] = client
+        return client
+
+    def _request(self, client, op):
+        """Issue the HTTP request for one operation, returns (response, ok) or None to skip.
+
+        Reads succeed on any status below 400. Writes only succeed on a 302
+        to the page they lead to; a form or page re-rendered with 200
+        carries an error message.
+        """
+        kind = op['op']
+        if kind == 'list':
+            response = client.get('/')
+        elif kind == 'closest':
+            response = client.get('/book/find-closest/', {'target_id': op['target']})
+        elif kind == 'add':
+            response = client.post('/book/add/', {'title': op['title'], 'author': op['author']})
+            match = re.fullmatch(r'/book/(\d+)/', response.get('Location', ''))
+            if response.status_code != 302 or not match:
+                return response, False
+            with self._map_lock:
+                self.book_id_map[op['book']] = int(match.group(1))
+            return response, True
+        else:
+            book_id = self._book(op['book'])
+            if book_id is None:
+                return None
+            if kind == 'detail':
+                response = client.get(f'/book/{book_id}/')
+            elif kind == 'delete':
+                response = client.post(f'/book/{book_id}/delete/')
+                return response, response.status_code == 302 and response.get('Location') == '/'
+            else:
+                if kind == 'return':
+                    response = client.post(f'/book/{book_id}/', {'action': 'return'})
+                else:
+                    response = client.post(f'/book/{book_id}/', {
+                        'action': 'borrow',
+                        'priority': op.get('priority', 1),
+                    })
+                return response, response.status_code == 302 and response.get('Location') == f'/book/{book_id}/'
+        return response, response.status_code < 400
+
+    def _run_ops(self, ops, result):
+        clients = {}
+        for op in ops:
+            client = self._client_for(clients, op.get('patron', 0))
+            start = time.perf_counter()
+            try:
+                outcome = self._request(client, op)
+            except Exception as e:
+                print(f"DEBUG: {op['op']} failed: {e}")
+                result.record(op['op'], time.perf_counter() - start, False)
+                continue
+            if outcome is None:
+                result.skip()
+                continue
+            response, ok = outcome
+            result.record(op['op'], time.perf_counter() - start, ok, response.status_code)
+
+    def _run_client(self, ops, result):
+        """Thread target, each thread gets and releases its own DB connection"""
+        from django.db import connections
+        try:
+            self._run_ops(ops, result)
+        finally:
+            connections.close_all()
+
+    def run(self, ops):
+        """Replay ops, sequentially or across `clients` threads"""
+        result = ReplayResult()
+        ops = list(ops)
+        start = time.perf_counter()
+        if self.clients <= 1:
+            self._run_ops(ops, result)
+        else:
+            # Deal operations round-robin so each client keeps its share of the mix
+            threads = [
+                threading.Thread(target=self._run_client, args=(ops[i::self.clients], result))
+                for i in range(self.clients)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        result.elapsed = time.perf_counter() - start
+        return result
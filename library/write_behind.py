@@ -0,0 +1,350 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import chain
+from operator import itemgetter
+
+from django.conf import settings
+
+# Book columns written by the flush, every queued row carries all of them
+ROW_FIELDS = ('availability_status', 'borrowed_by', 'due_at', 'hold_expires_at', 'updated_at')
+LATENCY_WINDOW = 1000
+# A row whose batch failed this many times is retried on its own, so one bad
+# row cannot keep the rest of its batch out of the database
+SPLIT_AFTER_FAILURES = 2
+BLOCK = 'block'
+CALLER_RUNS = 'caller_runs'
+
+
+class PendingWrite:
+    """Latest unflushed row state of one book plus its change log entries and loans"""
+    __slots__ = ('book_id', 'fields', 'version', 'log', 'loans', 'first_seq', 'failures')
+
+    def __init__(self, book_id, first_seq):
+        self.book_id = book_id
+        self.fields = None
+        self.version = None  # Node version the fields were read at
+        self.log = []  # (node version, log fields)
+        self.loans = []
+        self.first_seq = first_seq
+        self.failures = 0
+
+
+class WriteBehindQueue:
+    """Queue Book row writes and flush them from background threads.
+
+    The tree is updated synchronously by the caller; the row state is
+    queued and coalesced per book, so ten changes to one book between
+    flushes cost one row in one bulk_update. A book is never written by
+    two flushes at once, so rows always end in their latest state.
+
+    With workers=0 nothing is flushed in the background, only by flush()
+    and barrier() in the calling thread.
+
+    A failed batch is retried; rows that keep failing are split off and
+    retried one by one, and a row that fails max_attempts times is dropped
+    and recorded in stats() instead of blocking the queue.
+    """
+    def __init__(self, manager, workers=None, batch_size=None, max_pending=None, interval=None, policy=None,
+                 block_seconds=None, max_attempts=None):
+        self.manager = manager
+        self.workers = getattr(settings, 'GATOR_WRITE_BEHIND_WORKERS', 2) if workers is None else workers
+        self.batch_size = batch_size or getattr(settings, 'GATOR_WRITE_BEHIND_BATCH', 500)
+        self.max_pending = max_pending or getattr(settings, 'GATOR_WRITE_BEHIND_MAX_PENDING', 10000)
+        self.interval = getattr(settings, 'GATOR_WRITE_BEHIND_INTERVAL', 0.05) if interval is None else interval
+        self.policy = policy or getattr(settings, 'GATOR_WRITE_BEHIND_POLICY', BLOCK)
+        if self.policy not in (BLOCK, CALLER_RUNS):
+            raise ValueError(f"Write-behind policy must be {BLOCK!r} or {CALLER_RUNS!r}")
+        self.block_seconds = block_seconds or getattr(settings, 'GATOR_WRITE_BEHIND_BLOCK_SECONDS', 5)
+        self.max_attempts = max_attempts or getattr(settings, 'GATOR_WRITE_BEHIND_MAX_ATTEMPTS', 5)
+
+        self._cond = threading.Condition()
+        self.pending = OrderedDict()  # book_id -> PendingWrite, oldest first
+        self.in_flight = {}  # book_id -> PendingWrite being written
+        self._seq = 0
+        self._closing = False
+        self._threads = []
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        self.rows_dropped = 0
+        self.dropped = deque(maxlen=LATENCY_WINDOW)  # {'book_id', 'error', 'log'} of dropped rows
+        self.backpressure_waits = 0
+        self.caller_flushes = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"gator-write-behind-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self._threads:
+            atexit.register(self.close)
+
+    def put(self, book_id, fields, kind, loan=None, version=None, **log_fields):
+        """Queue a book's new row state (or None to leave the row alone), a change log entry and an optional LoanHistory row.
+
+        Callers put after releasing the tree lock, so puts for one book can
+        arrive out of order; version is the node's version when fields were
+        read, and an older state never replaces a newer one.
+        """
+        with self._cond:
+            if book_id not in self.pending and len(self.pending) >= self.max_pending:
+                self._apply_backpressure()
+            self._seq += 1
+            self.enqueued += 1
+            item = self.pending.get(book_id)
+            if item is None:
+                item = self.pending[book_id] = PendingWrite(book_id, self._seq)
+            else:
+                self.coalesced += 1
+            if fields is not None and (version is None or item.version is None or version >= item.version):
+                item.fields = fields
+                item.version = version
+            item.log.append((version or 0, dict(log_fields, kind=kind)))
+            if loan is not None:
+                item.loans.append(loan)
+            if len(self.pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _apply_backpressure(self):
+        """Called with the lock held when the queue is full"""
+        if self.policy == BLOCK and self._threads:
+            self.backpressure_waits += 1
+            deadline = time.monotonic() + self.block_seconds
+            self._cond.notify_all()
+            while len(self.pending) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if len(self.pending) < self.max_pending:
+                return
+        # Caller runs: the producer pays for a flush itself
+        self.caller_flushes += 1
+        batch = self._take_batch()
+        self._cond.release()
+        failed = not self._write_logged(batch)
+        self._cond.acquire()
+        self._finish(batch, failed)
+
+    def pending_books(self):
+        """Ids of the books with queued or in-flight writes"""
+        with self._cond:
+            return set(self.pending) | set(self.in_flight)
+
+    def discard(self, book_id):
+        """Stop writing the row of a book that is being deleted.
+
+        Its loans and change log entries are still written: the loans
+        happened, and other workers need the last entries to catch up.
+        """
+        with self._cond:
+            item = self.pending.get(book_id)
+            if item is not None:
+                item.fields = None
+            self._cond.notify_all()
+
+    def _take_batch(self):
+        """Oldest pending books not already being written, called with the lock held.
+
+        A book that has failed SPLIT_AFTER_FAILURES times is written in a
+        batch of its own.
+        """
+        batch = []
+        for book_id in list(self.pending):
+            if book_id in self.in_flight:
+                continue
+            suspect = self.pending[book_id].failures >= SPLIT_AFTER_FAILURES
+            if suspect and batch:
+                break
+            item = self.pending.pop(book_id)
+            self.in_flight[book_id] = item
+            batch.append(item)
+            if suspect or len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def _finish(self, batch, failed=False):
+        """Release a written batch, called with the lock held"""
+        for item in batch:
+            del self.in_flight[item.book_id]
+            if failed:
+                item.failures += 1
+                if item.failures >= self.max_attempts:
+                    self._drop(item)
+                    continue
+                # Put it back in front unless a newer state has been queued since
+                newer = self.pending.pop(item.book_id, None)
+                if newer is not None:
+                    if newer.fields is not None:
+                        item.fields, item.version = newer.fields, newer.version
+                    item.log.extend(newer.log)
+                    item.loans.extend(newer.loans)
+                self.pending[item.book_id] = item
+                self.pending.move_to_end(item.book_id, last=False)
+        self._cond.notify_all()
+
+    def _drop(self, item):
+        """Give up on a row that failed max_attempts times, called with the lock held"""
+        self.rows_dropped += 1
+        self.dropped.append({'book_id': item.book_id, 'error': self.last_error, 'log': [log for _, log in item.log]})
+        print(f"WARNING: Write-behind dropped book {item.book_id} after {item.failures} failed writes: {self.last_error}")
+
+    def _write(self, batch):
+        """One transaction with a bulk_update of the rows, the batch's loans and change log entries"""
+        from django.db import transaction
+        from .changefeed import feed_enabled
+        from .models import Book, ChangeLogEntry, LoanHistory
+        if not batch:
+            return
+        start = time.perf_counter()
+        rows = []
+        entries = []
+        loans = []
+        for item in batch:
+            if item.fields is not None:
+                rows.append(Book(book_id=item.book_id, **item.fields))
+            loans.extend(item.loans)
+            rereads = False
+            # Puts can arrive out of order, entries are logged in tree order
+            for _, log in sorted(item.log, key=itemgetter(0)):
+                if log['kind'] == ChangeLogEntry.BOOK and rereads:
+                    # One entry per flush is enough for other workers to re-read the row
+                    continue
+                rereads = rereads or log['kind'] in (ChangeLogEntry.BOOK, ChangeLogEntry.LOAN, ChangeLogEntry.RELEASE)
+                entries.append(ChangeLogEntry(object_id=item.book_id, origin=self.manager.origin, **log))
+        with transaction.atomic():
+            if rows:
+                Book.objects.bulk_update(rows, ROW_FIELDS)
+            if loans:
+                LoanHistory.objects.bulk_create(loans)
+            if entries and feed_enabled():
+                ChangeLogEntry.objects.bulk_create(entries)
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        self.rows_written += len(rows)
+        self.batches += 1
+        print(f"DEBUG: Write-behind flushed {len(rows)} rows, {len(loans)} loans and {len(entries)} log entries in {elapsed * 1000:.1f}ms")
+
+    def _write_logged(self, batch):
+        """Write a batch, recording rather than raising a failure; returns success"""
+        try:
+            self._write(batch)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = repr(e)
+            print(f"WARNING: Write-behind flush failed, will retry: {e}")
+            return False
+        return True
+
+    def _flush_batch(self):
+        """Take and write one batch, returns None when there was nothing to write, else success"""
+        with self._cond:
+            batch = self._take_batch()
+        if not batch:
+            return None
+        ok = self._write_logged(batch)
+        with self._cond:
+            self._finish(batch, failed=not ok)
+        return ok
+
+    def _backoff(self):
+        """Pause before retrying a failing database"""
+        time.sleep(min(1.0, self.interval * 10))
+
+    def _run(self):
+        from django.db import close_old_connections, connections
+        while True:
+            with self._cond:
+                # Give writes to the same books a moment to coalesce
+                if len(self.pending) < self.batch_size and not self._closing:
+                    self._cond.wait(self.interval)
+                if self._closing and not self.pending:
+                    connections.close_all()
+                    return
+            close_old_connections()
+            while True:
+                ok = self._flush_batch()
+                if ok is None:
+                    break
+                if not ok:
+                    self._backoff()
+                    break
+
+    def flush(self):
+        """Write everything queued so far from the calling thread.
+
+        Failing rows are retried until they are written or dropped after
+        max_attempts, so this always returns.
+        """
+        while True:
+            ok = self._flush_batch()
+            if ok is None:
+                return
+            if not ok:
+                self._backoff()
+
+    def barrier(self, timeout=None):
+        """Block until every write queued before the call is committed or dropped, False on timeout"""
+        with self._cond:
+            target = self._seq
+        if not self._threads:
+            self.flush()
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while any(item.first_seq <= target for item in chain(self.pending.values(), self.in_flight.values())):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Flush what is queued and stop the background threads"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.pending:
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            latencies = sorted(self.latencies)
+            depth = len(self.pending)
+            in_flight = len(self.in_flight)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+        return {
+            'depth': depth,
+            'in_flight': in_flight,
+            'max_pending': self.max_pending,
+            'policy': self.policy,
+            'workers': len(self._threads),
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'rows_written': self.rows_written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'rows_dropped': self.rows_dropped,
+            'dropped': [entry['book_id'] for entry in self.dropped],
+            'backpressure_waits': self.backpressure_waits,
+            'caller_flushes': self.caller_flushes,
+            'flush_ms_p50': percentile(50),
+            'flush_ms_p95': percentile(95),
+            'flush_ms_max': latencies[-1] * 1000 if latencies else 0.0,
+        }